@@ -0,0 +1,92 @@
+import hashlib
+import json
+
+from django.core.cache import caches
+
+from crime_analysis.processing.visualizations import CHARTS, chart_series, render_chart
+from .middleware import timed
+from .storage import DATASETS
+
+
+CHART_CACHE = "charts"
+
+PNG = "png"
+SERIES = "json"
+
+
+def chart_key(dataset_id: int, version: int, name: str, options: dict, fmt: str = PNG) -> str:
+    """
+    Cache key of a rendered chart. The processed-data version is part of
+    the key, so reprocessing a dataset invalidates all of its charts.
+    """
+    digest = hashlib.sha1(json.dumps(options, sort_keys=True).encode()).hexdigest()[:16]
+    return f"chart:{int(dataset_id)}:{version}:{name}:{fmt}:{digest}"
+
+
+def discard_charts(dataset_id: int, version: int):
+    """
+    Drop a dataset's cached charts and series of every version up to
+    ``version``. Only entries rendered with default options can be named;
+    dataset IDs are never reused, so any others are never requested again
+    and expire with the cache timeout.
+    """
+    caches[CHART_CACHE].delete_many([
+        chart_key(dataset_id, v, name, {}, fmt)
+        for v in range(1, version + 1)
+        for name in CHARTS
+        for fmt in (PNG, SERIES)
+    ])
+
+
+def _chart_input(dataset_id: int, name: str):
+    # The daily series only needs hourly counts, so it reads the rollup
+    # instead of loading every processed row
+    if name == "crime_timeseries":
+        hourly = DATASETS.load_hourly(dataset_id)
+        if hourly is not None:
+            return hourly
+    return DATASETS.load_processed(dataset_id)
+
+
+def _cached(dataset_id: int, name: str, fmt: str, build, options: dict):
+    if name not in CHARTS:
+        raise ValueError(f"Unknown chart: {name}")
+
+    cache = caches[CHART_CACHE]
+    version = DATASETS.version(dataset_id)
+    key = chart_key(dataset_id, version, name, options, fmt)
+    with timed("cache", "chart cache"):
+        value = cache.get(key)
+    if value is None:
+        with timed("load", "chart inputs"):
+            df = _chart_input(dataset_id, name)
+            results = DATASETS.load_results(dataset_id) if df is not None else None
+        if df is None:
+            return None
+        # Inputs saved by a job that finished while they were being read may
+        # be of a newer version; such a chart is served but not cached, since
+        # versioned chart URLs are cached as immutable
+        current = DATASETS.version(dataset_id) == version
+        with timed("render", f"{name} {fmt}"):
+            value = build(name, df, results, **options)
+        if value is None:
+            return None
+        if current:
+            cache.set(key, value)
+    return value
+
+
+def cached_chart(dataset_id: int, name: str, **options):
+    """
+    PNG bytes of a dataset's chart, rendered once per processed-data
+    version and options. None if the chart's inputs do not exist.
+    """
+    return _cached(dataset_id, name, PNG, render_chart, options)
+
+
+def cached_series(dataset_id: int, name: str, **options):
+    """
+    Data behind a dataset's chart (see chart_series), cached like
+    cached_chart().
+    """
+    return _cached(dataset_id, name, SERIES, chart_series, options)
@@ -0,0 +1,76 @@
+import io
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+
+DEFAULT_BATCH_ROWS = 65_536
+
+CONTENT_TYPES = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    Write-only file that keeps what was written until drain() hands it out.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_csv(batches, schema: pa.Schema):
+    """
+    CSV bytes, one chunk per record batch; the header goes with the first.
+    """
+    sink = _ChunkSink()
+    header = True
+    for batch in batches:
+        pa_csv.write_csv(
+            batch, sink, write_options=pa_csv.WriteOptions(include_header=header)
+        )
+        header = False
+        yield sink.drain()
+    if header:
+        # No rows: still send the header
+        pa_csv.write_csv(schema.empty_table(), sink)
+        yield sink.drain()
+
+
+def iter_parquet(batches, schema: pa.Schema):
+    """
+    Parquet bytes: one row group per record batch, each sent as soon as it
+    is written; the footer comes last.
+    """
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema, compression="snappy") as writer:
+        for batch in batches:
+            writer.write_batch(batch.cast(schema) if batch.schema != schema else batch)
+            yield sink.drain()
+    yield sink.drain()
+
+
+EXPORTERS = {
+    "csv": iter_csv,
+    "parquet": iter_parquet,
+}
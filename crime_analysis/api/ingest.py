@@ -0,0 +1,133 @@
+import os
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+# Explicit dtypes for the Chicago crime export. Declaring them up front keeps
+# every chunk on the same schema (no per-chunk inference) and lets pandas skip
+# the object -> numeric guessing pass. Unknown columns are read as strings.
+CHICAGO_DTYPES = {
+    'ID': np.int64,
+    'Case Number': str,
+    'Date': str,
+    'Block': str,
+    'IUCR': str,
+    'Primary Type': str,
+    'Description': str,
+    'Location Description': str,
+    'Arrest': bool,
+    'Domestic': bool,
+    'Beat': np.int64,
+    'District': np.float64,
+    'Ward': np.float64,
+    'Community Area': np.float64,
+    'FBI Code': str,
+    'X Coordinate': np.float64,
+    'Y Coordinate': np.float64,
+    'Year': np.int64,
+    'Updated On': str,
+    'Latitude': np.float64,
+    'Longitude': np.float64,
+    'Location': str,
+}
+
+_ARROW_TYPES = {
+    str: pa.string(),
+    bool: pa.bool_(),
+    np.int64: pa.int64(),
+    np.float64: pa.float64(),
+}
+
+DEFAULT_CHUNK_ROWS = 200_000
+
+
+def _csv_schema(columns) -> pa.Schema:
+    return pa.schema([
+        (name, _ARROW_TYPES[CHICAGO_DTYPES.get(name, str)]) for name in columns
+    ])
+
+
+def _ingest_csv(file, writer_path: str, chunk_rows: int) -> dict:
+    header = pd.read_csv(file, nrows=0).columns
+    file.seek(0)
+    schema = _csv_schema(header)
+
+    reader = pd.read_csv(
+        file,
+        dtype=defaultdict(lambda: str, CHICAGO_DTYPES),
+        chunksize=chunk_rows,
+        low_memory=False,
+    )
+
+    rows = row_groups = 0
+    with pq.ParquetWriter(writer_path, schema) as writer:
+        for chunk in reader:
+            table = pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+            writer.write_table(table)
+            rows += table.num_rows
+            row_groups += 1
+
+    return {"rows": rows, "row_groups": row_groups, "columns": list(header)}
+
+
+def _ingest_parquet(file, writer_path: str, chunk_rows: int) -> dict:
+    source = pq.ParquetFile(file)
+
+    rows = row_groups = 0
+    with pq.ParquetWriter(writer_path, source.schema_arrow) as writer:
+        for batch in source.iter_batches(batch_size=chunk_rows):
+            writer.write_batch(batch)
+            rows += batch.num_rows
+            row_groups += 1
+
+    return {"rows": rows, "row_groups": row_groups, "columns": source.schema_arrow.names}
+
+
+def ingest_upload(file, dest_path, chunk_rows: int = DEFAULT_CHUNK_ROWS) -> dict:
+    """
+    Stream an uploaded CSV/Parquet file into a Parquet file on disk.
+
+    The upload is read in chunks of at most ``chunk_rows`` rows and each chunk
+    is written out as its own row group, so peak memory depends on the chunk
+    size and not on the size of the file.
+
+    :param file: file-like object (Django UploadedFile) with a ``name``
+    :param dest_path: target Parquet path; written atomically
+    :param chunk_rows: rows per chunk / row group
+    :return: dict with ``rows``, ``row_groups`` and ``columns``
+    :raises ValueError: unsupported file format or unparsable values
+    """
+    filename = file.name.lower()
+    if filename.endswith(".csv"):
+        ingest = _ingest_csv
+    elif filename.endswith(".parquet"):
+        ingest = _ingest_parquet
+    else:
+        raise ValueError("Unsupported file format")
+
+    dest_path = os.fspath(dest_path)
+    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+    tmp_path = dest_path + ".part"
+
+    try:
+        stats = ingest(file, tmp_path, chunk_rows)
+    except (pa.ArrowException, TypeError):
+        _remove_quietly(tmp_path)
+        raise ValueError("Could not convert file to Parquet")
+    except BaseException:
+        _remove_quietly(tmp_path)
+        raise
+
+    os.replace(tmp_path, dest_path)
+    return stats
+
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,580 @@
+import gc
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+ANALYSIS_STAGES = [
+    "load",
+    "preprocess",
+    "lag_features",
+    "cyclic_features",
+    "compact",
+    "train",
+    "importance",
+    "save_db",
+    "store",
+]
+
+APPEND_STAGES = [
+    "load",
+    "features",
+    "compact",
+    "train",
+    "importance",
+    "save_db",
+    "store",
+]
+
+BACKTEST_STAGES = [
+    "load",
+    "backtest",
+    "store",
+]
+
+REPORT_STAGES = [
+    "load",
+    "charts",
+    "render",
+]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    dataset_id INTEGER NOT NULL,
+    params TEXT NOT NULL DEFAULT '{}',
+    status TEXT NOT NULL,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    stage TEXT,
+    progress REAL NOT NULL DEFAULT 0,
+    stages TEXT NOT NULL DEFAULT '[]',
+    error TEXT,
+    worker_pid INTEGER,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+)
+"""
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobQueue:
+    """
+    Job table in a local SQLite file, shared by web and worker processes.
+
+    Every state change is a single UPDATE guarded by the expected current
+    status, so a job is claimed by at most one worker and a cancelled job is
+    never started.
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = Path(db_path or settings.JOB_DB_PATH)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as con:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute(_SCHEMA)
+            columns = {row["name"] for row in con.execute("PRAGMA table_info(jobs)")}
+            if "worker_pid" not in columns:
+                con.execute("ALTER TABLE jobs ADD COLUMN worker_pid INTEGER")
+
+    @contextmanager
+    def _connect(self):
+        con = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        con.row_factory = sqlite3.Row
+        try:
+            yield con
+        finally:
+            con.close()
+
+    def create(self, kind: str, dataset_id: int, params: dict = None) -> int:
+        with self._connect() as con:
+            cur = con.execute(
+                "INSERT INTO jobs (kind, dataset_id, params, status, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (kind, dataset_id, json.dumps(params or {}), QUEUED, time.time()),
+            )
+            return cur.lastrowid
+
+    def get(self, job_id: int):
+        with self._connect() as con:
+            row = con.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job["stages"] = json.loads(job["stages"])
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        return job
+
+    def pending_ids(self) -> list:
+        with self._connect() as con:
+            rows = con.execute(
+                "SELECT id FROM jobs WHERE status = ? ORDER BY id", (QUEUED,)
+            ).fetchall()
+        return [row["id"] for row in rows]
+
+    def claim(self, job_id: int) -> bool:
+        """
+        Move a queued job to running in this process. False if it was
+        cancelled or taken.
+        """
+        with self._connect() as con:
+            cur = con.execute(
+                "UPDATE jobs SET status = ?, started_at = ?, worker_pid = ? WHERE id = ? AND status = ?",
+                (RUNNING, time.time(), os.getpid(), job_id, QUEUED),
+            )
+            return cur.rowcount == 1
+
+    def fail_orphaned(self) -> list:
+        """
+        Mark running jobs whose worker process no longer exists (killed, or
+        gone with a restarted server) as failed.
+
+        :return: IDs of the jobs marked failed
+        """
+        with self._connect() as con:
+            rows = con.execute(
+                "SELECT id, worker_pid FROM jobs WHERE status = ?", (RUNNING,)
+            ).fetchall()
+            orphaned = []
+            for row in rows:
+                if _process_exists(row["worker_pid"]):
+                    continue
+                cur = con.execute(
+                    "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ? AND status = ?",
+                    (FAILED, "Worker process exited before the job finished", time.time(),
+                     row["id"], RUNNING),
+                )
+                if cur.rowcount:
+                    orphaned.append(row["id"])
+        return orphaned
+
+    def cancel(self, job_id: int) -> bool:
+        """
+        Cancel a queued job, or ask a running one to stop at the next stage.
+        """
+        with self._connect() as con:
+            cur = con.execute(
+                "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status = ?",
+                (CANCELLED, time.time(), job_id, QUEUED),
+            )
+            if cur.rowcount:
+                return True
+            cur = con.execute(
+                "UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = ?",
+                (job_id, RUNNING),
+            )
+            return cur.rowcount == 1
+
+    def is_cancel_requested(self, job_id: int) -> bool:
+        with self._connect() as con:
+            row = con.execute(
+                "SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return bool(row and row["cancel_requested"])
+
+    def update_stages(self, job_id: int, stage: str, stages: list, progress: float):
+        with self._connect() as con:
+            con.execute(
+                "UPDATE jobs SET stage = ?, stages = ?, progress = ? WHERE id = ?",
+                (stage, json.dumps(stages), progress, job_id),
+            )
+
+    def finish(self, job_id: int, status: str, error: str = None):
+        with self._connect() as con:
+            con.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                (status, error, time.time(), job_id),
+            )
+
+
+def _process_exists(pid) -> bool:
+    if pid is None:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def profile_dir(job_id: int) -> Path:
+    """
+    Directory holding a profiled job's per-stage cProfile dumps.
+    """
+    return Path(settings.PROFILE_ROOT) / f"job-{job_id}"
+
+
+class StageTracker:
+    """
+    Records per-stage wall/CPU time and peak memory for a running job and
+    checks for cancellation before each stage starts. With ``profile`` each
+    stage is also run under cProfile and dumped to profile_dir().
+    """
+
+    def __init__(self, queue: JobQueue, job_id: int, stage_names: list, profile: bool = False):
+        self.queue = queue
+        self.job_id = job_id
+        self.profile = profile
+        self.restart(stage_names)
+
+    def restart(self, stage_names: list):
+        """
+        Start over with a new list of stages, e.g. when a job falls back to
+        another runner. Timings recorded so far are dropped.
+        """
+        self.stages = [
+            {"name": name, "status": "pending", "seconds": None}
+            for name in stage_names
+        ]
+
+    def entry(self, name: str) -> dict:
+        return next(s for s in self.stages if s["name"] == name)
+
+    @contextmanager
+    def stage(self, name: str):
+        from crime_analysis.processing.pipeline import measure
+
+        if self.queue.is_cancel_requested(self.job_id):
+            raise JobCancelled()
+
+        entry = self.entry(name)
+        entry["status"] = "running"
+        self._publish(name)
+
+        profile_path = None
+        if self.profile:
+            number = self.stages.index(entry) + 1
+            profile_path = str(profile_dir(self.job_id) / f"{number:02d}-{name}.pstats")
+        try:
+            with measure(entry, profile_path):
+                yield entry
+        except BaseException:
+            entry["status"] = "failed"
+            self._publish(name)
+            raise
+
+        entry["status"] = "done"
+        self._publish(name)
+
+    def _publish(self, current: str):
+        done = sum(1 for s in self.stages if s["status"] == "done")
+        self.queue.update_stages(
+            self.job_id, current, self.stages, round(done / len(self.stages), 3)
+        )
+
+
+# ---------------------------------------------------------------- worker side
+
+def _init_worker():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "crime_analysis.settings")
+    import django
+    django.setup()
+
+
+def _importances(models: dict, x_test, y_test) -> dict:
+    """
+    Impurity importances of both models, plus permutation importance of the
+    random forest when PERMUTATION_IMPORTANCE_SECONDS is set.
+    """
+    from crime_analysis.processing.importance import impurity_importances, permutation_importances
+
+    impurity = impurity_importances(models, x_test.columns)
+    results = {
+        # Series shown by the feature importances chart
+        "feature_importances": impurity["rf"],
+        "impurity_importances": impurity,
+    }
+    if settings.PERMUTATION_IMPORTANCE_SECONDS:
+        results["permutation_importances"] = permutation_importances(
+            models["rf"], x_test, y_test,
+            max_samples=settings.PERMUTATION_IMPORTANCE_SAMPLES,
+            time_budget=settings.PERMUTATION_IMPORTANCE_SECONDS,
+        )
+    return results
+
+
+def _compact(df, entry: dict):
+    """
+    Downcast ``df`` and record its size before and after on the stage.
+    """
+    from crime_analysis.processing.dtypes import compact_dtypes
+
+    before = int(df.memory_usage(index=True, deep=True).sum())
+    df = compact_dtypes(df)
+    entry["bytes_before"] = before
+    entry["bytes_after"] = int(df.memory_usage(index=True, deep=True).sum())
+    return df
+
+
+def _run_analysis(job: dict, tracker: StageTracker):
+    """
+    Full analysis: rebuild features from all raw parts and retrain.
+    """
+    from crime_analysis.api.storage import DATASETS
+    from crime_analysis.database.load import save_to_db
+    from crime_analysis.processing.feature_engineering import add_lag_features, add_cyclic_features
+    from crime_analysis.processing.incremental import feature_state
+    from crime_analysis.processing.ml_models import train_models
+    from crime_analysis.processing.model_registry import MODELS
+    from crime_analysis.processing.pipeline import run_pipeline
+    from crime_analysis.processing.preprocessing import preprocess_raw
+
+    dataset_id = job["dataset_id"]
+    captured = {}
+
+    def load(_):
+        df = DATASETS.load_raw(dataset_id)
+        if df is None:
+            raise ValueError("No raw dataframe found")
+        return df
+
+    def preprocess(df):
+        df = preprocess_raw(df)
+        captured["state"] = feature_state(df)
+        return df
+
+    # The raw frame is only ever referenced by the pipeline, so each stage
+    # can modify it in place and replaced frames are freed immediately
+    df, _ = run_pipeline([
+        ("load", load),
+        ("preprocess", preprocess),
+        ("lag_features", add_lag_features),
+        ("cyclic_features", add_cyclic_features),
+        ("compact", lambda df: _compact(df, tracker.entry("compact"))),
+    ], stage=tracker.stage)
+    state = captured["state"]
+
+    with tracker.stage("train") as entry:
+        entry["rows"] = len(df)
+        trained = train_models(
+            df, gb_model=settings.TRAIN_GB_MODEL, registry=MODELS, dataset_id=dataset_id
+        )
+        models = trained.pop("models")
+
+    with tracker.stage("importance") as entry:
+        entry["rows"] = len(trained["X_test"])
+        importances = _importances(models, trained["X_test"], trained["y_test"])
+
+    with tracker.stage("save_db") as entry:
+        entry["rows"] = len(df)
+        save_to_db(df, dataset_id=dataset_id, replace=True)
+
+    with tracker.stage("store"):
+        # Processed data last: bumping its version publishes the new results
+        # to cached readers (charts) as well
+        DATASETS.save_results(dataset_id, {**trained, **importances})
+        DATASETS.save_feature_state(dataset_id, state)
+        DATASETS.save_analytics(dataset_id, df)
+        DATASETS.save_processed(dataset_id, df)
+
+
+def _run_append(job: dict, tracker: StageTracker):
+    """
+    Incremental update: compute features for one appended raw part only,
+    append them to the stored processed frame and retrain. Falls back to a
+    full analysis when the part cannot be appended.
+    """
+    from crime_analysis.api.storage import DATASETS
+    from crime_analysis.database.load import save_to_db
+    from crime_analysis.processing.dtypes import concat_compact
+    from crime_analysis.processing.incremental import RebuildRequired, append_features, recode_primary_types
+    from crime_analysis.processing.ml_models import train_models
+    from crime_analysis.processing.model_registry import MODELS
+
+    dataset_id = job["dataset_id"]
+
+    with tracker.stage("load") as entry:
+        delta = DATASETS.load_raw(dataset_id, part=job["params"]["part"])
+        state = DATASETS.load_feature_state(dataset_id)
+        if delta is None:
+            raise ValueError("No raw dataframe found")
+        if state is None:
+            raise ValueError("Dataset has not been analysed yet; run a full analysis")
+        entry["rows"] = len(delta)
+
+    try:
+        with tracker.stage("features") as entry:
+            delta, state, types_changed = append_features(delta, state)
+            entry["rows"] = len(delta)
+    except RebuildRequired:
+        # Backdated rows or new columns: rebuild from all raw parts, which
+        # also drops rows that overlap earlier parts
+        del delta
+        tracker.restart(ANALYSIS_STAGES)
+        _run_analysis(job, tracker)
+        return
+
+    with tracker.stage("compact") as entry:
+        delta = _compact(delta, entry)
+        entry["rows"] = len(delta)
+
+    with tracker.stage("train") as entry:
+        # Recode after concatenating: the concatenated frame is new, so the
+        # cached history is left alone without copying it first
+        df = concat_compact([DATASETS.load_processed(dataset_id), delta])
+        if types_changed:
+            df = recode_primary_types(df, state.types)
+        entry["rows"] = len(df)
+        trained = train_models(
+            df, gb_model=settings.TRAIN_GB_MODEL, registry=MODELS, dataset_id=dataset_id
+        )
+        models = trained.pop("models")
+
+    with tracker.stage("importance") as entry:
+        entry["rows"] = len(trained["X_test"])
+        importances = _importances(models, trained["X_test"], trained["y_test"])
+
+    with tracker.stage("save_db") as entry:
+        entry["rows"] = len(delta)
+        save_to_db(delta, dataset_id=dataset_id)
+
+    with tracker.stage("store"):
+        DATASETS.save_results(dataset_id, {**trained, **importances})
+        DATASETS.save_feature_state(dataset_id, state)
+        if types_changed:
+            # Codes of stored rows shifted; rewrite them once
+            DATASETS.save_analytics(dataset_id, df)
+            DATASETS.save_processed(dataset_id, df)
+        else:
+            DATASETS.save_analytics(dataset_id, delta, append=True)
+            DATASETS.append_processed(dataset_id, delta)
+
+
+def _run_backtest(job: dict, tracker: StageTracker):
+    """
+    Walk-forward backtest of both models on the processed dataset.
+    """
+    from crime_analysis.api.storage import DATASETS
+    from crime_analysis.processing.backtest import walk_forward_backtest
+
+    dataset_id = job["dataset_id"]
+    params = job["params"]
+
+    with tracker.stage("load") as entry:
+        df = DATASETS.load_processed(dataset_id)
+        version = DATASETS.version(dataset_id)
+        if df is None:
+            raise ValueError("Dataset has not been analysed yet; run a full analysis")
+        entry["rows"] = len(df)
+
+    with tracker.stage("backtest") as entry:
+        entry["rows"] = len(df)
+        folds = walk_forward_backtest(
+            df, n_folds=params["n_folds"], mode=params["mode"],
+            gb_model=settings.TRAIN_GB_MODEL, n_jobs=settings.BACKTEST_WORKERS,
+        )
+
+    with tracker.stage("store"):
+        DATASETS.save_backtest(dataset_id, {
+            "version": version,
+            "params": params,
+            "folds": folds,
+        })
+
+
+def _run_report(job: dict, tracker: StageTracker):
+    """
+    PDF report of one or more datasets, written to the report cache.
+    """
+    from crime_analysis.reports.generate import build_report
+
+    build_report(job["params"]["dataset_ids"], stage=tracker.stage)
+
+
+JOB_KINDS = {
+    "analysis": (_run_analysis, ANALYSIS_STAGES),
+    "append": (_run_append, APPEND_STAGES),
+    "backtest": (_run_backtest, BACKTEST_STAGES),
+    "report": (_run_report, REPORT_STAGES),
+}
+
+
+def run_job(job_id: int):
+    """
+    Worker entry point: claim the job and run it stage by stage.
+    """
+    queue = JobQueue()
+    if not queue.claim(job_id):
+        return
+
+    job = queue.get(job_id)
+    runner, stages = JOB_KINDS[job["kind"]]
+    tracker = StageTracker(queue, job_id, stages, profile=job["params"].get("profile", False))
+    try:
+        runner(job, tracker)
+    except JobCancelled:
+        queue.finish(job_id, CANCELLED)
+    except Exception as exc:
+        queue.finish(job_id, FAILED, error=f"{type(exc).__name__}: {exc}")
+    else:
+        queue.finish(job_id, DONE)
+    finally:
+        # Frames were locals of the runner; release them before the worker
+        # process is recycled
+        gc.collect()
+
+
+# ---------------------------------------------------------------- web side
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """
+    Lazily start the process pool. Each worker process handles one job and
+    is then replaced, so memory held by a failed or cancelled run is
+    returned to the OS.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.ANALYSIS_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                max_tasks_per_child=1,
+            )
+            # Pick up jobs queued before a restart; claim() keeps this safe
+            # when several web processes resubmit the same job. Jobs that
+            # were running in a worker that is gone will never finish.
+            queue = JobQueue()
+            queue.fail_orphaned()
+            for job_id in queue.pending_ids():
+                _executor.submit(run_job, job_id)
+        return _executor
+
+
+def submit_job(kind: str, dataset_id: int, params: dict = None) -> int:
+    """
+    Queue a job for a dataset and return its ID right away.
+    """
+    if kind not in JOB_KINDS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    executor = get_executor()
+    job_id = JobQueue().create(kind, dataset_id, params)
+    executor.submit(run_job, job_id)
+    return job_id
@@ -0,0 +1,84 @@
+"""
+Server-Timing for API responses.
+
+ServerTimingMiddleware collects the spans recorded with timed() while a
+request is handled and reports them, plus the request's total wall and CPU
+time, in a ``Server-Timing`` header that browser dev tools display next to
+the network timings.
+"""
+import contextvars
+import re
+import time
+from contextlib import contextmanager
+
+
+_spans = contextvars.ContextVar("server_timing_spans", default=None)
+
+# Metric names are HTTP tokens
+_NOT_TOKEN = re.compile(r"[^A-Za-z0-9!#$%&'*+.^_`|~-]")
+
+# Descriptions are quoted strings: no control characters (CR/LF would
+# split the header), and " and \ escaped
+_CONTROL = re.compile(r"[\x00-\x1f\x7f]")
+_QUOTED_SPECIAL = re.compile(r'(["\\])')
+
+
+def add_timing(name: str, seconds: float, description: str = None):
+    """
+    Report a span of the current request. Ignored outside a request (e.g.
+    in background jobs).
+    """
+    spans = _spans.get()
+    if spans is not None:
+        spans.append((name, seconds, description))
+
+
+@contextmanager
+def timed(name: str, description: str = None):
+    """
+    Time the enclosed block as a Server-Timing span of the current request.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_timing(name, time.perf_counter() - started, description)
+
+
+def server_timing(spans) -> str:
+    """
+    Header value of (name, seconds, description) spans.
+    """
+    metrics = []
+    for name, seconds, description in spans:
+        metric = f"{_NOT_TOKEN.sub('-', name)};dur={seconds * 1000:.1f}"
+        if description:
+            description = _QUOTED_SPECIAL.sub(r"\\\1", _CONTROL.sub("", str(description)))
+            metric += f';desc="{description}"'
+        metrics.append(metric)
+    return ", ".join(metrics)
+
+
+class ServerTimingMiddleware:
+    """
+    Add a Server-Timing header to every response. For streamed responses
+    the timings cover the work done before the first byte.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        spans = []
+        token = _spans.set(spans)
+        started, cpu_started = time.perf_counter(), time.thread_time()
+        try:
+            response = self.get_response(request)
+        finally:
+            _spans.reset(token)
+        spans.append(("cpu", time.thread_time() - cpu_started, None))
+        spans.append(("total", time.perf_counter() - started, None))
+        existing = response.get("Server-Timing")
+        header = server_timing(spans)
+        response["Server-Timing"] = f"{existing}, {header}" if existing else header
+        return response
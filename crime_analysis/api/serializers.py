@@ -1,3 +1,4 @@
+from django.conf import settings
 from rest_framework import serializers
 
 class UploadDatasetSerializer(serializers.Serializer):
@@ -5,9 +6,36 @@ class UploadDatasetSerializer(serializers.Serializer):
 
 class StartAnalysisSerializer(serializers.Serializer):
     dataset_id = serializers.IntegerField()  # optional, if you store datasets
+    # Dump a cProfile of every stage (see JobProfileAPIView)
+    profile = serializers.BooleanField(default=False)
 
 class GetDetectionsSerializer(serializers.Serializer):
     dataset_id = serializers.IntegerField()
 
 class GetMetricsSerializer(serializers.Serializer):
     dataset_id = serializers.IntegerField()
+
+class AggregatesSerializer(serializers.Serializer):
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+    types = serializers.ListField(child=serializers.CharField(), required=False)
+    freq = serializers.ChoiceField(choices=["day", "hour"], default="day")
+
+class BacktestSerializer(serializers.Serializer):
+    n_folds = serializers.IntegerField(min_value=1, max_value=50, default=5)
+    mode = serializers.ChoiceField(choices=["expanding", "sliding"], default="expanding")
+
+class RecordsSerializer(serializers.Serializer):
+    dataset = serializers.IntegerField(required=False, min_value=0)
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+    types = serializers.ListField(child=serializers.CharField(), required=False)
+    violent = serializers.BooleanField(required=False, allow_null=True, default=None)
+    cursor = serializers.CharField(required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=10000, default=1000)
+    output = serializers.ChoiceField(choices=["json", "ndjson", "csv"], default="json")
+
+class ReportSerializer(serializers.Serializer):
+    dataset_ids = serializers.ListField(
+        child=serializers.IntegerField(), min_length=1, max_length=settings.REPORT_MAX_DATASETS
+    )
@@ -1 +1,520 @@
-DATASETS = {}
\ No newline at end of file
+import fcntl
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from django.conf import settings
+
+from crime_analysis.database.load import save_to_duckdb
+from crime_analysis.database.queries import HOURLY_TABLE, POOL, TABLE_NAME as ANALYTICS_TABLE, hourly_rollup
+from crime_analysis.processing.model_registry import MODELS
+
+
+RAW_DIR = "raw"
+PROCESSED_DIR = "processed"
+RESULTS_FILE = "results.joblib"
+FEATURE_STATE_FILE = "feature_state.joblib"
+BACKTEST_FILE = "backtest.joblib"
+ANALYTICS_FILE = "analytics.duckdb"
+META_FILE = "meta.json"
+LOCK_FILE = ".lock"
+NEXT_ID_FILE = "next_id"
+
+
+def _nbytes(obj) -> int:
+    """
+    Approximate in-memory size of a cached object.
+    """
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=True, deep=True).sum())
+    if isinstance(obj, pd.Series):
+        return int(obj.memory_usage(index=True, deep=True))
+    if isinstance(obj, np.ndarray):
+        return int(obj.nbytes)
+    if isinstance(obj, dict):
+        return sum(_nbytes(v) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(_nbytes(v) for v in obj)
+    return 64
+
+
+class _LRUCache:
+    """
+    Thread-safe LRU bounded by the total size of its values in bytes.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._items:
+                return None
+            self._items.move_to_end(key)
+            return self._items[key][0]
+
+    def put(self, key, value):
+        size = _nbytes(value)
+        with self._lock:
+            self._pop(key)
+            if size > self.max_bytes:
+                return
+            self._items[key] = (value, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                oldest = next(iter(self._items))
+                self._pop(oldest)
+
+    def usage(self) -> dict:
+        """
+        Bytes held in total and per cached (dataset_id, kind, version) entry.
+        """
+        with self._lock:
+            entries = [
+                {"dataset_id": key[0], "kind": key[1], "version": key[2], "bytes": size}
+                for key, (_, size) in self._items.items()
+            ]
+        return {"bytes": sum(e["bytes"] for e in entries), "max_bytes": self.max_bytes, "entries": entries}
+
+    def discard_dataset(self, dataset_id: int, kind: str = None, keep=None):
+        """
+        Drop the entries of a dataset, or only those of ``kind``, except
+        the ``keep`` key.
+        """
+        with self._lock:
+            for key in [
+                k for k in self._items
+                if k[0] == dataset_id and kind in (None, k[1]) and k != keep
+            ]:
+                self._pop(key)
+
+    def _pop(self, key):
+        item = self._items.pop(key, None)
+        if item is not None:
+            self.total_bytes -= item[1]
+
+
+class DatasetStore:
+    """
+    Disk-backed store for uploaded datasets.
+
+    Each dataset lives in its own directory under ``DATASET_ROOT``::
+
+        <id>/raw/part-00000.parquet         raw upload, one part per append
+        <id>/processed/part-00000.arrow     processed frame (Arrow IPC,
+                                            memory-mapped on read)
+        <id>/results.joblib                 analysis results
+        <id>/feature_state.joblib           tail state for incremental features
+        <id>/backtest.joblib                walk-forward backtest results
+        <id>/analytics.duckdb               processed rows and hourly rollup for SQL aggregates
+        <id>/meta.json                      processed-data version
+        next_id                             next dataset ID to hand out
+
+    IDs come from the ``next_id`` counter, advanced under a lock on the
+    root, so several worker processes can share one root and the ID of a
+    deleted dataset is never handed out again (charts, reports, models and
+    database rows are keyed on it). Recently used frames and
+    results are kept in a per-process LRU bounded by ``DATASET_CACHE_BYTES``,
+    keyed on the processed-data version so that saves made by other
+    processes are picked up.
+    """
+
+    def __init__(self, root=None, cache_bytes: int = None):
+        self._root = Path(root) if root is not None else None
+        self._cache_bytes = cache_bytes
+        self._cache = None
+
+    @property
+    def root(self) -> Path:
+        if self._root is None:
+            self._root = Path(settings.DATASET_ROOT)
+        return self._root
+
+    @property
+    def cache(self) -> _LRUCache:
+        if self._cache is None:
+            max_bytes = self._cache_bytes
+            if max_bytes is None:
+                max_bytes = settings.DATASET_CACHE_BYTES
+            self._cache = _LRUCache(max_bytes)
+        return self._cache
+
+    # ---------------------------------------------------------------- ids
+
+    def create(self) -> int:
+        """
+        Reserve a new dataset ID and create its directory. IDs are never
+        reused.
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        counter = self.root / NEXT_ID_FILE
+        with self._flock(self.root / LOCK_FILE):
+            try:
+                dataset_id = int(counter.read_text())
+            except FileNotFoundError:
+                # Roots created before the counter existed
+                dataset_id = max(self.ids(), default=0) + 1
+            while self.path(dataset_id).exists():
+                dataset_id += 1
+            os.mkdir(self.path(dataset_id))
+            tmp_path = counter.with_suffix(".part")
+            tmp_path.write_text(str(dataset_id + 1))
+            os.replace(tmp_path, counter)
+        return dataset_id
+
+    def ids(self) -> list:
+        if not self.root.is_dir():
+            return []
+        return sorted(int(p.name) for p in self.root.iterdir() if p.name.isdigit())
+
+    def path(self, dataset_id: int) -> Path:
+        return self.root / str(int(dataset_id))
+
+    def __contains__(self, dataset_id) -> bool:
+        try:
+            return self.path(dataset_id).is_dir()
+        except (TypeError, ValueError):
+            return False
+
+    def __len__(self) -> int:
+        return len(self.ids())
+
+    def delete(self, dataset_id: int):
+        """
+        Delete a dataset and everything derived from it: its fitted models,
+        cached charts, reports and database rows.
+        """
+        from crime_analysis.api.charts import discard_charts
+        from crime_analysis.database.load import delete_dataset_rows
+        from crime_analysis.reports.generate import delete_reports
+
+        version = self.version(dataset_id)
+        shutil.rmtree(self.path(dataset_id), ignore_errors=True)
+        self.cache.discard_dataset(dataset_id)
+        MODELS.delete_dataset(dataset_id)
+        discard_charts(dataset_id, version)
+        delete_reports(dataset_id)
+        delete_dataset_rows(dataset_id)
+
+    # ---------------------------------------------------------------- raw
+
+    def raw_path(self, dataset_id: int, part: int = 0) -> Path:
+        return self.path(dataset_id) / RAW_DIR / f"part-{part:05d}.parquet"
+
+    def raw_parts(self, dataset_id: int) -> list:
+        return sorted((self.path(dataset_id) / RAW_DIR).glob("part-*.parquet"))
+
+    def reserve_raw_part(self, dataset_id: int) -> int:
+        """
+        Reserve the next raw part number for an append.
+
+        A placeholder ``.part`` file is created under the dataset lock;
+        ingest_upload() writes to exactly that name and renames it when done.
+        """
+        raw_dir = self.path(dataset_id) / RAW_DIR
+        raw_dir.mkdir(exist_ok=True)
+        with self._locked(dataset_id):
+            taken = [int(p.name[5:10]) for p in raw_dir.glob("part-*")]
+            part = max(taken, default=-1) + 1
+            self.raw_path(dataset_id, part).with_suffix(".parquet.part").touch()
+        return part
+
+    def discard_raw_part(self, dataset_id: int, part: int):
+        """
+        Remove a reserved raw part (placeholder or written file) whose
+        upload failed.
+        """
+        path = self.raw_path(dataset_id, part)
+        with self._locked(dataset_id):
+            path.with_suffix(".parquet.part").unlink(missing_ok=True)
+            path.unlink(missing_ok=True)
+
+    def load_raw(self, dataset_id: int, part: int = None):
+        """
+        Read the raw upload (all parts, or just ``part``), memory-mapping
+        the Parquet files. Returns None if nothing has been uploaded yet.
+        """
+        if part is None:
+            paths = self.raw_parts(dataset_id)
+        else:
+            paths = [p for p in [self.raw_path(dataset_id, part)] if p.exists()]
+        if not paths:
+            return None
+        tables = [pq.read_table(path, memory_map=True) for path in paths]
+        # One block per column, so preprocessing can drop and replace
+        # columns without copying the others
+        return pa.concat_tables(tables, promote_options="permissive").to_pandas(split_blocks=True)
+
+    # ---------------------------------------------------------------- processed
+
+    def processed_parts(self, dataset_id: int) -> list:
+        return sorted((self.path(dataset_id) / PROCESSED_DIR).glob("part-*.arrow"))
+
+    def save_processed(self, dataset_id: int, df: pd.DataFrame) -> int:
+        """
+        Replace the processed frame and bump its version.
+        """
+        processed_dir = self.path(dataset_id) / PROCESSED_DIR
+        processed_dir.mkdir(exist_ok=True)
+        with self._locked(dataset_id):
+            self._write_arrow(df, processed_dir / "part-00000.arrow")
+            for path in self.processed_parts(dataset_id)[1:]:
+                path.unlink()
+
+        self.cache.discard_dataset(dataset_id, "processed")
+        return self._bump_version(dataset_id)
+
+    def append_processed(self, dataset_id: int, df: pd.DataFrame) -> int:
+        """
+        Append rows to the processed frame as a new part and bump its version.
+        Existing parts are not rewritten.
+        """
+        processed_dir = self.path(dataset_id) / PROCESSED_DIR
+        processed_dir.mkdir(exist_ok=True)
+        with self._locked(dataset_id):
+            part = len(self.processed_parts(dataset_id))
+            self._write_arrow(df, processed_dir / f"part-{part:05d}.arrow")
+
+        self.cache.discard_dataset(dataset_id, "processed")
+        return self._bump_version(dataset_id)
+
+    def load_processed(self, dataset_id: int):
+        """
+        Return the processed frame, or None if analysis has not run yet.
+        """
+        key = (dataset_id, "processed", self.version(dataset_id))
+        df = self.cache.get(key)
+        if df is not None:
+            return df
+
+        paths = self.processed_parts(dataset_id)
+        if not paths:
+            return None
+        tables = []
+        for path in paths:
+            with pa.memory_map(str(path), "r") as source:
+                tables.append(pa.ipc.open_file(source).read_all())
+        df = pa.concat_tables(tables, promote_options="permissive").to_pandas()
+
+        self._cache_current(key, df)
+        return df
+
+    def processed_schema(self, dataset_id: int):
+        """
+        Arrow schema of the processed frame, or None before analysis.
+        """
+        paths = self.processed_parts(dataset_id)
+        if not paths:
+            return None
+        with pa.memory_map(str(paths[0]), "r") as source:
+            return pa.ipc.open_file(source).schema
+
+    def processed_batches(self, dataset_id: int, max_rows: int):
+        """
+        Yield the processed frame as record batches of at most ``max_rows``
+        rows, read straight from the memory-mapped parts (zero-copy slices,
+        nothing converted to pandas).
+        """
+        for path in self.processed_parts(dataset_id):
+            with pa.memory_map(str(path), "r") as source:
+                reader = pa.ipc.open_file(source)
+                for i in range(reader.num_record_batches):
+                    batch = reader.get_batch(i)
+                    for offset in range(0, batch.num_rows, max_rows):
+                        yield batch.slice(offset, max_rows)
+
+    @staticmethod
+    def _write_arrow(df: pd.DataFrame, path: Path):
+        table = pa.Table.from_pandas(df, preserve_index=True)
+        # pandas sizes category codes by the number of categories; fix the
+        # index width so parts written separately share one schema
+        schema = pa.schema(
+            [
+                field.with_type(pa.dictionary(pa.int32(), field.type.value_type))
+                if pa.types.is_dictionary(field.type) else field
+                for field in table.schema
+            ],
+            metadata=table.schema.metadata,
+        )
+        table = table.cast(schema)
+        tmp_path = path.with_suffix(".arrow.part")
+        with pa.OSFile(str(tmp_path), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+
+    # ---------------------------------------------------------------- analytics
+
+    def analytics_path(self, dataset_id: int) -> Path:
+        return self.path(dataset_id) / ANALYTICS_FILE
+
+    def save_analytics(self, dataset_id: int, df: pd.DataFrame, append: bool = False):
+        """
+        Write processed rows to the dataset's DuckDB file (replacing its
+        contents, or appending to them).
+
+        Appends go to the live file in one DuckDB transaction, so their cost
+        follows the new rows. They wait for readers in other processes to
+        release the file, which pooled connections do once idle (see
+        queries.IDLE_SECONDS). A replacement is built next to the old file
+        and renamed into place, so it never waits for readers.
+        """
+        path = self.analytics_path(dataset_id)
+        with self._locked(dataset_id):
+            if append and path.exists():
+                POOL.close(path)
+                save_to_duckdb(
+                    df, str(path), table_name=ANALYTICS_TABLE,
+                    if_exists="append", rollup_table=HOURLY_TABLE,
+                )
+                return
+
+            tmp_path = path.with_suffix(".duckdb.part")
+            tmp_path.unlink(missing_ok=True)
+            save_to_duckdb(
+                df, str(tmp_path), table_name=ANALYTICS_TABLE,
+                if_exists="replace", rollup_table=HOURLY_TABLE,
+            )
+            os.replace(tmp_path, path)
+
+    def load_hourly(self, dataset_id: int):
+        """
+        Crimes and violent crimes per hour from the analytics rollup, or
+        None if analysis has not run yet.
+        """
+        path = self.analytics_path(dataset_id)
+        if not path.exists():
+            return None
+        return hourly_rollup(path)
+
+    # ---------------------------------------------------------------- results
+
+    def save_results(self, dataset_id: int, results: dict):
+        path = self.path(dataset_id) / RESULTS_FILE
+        tmp_path = path.with_suffix(".joblib.part")
+        joblib.dump(results, tmp_path)
+        os.replace(tmp_path, path)
+        self.cache.discard_dataset(dataset_id, "results")
+
+    def load_results(self, dataset_id: int):
+        """
+        Return the stored analysis results, or None if there are none.
+        """
+        key = (dataset_id, "results", self.version(dataset_id))
+        results = self.cache.get(key)
+        if results is not None:
+            return results
+
+        path = self.path(dataset_id) / RESULTS_FILE
+        if not path.exists():
+            return None
+        results = joblib.load(path, mmap_mode="r")
+
+        self._cache_current(key, results)
+        return results
+
+    def _cache_current(self, key, value):
+        # Keyed on the version read before loading: a job that saves and
+        # bumps meanwhile leaves newer data under the old key, which is
+        # never asked for again. Entries of older versions are dropped.
+        dataset_id, kind, _ = key
+        self.cache.discard_dataset(dataset_id, kind, keep=key)
+        self.cache.put(key, value)
+
+    def save_feature_state(self, dataset_id: int, state):
+        path = self.path(dataset_id) / FEATURE_STATE_FILE
+        tmp_path = path.with_suffix(".joblib.part")
+        joblib.dump(state, tmp_path)
+        os.replace(tmp_path, path)
+
+    def load_feature_state(self, dataset_id: int):
+        path = self.path(dataset_id) / FEATURE_STATE_FILE
+        if not path.exists():
+            return None
+        return joblib.load(path)
+
+    def save_backtest(self, dataset_id: int, backtest: dict):
+        path = self.path(dataset_id) / BACKTEST_FILE
+        tmp_path = path.with_suffix(".joblib.part")
+        joblib.dump(backtest, tmp_path)
+        os.replace(tmp_path, path)
+
+    def load_backtest(self, dataset_id: int):
+        path = self.path(dataset_id) / BACKTEST_FILE
+        if not path.exists():
+            return None
+        return joblib.load(path)
+
+    def backtest_modified(self, dataset_id: int) -> int:
+        """
+        Time (epoch nanoseconds) the backtest was last saved, or 0 if there
+        is none. Changes with every save_backtest().
+        """
+        try:
+            return (self.path(dataset_id) / BACKTEST_FILE).stat().st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    # ---------------------------------------------------------------- meta
+
+    def version(self, dataset_id: int) -> int:
+        """
+        Processed-data version; 0 until the first analysis has been saved.
+        """
+        return self._read_meta(dataset_id).get("processed_version", 0)
+
+    def modified(self, dataset_id: int):
+        """
+        Time (epoch seconds) the processed-data version last changed, or
+        None before the first analysis.
+        """
+        try:
+            return (self.path(dataset_id) / META_FILE).stat().st_mtime
+        except FileNotFoundError:
+            return None
+
+    def _read_meta(self, dataset_id: int) -> dict:
+        try:
+            with open(self.path(dataset_id) / META_FILE) as fh:
+                return json.load(fh)
+        except FileNotFoundError:
+            return {}
+
+    def _bump_version(self, dataset_id: int) -> int:
+        with self._locked(dataset_id):
+            meta = self._read_meta(dataset_id)
+            meta["processed_version"] = meta.get("processed_version", 0) + 1
+            path = self.path(dataset_id) / META_FILE
+            tmp_path = path.with_suffix(".json.part")
+            with open(tmp_path, "w") as fh:
+                json.dump(meta, fh)
+            os.replace(tmp_path, path)
+        return meta["processed_version"]
+
+    def _locked(self, dataset_id: int):
+        return self._flock(self.path(dataset_id) / LOCK_FILE)
+
+    @staticmethod
+    @contextmanager
+    def _flock(path: Path):
+        with open(path, "w") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+DATASETS = DatasetStore()
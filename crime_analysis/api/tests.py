@@ -1,3 +1,599 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import duckdb
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from crime_analysis.benchmarks.synthetic import generate_crimes
+from crime_analysis.database.load import save_to_db
+from crime_analysis.database.models import CrimeRecord
+from crime_analysis.database.tests import processed_frame
+from crime_analysis.processing.incremental import build_features
+from crime_analysis.processing.model_registry import MODELS
+from crime_analysis.processing.preprocessing import DATE_FORMAT
+from . import charts
+from .charts import CHART_CACHE, cached_chart, cached_series, chart_key
+from .export import iter_csv
+from .ingest import ingest_upload
+from .jobs import (
+    ANALYSIS_STAGES, APPEND_STAGES, CANCELLED, DONE, FAILED, QUEUED, RUNNING,
+    JobCancelled, JobQueue, StageTracker, run_job,
+)
+from .middleware import ServerTimingMiddleware, add_timing, server_timing, timed
+from .storage import DatasetStore
+
+
+LOCMEM_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    CHART_CACHE: {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "charts-tests"},
+}
+
+
+class TempRootMixin:
+    """
+    A fresh directory for datasets, models and reports per test.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.tmp = Path(tempfile.mkdtemp(prefix="api-tests-"))
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        settings = override_settings(
+            DATASET_ROOT=self.tmp / "datasets", REPORT_ROOT=self.tmp / "reports", CACHES=LOCMEM_CACHES,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        caches[CHART_CACHE].clear()
+        models_root = mock.patch.object(MODELS, "_root", self.tmp / "models")
+        models_root.start()
+        self.addCleanup(models_root.stop)
+        self.store = DatasetStore(self.tmp / "datasets", cache_bytes=1 << 30)
+
+
+class DatasetStoreTests(TempRootMixin, TestCase):
+
+    def test_ids_of_deleted_datasets_are_not_reused(self):
+        first = self.store.create()
+        second = self.store.create()
+        self.store.delete(second)
+        self.assertEqual(self.store.create(), second + 1)
+        self.assertEqual(self.store.ids(), [first, second + 1])
+
+    def test_counter_starts_after_existing_directories(self):
+        (self.tmp / "datasets" / "7").mkdir(parents=True)
+        self.assertEqual(self.store.create(), 8)
+
+    def test_processed_parts_and_versions(self):
+        dataset_id = self.store.create()
+        self.assertIsNone(self.store.load_processed(dataset_id))
+        self.assertEqual(self.store.version(dataset_id), 0)
+
+        df = processed_frame()
+        head, tail = df.iloc[:300], df.iloc[300:]
+        self.assertEqual(self.store.save_processed(dataset_id, head), 1)
+        pd.testing.assert_frame_equal(self.store.load_processed(dataset_id), head)
+        self.assertEqual(self.store.append_processed(dataset_id, tail), 2)
+        loaded = self.store.load_processed(dataset_id)
+        self.assertEqual(len(loaded), len(df))
+        pd.testing.assert_index_equal(loaded.index, df.index)
+
+    def test_saves_by_another_process_are_picked_up(self):
+        dataset_id = self.store.create()
+        df = processed_frame()
+        self.store.save_processed(dataset_id, df.iloc[:100])
+        self.assertEqual(len(self.store.load_processed(dataset_id)), 100)
+
+        # Another store on the same root, like a job's worker process
+        DatasetStore(self.store.root).save_processed(dataset_id, df)
+        self.assertEqual(len(self.store.load_processed(dataset_id)), len(df))
+        self.assertEqual(
+            [entry["version"] for entry in self.store.cache.usage()["entries"]], [2]
+        )
+
+    def test_delete_removes_derived_data(self):
+        dataset_id = self.store.create()
+        self.store.save_processed(dataset_id, processed_frame(50))
+        MODELS.put(dataset_id, "rf", "key", {"fitted": True})
+        chart = chart_key(dataset_id, 1, "crime_timeseries", {})
+        caches[CHART_CACHE].set(chart, b"png")
+        report_dir = self.tmp / "reports" / f"datasets-{dataset_id}_99"
+        report_dir.mkdir(parents=True)
+        other_report = self.tmp / "reports" / f"datasets-{dataset_id}0"
+        other_report.mkdir()
+        save_to_db(processed_frame(50), dataset_id=dataset_id)
+
+        self.store.delete(dataset_id)
+
+        self.assertNotIn(dataset_id, self.store)
+        self.assertIsNone(MODELS.latest(dataset_id, "rf"))
+        self.assertIsNone(caches[CHART_CACHE].get(chart))
+        self.assertFalse(report_dir.exists())
+        self.assertTrue(other_report.exists())
+        self.assertFalse(CrimeRecord.objects.filter(dataset_id=dataset_id).exists())
+
+
+CSV = (
+    b"ID,Case Number,Date,Primary Type,Arrest,Domestic\n"
+    b"1,JA1,01/05/2023 10:00:00 AM,THEFT,false,false\n"
+    b"2,JA2,01/05/2023 11:00:00 AM,BATTERY,true,false\n"
+)
+
+
+class IngestTests(TempRootMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch("crime_analysis.api.views.DATASETS", self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def upload(self, url, name="crimes.csv", content=CSV):
+        return self.client.post(url, {"file": SimpleUploadedFile(name, content)})
+
+    def test_csv_is_streamed_to_parquet(self):
+        path = self.tmp / "out.parquet"
+        stats = ingest_upload(SimpleUploadedFile("crimes.csv", CSV), path, chunk_rows=1)
+        self.assertEqual((stats["rows"], stats["row_groups"]), (2, 2))
+        df = pd.read_parquet(path)
+        self.assertEqual(df["ID"].tolist(), [1, 2])
+        self.assertEqual(df["Arrest"].tolist(), [False, True])
+        self.assertFalse(path.with_suffix(".parquet.part").exists())
+
+    def test_unparsable_upload_is_rejected(self):
+        response = self.upload("/api/upload/", content=b"ID,Arrest\nnot a number,maybe\n")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.store.ids(), [])
+
+    def test_unsupported_format_is_rejected(self):
+        response = self.upload("/api/upload/", name="crimes.xlsx")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.store.ids(), [])
+
+    def test_failed_upload_deletes_the_dataset(self):
+        with mock.patch("crime_analysis.api.views.ingest_upload", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                self.upload("/api/upload/")
+        self.assertEqual(self.store.ids(), [])
+
+    def test_failed_append_releases_its_part(self):
+        response = self.upload("/api/upload/")
+        self.assertEqual(response.status_code, 201)
+        dataset_id = response.json()["dataset_id"]
+        url = f"/api/datasets/{dataset_id}/append/"
+
+        with mock.patch("crime_analysis.api.views.ingest_upload", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                self.upload(url)
+        self.assertEqual(self.upload(url, content=b"ID\nx\n").status_code, 400)
+
+        raw_dir = self.store.path(dataset_id) / "raw"
+        self.assertEqual([p.name for p in raw_dir.iterdir()], ["part-00000.parquet"])
+        self.assertEqual(len(self.store.load_raw(dataset_id)), 2)
+
+
+class JobQueueTests(SimpleTestCase):
+
+    def setUp(self):
+        tmp = Path(tempfile.mkdtemp(prefix="jobs-tests-"))
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        self.db_path = tmp / "jobs.sqlite3"
+        settings = override_settings(JOB_DB_PATH=self.db_path)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.queue = JobQueue()
+
+    def test_a_job_is_claimed_once(self):
+        job_id = self.queue.create("analysis", 1, {"profile": True})
+        self.assertEqual(self.queue.pending_ids(), [job_id])
+        self.assertTrue(self.queue.claim(job_id))
+        self.assertFalse(self.queue.claim(job_id))
+        job = self.queue.get(job_id)
+        self.assertEqual((job["status"], job["params"]), (RUNNING, {"profile": True}))
+        self.assertEqual(self.queue.pending_ids(), [])
+
+    def test_cancelled_jobs_are_not_started(self):
+        job_id = self.queue.create("analysis", 1)
+        self.assertTrue(self.queue.cancel(job_id))
+        self.assertFalse(self.queue.claim(job_id))
+        self.assertEqual(self.queue.get(job_id)["status"], CANCELLED)
+
+    def test_running_jobs_stop_at_the_next_stage(self):
+        job_id = self.queue.create("analysis", 1)
+        self.queue.claim(job_id)
+        tracker = StageTracker(self.queue, job_id, ["load", "train"])
+        with tracker.stage("load"):
+            self.assertTrue(self.queue.cancel(job_id))
+        with self.assertRaises(JobCancelled):
+            with tracker.stage("train"):
+                pass
+        job = self.queue.get(job_id)
+        self.assertEqual([s["status"] for s in job["stages"]], ["done", "pending"])
+        self.assertEqual(job["progress"], 0.5)
+
+    def test_jobs_of_exited_workers_are_failed(self):
+        orphan = self.queue.create("analysis", 1)
+        alive = self.queue.create("analysis", 2)
+        waiting = self.queue.create("analysis", 3)
+        self.queue.claim(orphan)
+        self.queue.claim(alive)
+        exited = subprocess.Popen(["true"])
+        exited.wait()
+        with sqlite3.connect(self.db_path) as con:
+            con.execute("UPDATE jobs SET worker_pid = ? WHERE id = ?", (exited.pid, orphan))
+
+        self.assertEqual(self.queue.fail_orphaned(), [orphan])
+        self.assertEqual(self.queue.get(orphan)["status"], FAILED)
+        self.assertEqual(self.queue.get(alive)["status"], RUNNING)
+        self.assertEqual(self.queue.get(waiting)["status"], QUEUED)
+
+    def test_tables_without_worker_pid_are_upgraded(self):
+        path = self.db_path.with_name("old.sqlite3")
+        with sqlite3.connect(path) as con:
+            con.execute("CREATE TABLE jobs (id INTEGER PRIMARY KEY, status TEXT NOT NULL)")
+        queue = JobQueue(path)
+        with queue._connect() as con:
+            columns = {row["name"] for row in con.execute("PRAGMA table_info(jobs)")}
+        self.assertIn("worker_pid", columns)
+
+    def run_kind(self, runner):
+        job_id = self.queue.create("test", 1)
+        with mock.patch.dict("crime_analysis.api.jobs.JOB_KINDS", {"test": (runner, ["load", "store"])}):
+            run_job(job_id)
+        return self.queue.get(job_id)
+
+    def test_run_job_records_stages(self):
+        def runner(job, tracker):
+            for name in ("load", "store"):
+                with tracker.stage(name) as entry:
+                    entry["rows"] = job["dataset_id"]
+
+        job = self.run_kind(runner)
+        self.assertEqual((job["status"], job["progress"]), (DONE, 1.0))
+        self.assertEqual([s["rows"] for s in job["stages"]], [1, 1])
+        self.assertTrue(all(s["seconds"] is not None for s in job["stages"]))
+
+    def test_run_job_records_failures(self):
+        def runner(job, tracker):
+            with tracker.stage("load"):
+                raise ValueError("No raw dataframe found")
+
+        job = self.run_kind(runner)
+        self.assertEqual((job["status"], job["error"]), (FAILED, "ValueError: No raw dataframe found"))
+        self.assertEqual(job["stages"][0]["status"], "failed")
+
+
+@override_settings(TRAIN_GB_MODEL="hist", PERMUTATION_IMPORTANCE_SECONDS=0)
+class AppendJobTests(TempRootMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        settings = override_settings(JOB_DB_PATH=self.tmp / "jobs.sqlite3")
+        settings.enable()
+        self.addCleanup(settings.disable)
+        patcher = mock.patch("crime_analysis.api.storage.DATASETS", self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.queue = JobQueue()
+
+        raw = generate_crimes(3000, seed=1, start="2023-01-01", end="2023-03-01")
+        dates = pd.to_datetime(raw["Date"], format=DATE_FORMAT)
+        self.history = raw[dates < pd.Timestamp("2023-02-10")]
+        self.delta = raw[dates >= pd.Timestamp("2023-02-10")]
+        self.dataset_id = self.store.create()
+        self.write_raw(self.history, 0)
+
+    def write_raw(self, df, part):
+        path = self.store.raw_path(self.dataset_id, part)
+        path.parent.mkdir(exist_ok=True)
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), path)
+        path.with_suffix(".parquet.part").unlink(missing_ok=True)
+
+    def run_kind(self, kind, params=None):
+        job_id = self.queue.create(kind, self.dataset_id, params)
+        run_job(job_id)
+        job = self.queue.get(job_id)
+        self.assertEqual(job["status"], DONE, job["error"])
+        return [stage["name"] for stage in job["stages"]]
+
+    def append(self, df):
+        part = self.store.reserve_raw_part(self.dataset_id)
+        self.write_raw(df, part)
+        return self.run_kind("append", {"part": part})
+
+    def assert_stored_rows(self, raw):
+        expected, _ = build_features(raw.copy())
+        processed = self.store.load_processed(self.dataset_id)
+        self.assertEqual(len(processed), len(expected))
+        pd.testing.assert_index_equal(processed.index, expected.index, check_names=False)
+        self.assertEqual(CrimeRecord.objects.filter(dataset_id=self.dataset_id).count(), len(expected))
+        with duckdb.connect(str(self.store.analytics_path(self.dataset_id)), read_only=True) as con:
+            self.assertEqual(con.execute("SELECT count(*) FROM crime_records").fetchone()[0], len(expected))
+
+    def test_append_matches_a_full_analysis(self):
+        self.assertEqual(self.run_kind("analysis"), ANALYSIS_STAGES)
+        self.assert_stored_rows(self.history)
+
+        self.assertEqual(self.append(self.delta), APPEND_STAGES)
+        self.assertEqual(self.store.version(self.dataset_id), 2)
+        self.assertEqual(len(self.store.processed_parts(self.dataset_id)), 2)
+        self.assert_stored_rows(pd.concat([self.history, self.delta]))
+
+    def test_backdated_append_falls_back_to_a_full_analysis(self):
+        self.run_kind("analysis")
+        backdated = generate_crimes(200, seed=2, start="2023-01-05", end="2023-01-06", first_id=10_000)
+        self.assertEqual(self.append(backdated), ANALYSIS_STAGES)
+        self.assert_stored_rows(pd.concat([self.history, backdated]))
+
+
+class AggregatesViewTests(TempRootMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch("crime_analysis.api.views.DATASETS", self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.dataset_id = self.store.create()
+        self.url = f"/api/datasets/{self.dataset_id}/aggregates/"
+
+    def test_aggregates(self):
+        self.assertEqual(self.client.get(self.url + "counts/").status_code, 400)
+        df = processed_frame()
+        self.store.save_analytics(self.dataset_id, df)
+
+        response = self.client.get(self.url + "counts/", {"type": ["THEFT"], "freq": "hour"})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()["data"]
+        self.assertTrue(data)
+        self.assertEqual(
+            sum(row["count"] for row in data),
+            int((df["Primary Type"] == "THEFT").sum()),
+        )
+        self.assertIn("duckdb;dur=", response["Server-Timing"])
+
+        self.assertEqual(self.client.get(self.url + "violent-share/").status_code, 200)
+        self.assertEqual(len(self.client.get(self.url + "hour-of-week/").json()["data"]), 7)
+        self.assertEqual(self.client.get(self.url + "counts/", {"freq": "week"}).status_code, 400)
+        self.assertEqual(self.client.get(self.url + "median/").status_code, 404)
+
+
+class AnalysedDatasetMixin(TempRootMixin):
+    """
+    A dataset with processed rows and the results the charts need.
+    """
+
+    def setUp(self):
+        super().setUp()
+        for target in ("crime_analysis.api.charts.DATASETS", "crime_analysis.api.views.DATASETS"):
+            patcher = mock.patch(target, self.store)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.dataset_id = self.store.create()
+        self.df = processed_frame()
+        self.save()
+
+    def save(self):
+        n_test = len(self.df) // 5
+        self.store.save_results(self.dataset_id, {
+            "rf_pred": np.zeros(n_test, dtype=np.int8),
+            "gb_pred": np.ones(n_test, dtype=np.int8),
+            "feature_importances": pd.Series({"lag_1h": 0.6, "Hour_sin": 0.4}),
+        })
+        return self.store.save_processed(self.dataset_id, self.df)
+
+
+class ChartCacheTests(AnalysedDatasetMixin, TestCase):
+
+    def test_charts_are_rendered_once_per_version(self):
+        with mock.patch.object(charts, "render_chart", wraps=charts.render_chart) as render:
+            png = cached_chart(self.dataset_id, "feature_importances")
+            self.assertTrue(png.startswith(b"\x89PNG"))
+            self.assertEqual(cached_chart(self.dataset_id, "feature_importances"), png)
+            self.assertEqual(render.call_count, 1)
+
+            self.save()
+            cached_chart(self.dataset_id, "feature_importances")
+            self.assertEqual(render.call_count, 2)
+
+    def test_options_are_part_of_the_key(self):
+        with mock.patch.object(charts, "render_chart", wraps=charts.render_chart) as render:
+            cached_chart(self.dataset_id, "feature_importances")
+            cached_chart(self.dataset_id, "feature_importances", dpi=50)
+            self.assertEqual(render.call_count, 2)
+
+    def test_charts_of_a_version_saved_meanwhile_are_not_cached(self):
+        real_input = charts._chart_input
+
+        def load_while_saving(*args):
+            # A job saves between the version lookup and the input load
+            self.save()
+            return real_input(*args)
+
+        with mock.patch.object(charts, "_chart_input", side_effect=load_while_saving):
+            self.assertIsNotNone(cached_chart(self.dataset_id, "feature_importances"))
+        for version in (1, 2):
+            key = chart_key(self.dataset_id, version, "feature_importances", {})
+            self.assertIsNone(caches[CHART_CACHE].get(key))
+
+    def test_series(self):
+        series = cached_series(self.dataset_id, "crime_timeseries")
+        self.assertEqual(series["freq"], "D")
+        self.assertEqual(sum(series["values"]), self.df["crime_count"].sum())
+        self.assertEqual(series["length"], len(series["values"]))
+        self.assertEqual(cached_series(self.dataset_id, "feature_importances")["labels"], ["lag_1h", "Hour_sin"])
+
+    def test_missing_inputs(self):
+        empty = self.store.create()
+        self.assertIsNone(cached_chart(empty, "crime_timeseries"))
+        with self.assertRaises(ValueError):
+            cached_chart(self.dataset_id, "pie")
+
+
+class ChartViewTests(AnalysedDatasetMixin, TestCase):
+
+    def url(self, name="feature_importances"):
+        return f"/api/visualization/{self.dataset_id}/charts/{name}/"
+
+    def test_png_with_validators(self):
+        response = self.client.get(self.url())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/png")
+        self.assertEqual(response["ETag"], f'"{self.dataset_id}-1-feature_importances-png"')
+        self.assertIn("Last-Modified", response)
+        self.assertIn("no-cache", response["Cache-Control"])
+
+    def test_revalidation_does_not_render(self):
+        etag = self.client.get(self.url())["ETag"]
+        with mock.patch("crime_analysis.api.views.cached_chart") as chart:
+            response = self.client.get(self.url(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        chart.assert_not_called()
+        self.assertEqual(response["ETag"], etag)
+        self.assertIn("Last-Modified", response)
+
+        # A new version has a new ETag
+        self.save()
+        response = self.client.get(self.url(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_versioned_urls_are_immutable(self):
+        response = self.client.get(self.url(), {"v": 1})
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertIn("max-age=", response["Cache-Control"])
+        response = self.client.get(self.url(), {"v": 0})
+        self.assertNotIn("immutable", response["Cache-Control"])
+
+    def test_series_output(self):
+        response = self.client.get(self.url("crime_timeseries"), {"output": "json"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["freq"], "D")
+        self.assertTrue(response["ETag"].endswith('-json"'))
+
+    def test_errors(self):
+        self.assertEqual(self.client.get(self.url("pie")).status_code, 404)
+        self.assertEqual(self.client.get(self.url(), {"output": "svg"}).status_code, 400)
+        self.dataset_id = self.store.create()
+        self.assertEqual(self.client.get(self.url()).status_code, 400)
+        self.dataset_id += 1
+        self.assertEqual(self.client.get(self.url()).status_code, 404)
+
+
+class CrimeRecordsViewTests(TestCase):
+
+    url = "/api/records/"
+
+    @classmethod
+    def setUpTestData(cls):
+        save_to_db(processed_frame(300), dataset_id=1)
+        save_to_db(processed_frame(100, seed=2), dataset_id=2)
+        cls.ids = list(CrimeRecord.objects.filter(dataset_id=1).order_by("date", "id").values_list("id", flat=True))
+
+    def test_following_next_links(self):
+        ids, url, params = [], self.url, {"dataset": 1, "limit": 40}
+        while url:
+            body = self.client.get(url, params).json()
+            ids += [row["id"] for row in body["results"]]
+            url, params = body["next"], None
+        self.assertEqual(ids, self.ids)
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.client.get(self.url, {"cursor": "garbage"}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"limit": 0}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"output": "xml"}).status_code, 400)
+
+    def test_streamed_outputs_resume_from_a_cursor(self):
+        cursor = self.client.get(self.url, {"dataset": 1, "limit": 100}).json()["next_cursor"]
+
+        response = self.client.get(self.url, {"dataset": 1, "output": "ndjson", "cursor": cursor})
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual([row["id"] for row in rows], self.ids[100:])
+
+        response = self.client.get(self.url, {"dataset": 1, "output": "csv"})
+        reader = csv.DictReader(io.StringIO(b"".join(response.streaming_content).decode()))
+        self.assertEqual([int(row["id"]) for row in reader], self.ids)
+
+
+@override_settings(EXPORT_BATCH_ROWS=64)
+class ExportViewTests(AnalysedDatasetMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Two parts, so batches come from more than one file
+        self.store.append_processed(self.dataset_id, self.df.iloc[:10])
+        self.expected = pd.concat([self.df, self.df.iloc[:10]])
+        self.url = f"/api/datasets/{self.dataset_id}/export/"
+
+    def download(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        chunks = list(response.streaming_content)
+        self.assertGreater(len(chunks), len(self.expected) // 64)
+        return response, b"".join(chunks)
+
+    def test_csv(self):
+        response, body = self.download()
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertIn(f'dataset-{self.dataset_id}.csv', response["Content-Disposition"])
+        df = pd.read_csv(io.BytesIO(body))
+        self.assertEqual(len(df), len(self.expected))
+        self.assertEqual(list(df.columns), list(self.expected.columns) + ["Date"])
+        self.assertEqual(df["ID"].tolist(), self.expected["ID"].tolist())
+
+    def test_parquet(self):
+        response, body = self.download(output="parquet")
+        self.assertEqual(response["Content-Type"], "application/vnd.apache.parquet")
+        table = pq.read_table(io.BytesIO(body))
+        self.assertEqual(pq.ParquetFile(io.BytesIO(body)).num_row_groups, -(-len(self.df) // 64) + 1)
+        df = table.to_pandas()
+        pd.testing.assert_frame_equal(df, self.expected, check_categorical=False)
+
+    def test_errors(self):
+        self.assertEqual(self.client.get(self.url, {"output": "xlsx"}).status_code, 400)
+        self.assertEqual(self.client.get(f"/api/datasets/{self.store.create()}/export/").status_code, 400)
+
+    def test_empty_csv_has_a_header(self):
+        schema = pa.schema([("a", pa.int64()), ("b", pa.string())])
+        self.assertEqual(b"".join(iter_csv([], schema)), b'"a","b"\n')
+
+
+class ServerTimingTests(SimpleTestCase):
+
+    def test_header_format(self):
+        self.assertEqual(
+            server_timing([("db load", 0.0123, 'rows "a\\b"\r\nX-Injected: 1'), ("cpu", 0.5, None)]),
+            'db-load;dur=12.3;desc="rows \\"a\\\\b\\"X-Injected: 1", cpu;dur=500.0',
+        )
+
+    def test_spans_of_the_request(self):
+        def view(request):
+            with timed("render", "chart"):
+                pass
+            add_timing("cache", 0.002)
+            response = HttpResponse()
+            response["Server-Timing"] = 'app;dur=1'
+            return response
+
+        header = ServerTimingMiddleware(view)(RequestFactory().get("/"))["Server-Timing"]
+        names = [metric.split(";")[0] for metric in header.split(", ")]
+        self.assertEqual(names, ["app", "render", "cache", "cpu", "total"])
+        self.assertIn('desc="chart"', header)
+
+    def test_spans_outside_a_request_are_ignored(self):
+        add_timing("job", 1.0)
+        header = ServerTimingMiddleware(lambda request: HttpResponse())(RequestFactory().get("/"))["Server-Timing"]
+        self.assertNotIn("job", header)
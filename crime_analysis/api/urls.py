@@ -2,15 +2,37 @@ from django.urls import path
 from .views import (
     UploadDatasetAPIView,
     StartAnalysisAPIView,
+    AppendDatasetAPIView,
+    BacktestAPIView,
+    ExportDatasetAPIView,
+    DatasetMemoryAPIView,
+    JobStatusAPIView,
+    JobProfileAPIView,
+    JobProfileStatsAPIView,
+    CrimeRecordsAPIView,
+    AggregatesAPIView,
     EvaluationAPIView,
     VisualizationAPIView,
+    ChartAPIView,
+    ExportMetricsPDFAPIView,
     # DashboardAPIView,
 )
 
 urlpatterns = [
     path("upload/", UploadDatasetAPIView.as_view(), name="upload-dataset"),
     path("start-analysis/", StartAnalysisAPIView.as_view(), name="start-analysis"),
+    path("datasets/<int:dataset_id>/append/", AppendDatasetAPIView.as_view(), name="append-dataset"),
+    path("datasets/<int:dataset_id>/backtest/", BacktestAPIView.as_view(), name="backtest"),
+    path("datasets/<int:dataset_id>/export/", ExportDatasetAPIView.as_view(), name="export-dataset"),
+    path("datasets/<int:dataset_id>/memory/", DatasetMemoryAPIView.as_view(), name="dataset-memory"),
+    path("jobs/<int:job_id>/", JobStatusAPIView.as_view(), name="job-status"),
+    path("jobs/<int:job_id>/profile/", JobProfileAPIView.as_view(), name="job-profile"),
+    path("jobs/<int:job_id>/profile/<str:stage>/", JobProfileStatsAPIView.as_view(), name="job-profile-stats"),
+    path("datasets/<int:dataset_id>/aggregates/<str:name>/", AggregatesAPIView.as_view(), name="aggregates"),
+    path("records/", CrimeRecordsAPIView.as_view(), name="crime-records"),
     path("evaluation/<int:dataset_id>/", EvaluationAPIView.as_view(), name="evaluation"),
     path("visualization/<int:dataset_id>/", VisualizationAPIView.as_view(), name="visualization"),
+    path("visualization/<int:dataset_id>/charts/<str:name>/", ChartAPIView.as_view(), name="chart"),
+    path("export/pdf/", ExportMetricsPDFAPIView.as_view(), name="export-pdf"),
     # path("dashboard/", DashboardAPIView.as_view(), name="dashboard"),
 ]
\ No newline at end of file
@@ -1,26 +1,36 @@
+import csv
+import itertools
+import json
+
 # Django & DRF
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from django.shortcuts import render
+from django.conf import settings
+from django.urls import reverse
+from django.utils.http import urlencode
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import FileResponse, StreamingHttpResponse
 # Serializers
-from .serializers import UploadDatasetSerializer, StartAnalysisSerializer
-
-
-from crime_analysis.processing.feature_engineering import add_lag_features, add_cyclic_features
-
-from crime_analysis.processing.preprocessing import preprocess_raw
-
-from crime_analysis.processing.ml_models import train_models
+from .serializers import (
+    UploadDatasetSerializer, StartAnalysisSerializer, AggregatesSerializer, BacktestSerializer,
+    RecordsSerializer, ReportSerializer,
+)
 
 
 from .storage import DATASETS
-
-
-import pandas as pd
-
-
-from crime_analysis.database.load import save_to_db
+from .ingest import ingest_upload
+from .export import CONTENT_TYPES, EXPORTERS
+from .jobs import DONE, JobQueue, profile_dir, submit_job
+from .middleware import add_timing, timed
+from ..database import queries
+from ..processing.dtypes import memory_report
+from ..processing.pipeline import summarize
+from ..reports.generate import build_report, cached_report, dataset_versions, model_metrics
+from ..database.records import (
+    RECORD_FIELDS, after_cursor, decode_cursor, filter_records, iter_records, keyset_page,
+)
 
 
 # class DashboardAPIView(APIView):
@@ -43,11 +53,9 @@ from crime_analysis.database.load import save_to_db
 
 
 
-DATASETS = {}  # словарь для хранения датасетов в памяти
-
 class UploadDatasetAPIView(APIView):
     """
-    Upload CSV/Parquet file, convert to Parquet, and store in memory.
+    Upload CSV/Parquet file and stream it to a Parquet file on disk.
     """
 
     def post(self, request):
@@ -57,35 +65,27 @@ class UploadDatasetAPIView(APIView):
 
         file = serializer.validated_data["file"]
 
-        # Read file into DataFrame
-        filename = file.name.lower()
-        if filename.endswith(".csv"):
-            df = pd.read_csv(file)
-        elif filename.endswith(".parquet"):
-            df = pd.read_parquet(file)
-        else:
-            return Response({"error": "Unsupported file format"}, status=400)
-
-        # Convert to Parquet in-memory
-        parquet_buffer = io.BytesIO()
-        df.to_parquet(parquet_buffer, index=False)
-        parquet_buffer.seek(0)  # обязательно сбросить курсор
-
         # Assign dataset ID
-        dataset_id = len(DATASETS) + 1
-
-        # Store raw Parquet bytes instead of CSV/DataFrame
-        DATASETS[dataset_id] = {
-            "raw_parquet": parquet_buffer.read(),  # можно позже читать через pd.read_parquet(io.BytesIO(...))
-            "processed_df": None,
-            "results": None,
-        }
+        dataset_id = DATASETS.create()
+
+        # Stream file into the dataset's raw Parquet file chunk by chunk
+        try:
+            stats = ingest_upload(
+                file, DATASETS.raw_path(dataset_id),
+                chunk_rows=settings.UPLOAD_CHUNK_ROWS
+            )
+        except ValueError as exc:
+            DATASETS.delete(dataset_id)
+            return Response({"error": str(exc)}, status=400)
+        except BaseException:
+            DATASETS.delete(dataset_id)
+            raise
 
         # Store dataset ID in session for Django templates
         request.session["dataset_id"] = dataset_id
 
         return Response(
-            {"dataset_id": dataset_id, "rows": df.shape[0]},
+            {"dataset_id": dataset_id, "rows": stats["rows"]},
             status=201
         )
 
@@ -93,7 +93,8 @@ class UploadDatasetAPIView(APIView):
 
 class StartAnalysisAPIView(APIView):
     """
-    Run preprocessing, feature engineering and ML training.
+    Queue preprocessing, feature engineering and ML training as a background
+    job. Returns the job ID immediately; poll JobStatusAPIView for progress.
     """
 
     def post(self, request):
@@ -106,116 +107,540 @@ class StartAnalysisAPIView(APIView):
         if dataset_id not in DATASETS:
             return Response({"error": "Dataset not found"}, status=404)
 
-        raw_df = DATASETS[dataset_id]["raw_df"]
-
-        if raw_df is None:
+        if not DATASETS.raw_parts(dataset_id):
             return Response({"error": "No raw dataframe found"}, status=500)
 
-        # ----------- Preprocessing & Feature Engineering -----------
-        df = preprocess_raw(raw_df.copy())
-        df = add_lag_features(df)
-        df = add_cyclic_features(df)
-
-        # ---------------------- Model Training ----------------------
-        x_test, y_test, rf_pred, gb_pred = train_models(df)
-
-        # 3. Save to DB
-        save_to_db(df)
-
-        # Save everything cleanly
-        DATASETS[dataset_id] = {
-            "raw_df": raw_df,            # keep original
-            "processed_df": df,          # store processed dataset
-            "results": {
-                "X_test": x_test,
-                "y_test": y_test,
-                "rf_pred": rf_pred,
-                "gb_pred": gb_pred,
-            }
-        }
+        params = {"profile": True} if serializer.validated_data["profile"] else None
+        job_id = submit_job("analysis", dataset_id, params)
+        request.session["job_id"] = job_id
 
-        # Mark in the session that preprocessing happened
-        request.session["preprocessed"] = True
+        return Response(
+            {
+                "message": "Analysis queued",
+                "dataset_id": dataset_id,
+                "job_id": job_id,
+                "status_url": reverse("job-status", args=[job_id]),
+            },
+            status=202
+        )
+
+
+class AppendDatasetAPIView(APIView):
+    """
+    Append a new extract (CSV/Parquet) to an analysed dataset. Only the new
+    rows go through preprocessing and feature engineering; the result is
+    appended to the stored processed dataset by a background job.
+    """
+
+    def post(self, request, dataset_id):
+        if dataset_id not in DATASETS:
+            return Response({"error": "Dataset not found"}, status=404)
+
+        serializer = UploadDatasetSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=400)
+
+        file = serializer.validated_data["file"]
+
+        part = DATASETS.reserve_raw_part(dataset_id)
+        try:
+            stats = ingest_upload(
+                file, DATASETS.raw_path(dataset_id, part),
+                chunk_rows=settings.UPLOAD_CHUNK_ROWS
+            )
+        except ValueError as exc:
+            DATASETS.discard_raw_part(dataset_id, part)
+            return Response({"error": str(exc)}, status=400)
+        except BaseException:
+            # Later appends and load_raw() would pick up the placeholder
+            DATASETS.discard_raw_part(dataset_id, part)
+            raise
+
+        job_id = submit_job("append", dataset_id, {"part": part})
 
         return Response(
-            {"message": "Analysis completed", "dataset_id": dataset_id}
+            {
+                "dataset_id": dataset_id,
+                "rows": stats["rows"],
+                "job_id": job_id,
+                "status_url": reverse("job-status", args=[job_id]),
+            },
+            status=202
         )
 
 
+class BacktestAPIView(APIView):
+    """
+    Queue a walk-forward backtest of an analysed dataset. The per-fold
+    metrics table is shown on the evaluation page once the job is done.
+    """
+
+    def post(self, request, dataset_id):
+        if dataset_id not in DATASETS:
+            return Response({"error": "Dataset not found"}, status=404)
+
+        serializer = BacktestSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=400)
+
+        if not DATASETS.version(dataset_id):
+            return Response({"error": "Analysis not completed"}, status=400)
 
+        job_id = submit_job("backtest", dataset_id, dict(serializer.validated_data))
 
+        return Response(
+            {
+                "dataset_id": dataset_id,
+                "job_id": job_id,
+                "status_url": reverse("job-status", args=[job_id]),
+            },
+            status=202
+        )
+
+
+class JobStatusAPIView(APIView):
+    """
+    GET: status, per-stage progress and timings of a background job.
+    DELETE: cancel the job.
+    """
+
+    def get(self, request, job_id):
+        job = JobQueue().get(job_id)
+        if job is None:
+            return Response({"error": "Job not found"}, status=404)
+
+        # Mark in the session that preprocessing happened
+        if job["status"] == DONE and job["dataset_id"] == request.session.get("dataset_id"):
+            request.session["preprocessed"] = True
+
+        return Response(job)
+
+    def delete(self, request, job_id):
+        queue = JobQueue()
+        if queue.get(job_id) is None:
+            return Response({"error": "Job not found"}, status=404)
+
+        if not queue.cancel(job_id):
+            return Response({"error": "Job already finished"}, status=409)
+
+        return Response(queue.get(job_id), status=202)
+
+
+class JobProfileAPIView(APIView):
+    """
+    Per-stage wall time, CPU time, peak memory and row counts of a job,
+    plus run totals. Stage durations are repeated in the Server-Timing
+    header. Jobs started with "profile": true also list the cProfile dump
+    of each stage, downloadable from JobProfileStatsAPIView.
+    """
+
+    def get(self, request, job_id):
+        job = JobQueue().get(job_id)
+        if job is None:
+            return Response({"error": "Job not found"}, status=404)
+
+        stages = job["stages"]
+        for stage in stages:
+            if stage.get("seconds") is not None:
+                add_timing(f"job-{stage['name']}", stage["seconds"], f"job {stage['name']}")
+            if stage.get("profile"):
+                stage["profile_url"] = reverse("job-profile-stats", args=[job_id, stage["name"]])
+
+        return Response({
+            "job_id": job_id,
+            "kind": job["kind"],
+            "dataset_id": job["dataset_id"],
+            "status": job["status"],
+            "stages": stages,
+            "total": summarize(stages),
+        })
+
+
+class JobProfileStatsAPIView(APIView):
+    """
+    cProfile dump of one stage of a profiled job, for pstats or snakeviz.
+    """
+
+    def get(self, request, job_id, stage):
+        job = JobQueue().get(job_id)
+        if job is None:
+            return Response({"error": "Job not found"}, status=404)
+
+        entry = next((s for s in job["stages"] if s["name"] == stage), None)
+        if entry is None or not entry.get("profile"):
+            return Response({"error": "No profile for this stage"}, status=404)
+
+        path = profile_dir(job_id) / entry["profile"]
+        if not path.exists():
+            return Response({"error": "Profile file missing"}, status=404)
+        return FileResponse(
+            path.open("rb"), as_attachment=True, filename=f"job-{job_id}-{entry['profile']}",
+            content_type="application/octet-stream",
+        )
+
+
+
+
+class AggregatesAPIView(APIView):
+    """
+    Dashboard aggregates computed in DuckDB over the processed dataset.
+
+    GET /api/datasets/<id>/aggregates/<name>/?start=&end=&type=THEFT&type=...&freq=day
+    where name is one of counts, violent-share, hour-of-week.
+    """
+
+    AGGREGATES = ("counts", "violent-share", "hour-of-week")
+
+    def get(self, request, dataset_id, name):
+        if dataset_id not in DATASETS:
+            return Response({"error": "Dataset not found"}, status=404)
+        if name not in self.AGGREGATES:
+            return Response({"error": f"Unknown aggregate: {name}"}, status=404)
+
+        serializer = AggregatesSerializer(data={
+            **request.query_params.dict(),
+            "types": request.query_params.getlist("type"),
+        })
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=400)
+        filters = {
+            "start": serializer.validated_data.get("start"),
+            "end": serializer.validated_data.get("end"),
+            "types": serializer.validated_data.get("types"),
+        }
+
+        db_path = DATASETS.analytics_path(dataset_id)
+        if not db_path.exists():
+            return Response({"error": "Analysis not completed"}, status=400)
+
+        with timed("duckdb", name):
+            if name == "counts":
+                data = queries.crime_counts(db_path, freq=serializer.validated_data["freq"], **filters)
+            elif name == "violent-share":
+                data = queries.violent_share_by_type(db_path, **filters)
+            else:
+                data = queries.hour_of_week(db_path, **filters)
+
+        return Response({"dataset_id": dataset_id, "aggregate": name, "data": data})
+
+class DatasetMemoryAPIView(APIView):
+    """
+    In-memory size of the processed dataset, per column, and what the
+    worker's dataset cache currently holds.
+    """
+
+    def get(self, request, dataset_id):
+        if dataset_id not in DATASETS:
+            return Response({"error": "Dataset not found"}, status=404)
+
+        df = DATASETS.load_processed(dataset_id)
+        if df is None:
+            return Response({"error": "Analysis not completed"}, status=400)
+
+        return Response({
+            "dataset_id": dataset_id,
+            "version": DATASETS.version(dataset_id),
+            **memory_report(df),
+            "cache": DATASETS.cache.usage(),
+        })
+
+
+class ExportDatasetAPIView(APIView):
+    """
+    Download the processed dataset as CSV (default) or Parquet
+    (?output=parquet).
+
+    The file is streamed batch by batch from the memory-mapped processed
+    parts, so memory use and time to first byte do not depend on the
+    dataset size.
+    """
+
+    def get(self, request, dataset_id):
+        if dataset_id not in DATASETS:
+            return Response({"error": "Dataset not found"}, status=404)
+
+        output = request.query_params.get("output", "csv")
+        if output not in EXPORTERS:
+            return Response({"error": f"output must be one of {sorted(EXPORTERS)}"}, status=400)
+
+        schema = DATASETS.processed_schema(dataset_id)
+        if schema is None:
+            return Response({"error": "Analysis not completed"}, status=400)
+
+        batches = DATASETS.processed_batches(dataset_id, settings.EXPORT_BATCH_ROWS)
+        response = StreamingHttpResponse(
+            EXPORTERS[output](batches, schema), content_type=CONTENT_TYPES[output]
+        )
+        response["Content-Disposition"] = f'attachment; filename="dataset-{dataset_id}.{output}"'
+        return response
+
+
+class _Echo:
+    """
+    File-like object whose write() returns the line, for csv.writer.
+    """
+
+    def write(self, value):
+        return value
+
+
+class CrimeRecordsAPIView(APIView):
+    """
+    Stored CrimeRecords filtered by dataset (?dataset=), date range
+    (?start=&end=), primary type (?type=, repeatable) and violent flag
+    (?violent=true|false).
+
+    Pages use keyset pagination on (date, id): pass ``next_cursor`` back as
+    ?cursor= to get the next page. With ?output=ndjson or ?output=csv the
+    whole filtered result (from ?cursor= if given) is streamed instead.
+    """
+
+    def get(self, request):
+        serializer = RecordsSerializer(data={
+            **request.query_params.dict(),
+            "types": request.query_params.getlist("type"),
+        })
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=400)
+        params = serializer.validated_data
+
+        qs = filter_records(
+            start=params.get("start"),
+            end=params.get("end"),
+            types=params.get("types"),
+            violent=params["violent"],
+            dataset_id=params.get("dataset"),
+        )
+
+        try:
+            if params["output"] == "json":
+                with timed("db", "records page"):
+                    rows, next_cursor = keyset_page(qs, params.get("cursor"), params["limit"])
+            else:
+                if params.get("cursor"):
+                    qs = after_cursor(qs, *decode_cursor(params["cursor"]))
+        except ValueError as exc:
+            return Response({"error": str(exc)}, status=400)
+
+        if params["output"] == "ndjson":
+            return StreamingHttpResponse(
+                (json.dumps(row, cls=DjangoJSONEncoder) + "\n" for row in iter_records(qs)),
+                content_type="application/x-ndjson",
+            )
+        if params["output"] == "csv":
+            writer = csv.writer(_Echo())
+            lines = itertools.chain(
+                [writer.writerow(RECORD_FIELDS)],
+                (writer.writerow([row[f] for f in RECORD_FIELDS]) for row in iter_records(qs)),
+            )
+            response = StreamingHttpResponse(lines, content_type="text/csv")
+            response["Content-Disposition"] = 'attachment; filename="crime_records.csv"'
+            return response
+
+        next_url = None
+        if next_cursor:
+            query = request.query_params.copy()
+            query["cursor"] = next_cursor
+            next_url = request.build_absolute_uri(f"{request.path}?{query.urlencode()}")
+
+        return Response({
+            "count": len(rows),
+            "next_cursor": next_cursor,
+            "next": next_url,
+            "results": rows,
+        })
 
-from ..processing.evaluation import compute_metrics
 
 class EvaluationAPIView(APIView):
     def get(self, request, dataset_id):
         if dataset_id not in DATASETS:
             return Response({"error": "Dataset not found"}, status=404)
 
-        results = DATASETS[dataset_id]["results"]
+        results = DATASETS.load_results(dataset_id)
 
         if not results:
             return Response({"error": "No analysis performed yet"}, status=400)
 
-        y_test = results["y_test"]
-
-        # Build prediction dict
-        model_preds = {
-            "Random Forest": results["rf_pred"],
-            "Gradient Boosting": results["gb_pred"],
-        }
-
         # Compute metrics
-        metrics_df = compute_metrics(y_test, model_preds)
+        metrics_df = model_metrics(results)
 
         # Convert DF → HTML table directly
         metrics_html = metrics_df.to_html(classes="table table-striped")
 
+        # Walk-forward folds, if a backtest ran on the current data
+        backtest = DATASETS.load_backtest(dataset_id)
+        backtest_html = None
+        if backtest is not None and backtest["version"] == DATASETS.version(dataset_id):
+            backtest_html = backtest["folds"].to_html(
+                classes="table table-striped", index=False, float_format="{:.4f}".format
+            )
+
         return render(request, "webapp/evaluation.html", {
             "dataset_id": dataset_id,
             "metrics_table": metrics_html,
+            "backtest_table": backtest_html,
             "evaluated": True
         })
 
 
 
-from crime_analysis.processing.visualizations import generate_charts
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from crime_analysis.processing.visualizations import CHARTS, chart_available
+from .charts import PNG, SERIES, cached_chart, cached_series
+
+# Chart URLs pinned to a processed-data version (?v=) never change
+CHART_MAX_AGE = 365 * 24 * 3600
+
 
 class VisualizationAPIView(APIView):
     def get(self, request, dataset_id):
         if dataset_id not in DATASETS:
             return Response({"error": "Dataset not found"}, status=404)
 
-        df = DATASETS[dataset_id]["processed_df"]
-        results = DATASETS[dataset_id]["results"]
-
-        if df is None or results is None:
+        version = DATASETS.version(dataset_id)
+        if not version:
             return Response({"error": "Analysis not completed"}, status=400)
 
-        charts = generate_charts(
-            df,
-            rf_pred=results["rf_pred"],
-            gb_pred=results["gb_pred"],
-            feature_importances=results.get("feature_importances")
-        )
+        # The page only links the charts; the browser fetches them in
+        # parallel from ChartAPIView
+        results = DATASETS.load_results(dataset_id)
+        charts = [name for name in CHARTS if chart_available(name, results)]
 
         return render(request, "webapp/visualization.html", {
             "dataset_id": dataset_id,
             "charts": charts,
+            "version": version,
             "visualized": True
         })
 
 
-# class ExportMetricsPDFAPIView(APIView):
-#     """
-#     Endpoint to export latest metrics as PDF.
-#     GET /api/export/pdf/
-#     """
-#
-#     def get(self, request, format=None):
-#         # Here you get the latest metrics from your processing module
-#         metrics_table = compute_metrics()
-#         if metrics_table is None:
-#             return Response({"error": "No metrics available"}, status=status.HTTP_400_BAD_REQUEST)
-#
-#         return export_metrics_pdf(metrics_table)
\ No newline at end of file
+class ChartAPIView(APIView):
+    """
+    One chart of a dataset as PNG, or with ?output=json the data behind it
+    as compact JSON for client-side rendering.
+
+    Responses carry an ETag and Last-Modified, so revalidation returns 304
+    without loading or rendering anything. URLs pinned to the current
+    processed-data version with ?v=<version> are cacheable for a year.
+    """
+
+    def get(self, request, dataset_id, name):
+        if dataset_id not in DATASETS:
+            return Response({"error": "Dataset not found"}, status=404)
+        if name not in CHARTS:
+            return Response({"error": f"Unknown chart: {name}"}, status=404)
+
+        fmt = request.query_params.get("output", PNG)
+        if fmt not in (PNG, SERIES):
+            return Response({"error": f"output must be '{PNG}' or '{SERIES}'"}, status=400)
+
+        version = DATASETS.version(dataset_id)
+        if not version:
+            return Response({"error": "Analysis not completed"}, status=400)
+
+        etag = f'"{dataset_id}-{version}-{name}-{fmt}"'
+        last_modified = int(DATASETS.modified(dataset_id))
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            if fmt == SERIES:
+                data = cached_series(dataset_id, name)
+                response = JsonResponse(data) if data is not None else None
+            else:
+                png = cached_chart(dataset_id, name)
+                response = HttpResponse(png, content_type="image/png") if png is not None else None
+            if response is None:
+                return Response({"error": "Chart not available for this dataset"}, status=404)
+
+        # On the 304 too: caches update the stored response's headers from it
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        if request.query_params.get("v") == str(version):
+            patch_cache_control(response, public=True, max_age=CHART_MAX_AGE, immutable=True)
+        else:
+            patch_cache_control(response, public=True, no_cache=True)
+        return response
+
+
+class ExportMetricsPDFAPIView(APIView):
+    """
+    PDF report (metrics, backtest and charts) of one or more analysed
+    datasets.
+
+    GET /api/export/pdf/?dataset=1&dataset=2 streams the report. Reports
+    are cached on disk per dataset version, so repeat downloads are served
+    straight from the file; an uncached report on more than
+    REPORT_SYNC_MAX_DATASETS datasets has to be queued first.
+
+    POST {"dataset_ids": [...]} builds the report in a background job and
+    returns its status and download URLs.
+    """
+
+    def _versions(self, dataset_ids):
+        """
+        :return: (versions, None) or (None, error response)
+        """
+        missing = [dataset_id for dataset_id in dataset_ids if dataset_id not in DATASETS]
+        if missing:
+            return None, Response({"error": f"Dataset {missing[0]} not found"}, status=404)
+        try:
+            return dataset_versions(dataset_ids), None
+        except ValueError as exc:
+            return None, Response({"error": str(exc)}, status=400)
+
+    @staticmethod
+    def _download_url(dataset_ids) -> str:
+        return reverse("export-pdf") + "?" + urlencode([("dataset", i) for i in dataset_ids])
+
+    def get(self, request, format=None):
+        serializer = ReportSerializer(data={"dataset_ids": request.query_params.getlist("dataset")})
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=400)
+        dataset_ids = serializer.validated_data["dataset_ids"]
+
+        versions, error = self._versions(dataset_ids)
+        if error is not None:
+            return error
+
+        path = cached_report(versions)
+        if path is None:
+            if len(dataset_ids) > settings.REPORT_SYNC_MAX_DATASETS:
+                return Response({
+                    "error": "Report not built yet; POST the dataset_ids to queue it",
+                    "queue_url": reverse("export-pdf"),
+                }, status=409)
+            with timed("report", "build report"):
+                path = build_report(dataset_ids)
+
+        name = "-".join(str(i) for i in dataset_ids)
+        return FileResponse(
+            path.open("rb"), as_attachment=True, filename=f"crime-report-{name}.pdf",
+            content_type="application/pdf",
+        )
+
+    def post(self, request, format=None):
+        serializer = ReportSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=400)
+        dataset_ids = serializer.validated_data["dataset_ids"]
+
+        versions, error = self._versions(dataset_ids)
+        if error is not None:
+            return error
+
+        download_url = self._download_url(dataset_ids)
+        if cached_report(versions) is not None:
+            return Response({"dataset_ids": dataset_ids, "download_url": download_url})
+
+        job_id = submit_job("report", dataset_ids[0], {"dataset_ids": dataset_ids})
+        return Response(
+            {
+                "dataset_ids": dataset_ids,
+                "job_id": job_id,
+                "status_url": reverse("job-status", args=[job_id]),
+                "download_url": download_url,
+            },
+            status=202
+        )
@@ -0,0 +1,52 @@
+import argparse
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crime_analysis.benchmarks.synthetic import DEFAULT_END, DEFAULT_START, FORMATS, write_crimes
+
+
+_SUFFIXES = {"k": 1_000, "m": 1_000_000}
+
+
+def row_count(value: str) -> int:
+    """
+    "100000", "100k" or "10M" as a number of rows (an argparse ``type``).
+    """
+    value = value.strip().lower().replace("_", "")
+    scale = _SUFFIXES.get(value[-1:], 1)
+    number = value[:-1] if scale > 1 else value
+    try:
+        rows = int(float(number) * scale)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid row count: {value!r}")
+    if rows < 1:
+        raise argparse.ArgumentTypeError("row count must be positive")
+    return rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Write synthetic crimes in the Chicago export schema to a CSV or "
+        "Parquet file. The same seed and size always give the same file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Output file; .csv or .parquet")
+        parser.add_argument("--rows", type=row_count, default="100k", help="e.g. 100k, 1M, 10M")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--start", default=DEFAULT_START, help="First day (inclusive)")
+        parser.add_argument("--end", default=DEFAULT_END, help="Last day (exclusive)")
+
+    def handle(self, *args, **options):
+        path = Path(options["path"])
+        fmt = path.suffix.lstrip(".").lower()
+        if fmt not in FORMATS:
+            raise CommandError(f"Output must end in one of {['.' + f for f in FORMATS]}")
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        stats = write_crimes(
+            path, options["rows"], fmt, seed=options["seed"],
+            start=options["start"], end=options["end"],
+        )
+        self.stdout.write(f"Wrote {stats['rows']:,} rows to {path}")
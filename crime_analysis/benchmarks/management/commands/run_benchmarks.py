@@ -0,0 +1,101 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from crime_analysis.benchmarks.suite import BENCHMARKS, DEFAULT_THRESHOLD, compare, run_suite
+from crime_analysis.benchmarks.synthetic import write_crimes
+from .generate_crime_data import row_count
+
+
+class Command(BaseCommand):
+    help = (
+        "Time upload parsing, preprocessing, feature engineering, training, "
+        "metrics, the DB load and chart rendering on synthetic (or given) "
+        "data and write the results to JSON. With --compare, fail if any "
+        "step got slower than the baseline results by more than --threshold."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=row_count, default="100k", help="Synthetic rows, e.g. 100k, 1M, 10M")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--format", choices=["csv", "parquet"], default="csv", help="Synthetic input format")
+        parser.add_argument("--input", help="Benchmark this file instead of synthetic data")
+        parser.add_argument(
+            "--benchmark", action="append", choices=BENCHMARKS, dest="benchmarks",
+            help="Run only this benchmark (repeatable)",
+        )
+        parser.add_argument("--repeat", type=int, default=3, help="Runs per benchmark; the best is reported")
+        parser.add_argument("--gb-model", default=settings.TRAIN_GB_MODEL)
+        parser.add_argument("--output", help="Results file (default: under BENCHMARK_ROOT)")
+        parser.add_argument("--compare", help="Baseline results file")
+        parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                            help="Allowed slowdown against the baseline (0.2 = 20%%)")
+
+    def handle(self, *args, **options):
+        root = Path(settings.BENCHMARK_ROOT)
+        baseline = self._read(options["compare"]) if options["compare"] else None
+
+        if options["input"]:
+            path = Path(options["input"])
+            if not path.exists():
+                raise CommandError(f"No such file: {path}")
+        else:
+            # Generated once per size and seed and reused by later runs
+            path = root / "data" / f"crimes-{options['rows']}-{options['seed']}.{options['format']}"
+            if not path.exists():
+                path.parent.mkdir(parents=True, exist_ok=True)
+                self.stdout.write(f"Generating {options['rows']:,} rows to {path}")
+                partial = path.with_name(path.stem + ".part" + path.suffix)
+                write_crimes(partial, options["rows"], options["format"], seed=options["seed"])
+                partial.replace(path)
+
+        results = run_suite(
+            path, repeat=options["repeat"], benchmarks=options["benchmarks"] or BENCHMARKS,
+            gb_model=options["gb_model"],
+        )
+
+        output = Path(options["output"]) if options["output"] else (
+            root / "results" / f"{(results['environment']['commit'] or 'unknown')[:12]}-{path.stem}.json"
+        )
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(results, indent=2))
+
+        self.stdout.write(f"\n{'benchmark':12}{'rows':>12}{'seconds':>10}{'cpu':>10}{'peak MB':>10}")
+        for name, stats in results["benchmarks"].items():
+            rows = f"{stats['rows']:,}" if stats["rows"] is not None else "-"
+            self.stdout.write(
+                f"{name:12}{rows:>12}{stats['seconds']:>10.3f}{stats['cpu_seconds']:>10.3f}"
+                f"{stats['peak_rss'] / 2**20:>10.0f}"
+            )
+        self.stdout.write(f"\nResults written to {output}")
+
+        if baseline is not None:
+            self._compare(baseline, results, options["threshold"])
+
+    def _read(self, path) -> dict:
+        try:
+            return json.loads(Path(path).read_text())
+        except (OSError, ValueError) as exc:
+            raise CommandError(f"Cannot read baseline {path}: {exc}")
+
+    def _compare(self, baseline: dict, results: dict, threshold: float):
+        if baseline["input"]["bytes"] != results["input"]["bytes"]:
+            self.stderr.write("Warning: the baseline was measured on a different input")
+
+        rows = compare(baseline, results, threshold)
+        self.stdout.write(
+            f"\nAgainst {(baseline['environment']['commit'] or 'baseline')[:12]}:\n"
+            f"{'benchmark':12}{'before':>10}{'after':>10}{'change':>10}"
+        )
+        for row in rows:
+            change = f"{(row['ratio'] - 1) * 100:+.1f}%" if row["ratio"] is not None else "-"
+            flag = "  REGRESSION" if row["regressed"] else ""
+            self.stdout.write(f"{row['name']:12}{row['baseline']:>10.3f}{row['current']:>10.3f}{change:>10}{flag}")
+
+        regressed = [row["name"] for row in rows if row["regressed"]]
+        if regressed:
+            raise CommandError(
+                f"Slower than the baseline by more than {threshold:.0%}: {', '.join(regressed)}"
+            )
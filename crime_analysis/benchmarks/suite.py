@@ -0,0 +1,281 @@
+"""
+Benchmarks of the analysis path, from upload parsing to chart rendering.
+
+run_suite() times each step on one input file the way the background jobs
+run it, and returns a JSON-serializable dict. Results of two commits are
+compared with compare(), which flags steps that got slower by more than a
+threshold.
+"""
+import gc
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from crime_analysis.processing.pipeline import measure
+
+
+BENCHMARKS = ("upload", "preprocess", "features", "train", "metrics", "db_load", "charts")
+
+# Steps whose output later steps need; run once untimed when not selected
+_INPUTS = {
+    "train": ("metrics", "charts"),
+}
+
+DEFAULT_THRESHOLD = 0.2
+
+# Connection alias of the scratch database the db_load benchmark writes to
+SCRATCH_DB = "benchmark_scratch"
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).resolve().parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _environment() -> dict:
+    import numpy
+    import pandas
+    import sklearn
+
+    return {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": numpy.__version__,
+        "pandas": pandas.__version__,
+        "pyarrow": pa.__version__,
+        "sklearn": sklearn.__version__,
+    }
+
+
+@contextmanager
+def _scratch_database(path: Path):
+    """
+    Register an empty, migrated SQLite database at ``path`` as the
+    SCRATCH_DB connection for the duration of the block.
+    """
+    from django.core.management import call_command
+    from django.db import DEFAULT_DB_ALIAS, connections
+
+    connections.databases[SCRATCH_DB] = {
+        **connections[DEFAULT_DB_ALIAS].settings_dict,
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": str(path),
+    }
+    try:
+        call_command("migrate", database=SCRATCH_DB, verbosity=0, interactive=False)
+        connections[SCRATCH_DB].close()
+        yield SCRATCH_DB
+    finally:
+        connections[SCRATCH_DB].close()
+        del connections[SCRATCH_DB]
+        del connections.databases[SCRATCH_DB]
+
+
+def _read_raw(path):
+    # Same read as DatasetStore.load_raw()
+    return pq.read_table(path, memory_map=True).to_pandas(split_blocks=True)
+
+
+class _Suite:
+
+    def __init__(self, path, repeat: int, selected, gb_model: str, n_jobs: int):
+        self.path = Path(path)
+        self.repeat = repeat
+        self.selected = selected
+        self.gb_model = gb_model
+        self.n_jobs = n_jobs
+        self.results = {}
+
+    def step(self, name: str, setup, fn, rows=None):
+        """
+        Run ``fn(*setup())`` ``repeat`` times if ``name`` is selected, else
+        once untimed; return the output of the last run.
+        """
+        if name not in self.selected:
+            return fn(*setup())
+
+        runs = []
+        for _ in range(self.repeat):
+            args = setup()
+            # Garbage of the previous run must not be collected on this one's clock
+            gc.collect()
+            entry = {}
+            with measure(entry):
+                output = fn(*args)
+            del args
+            runs.append(entry)
+
+        best = min(runs, key=lambda run: run["seconds"])
+        self.results[name] = {
+            "seconds": best["seconds"],
+            "cpu_seconds": best["cpu_seconds"],
+            "peak_rss": max(run["peak_rss"] for run in runs),
+            "rows": rows(output) if rows else None,
+            "runs": [run["seconds"] for run in runs],
+        }
+        return output
+
+    def run(self, tmp: Path):
+        from crime_analysis.api.ingest import ingest_upload
+        from crime_analysis.processing.dtypes import compact_dtypes
+        from crime_analysis.processing.feature_engineering import add_cyclic_features, add_lag_features
+        from crime_analysis.processing.preprocessing import preprocess_raw
+
+        raw_path = tmp / "raw.parquet"
+
+        def upload():
+            with open(self.path, "rb") as file:
+                return ingest_upload(file, raw_path)
+
+        self.step("upload", tuple, upload, rows=lambda stats: stats["rows"])
+
+        df = self.step(
+            "preprocess", lambda: (_read_raw(raw_path),), preprocess_raw, rows=len,
+        )
+        df = self.step(
+            "features", lambda: (df.copy(),),
+            lambda df: add_cyclic_features(add_lag_features(df)), rows=len,
+        )
+        # As in the jobs, everything after feature engineering sees compact dtypes
+        df = compact_dtypes(df)
+
+        if self._needed("train"):
+            self.train(df)
+        if "metrics" in self.selected:
+            self.metrics()
+        if "db_load" in self.selected:
+            self.db_load(df, tmp)
+        if "charts" in self.selected:
+            self.charts(df)
+
+    def _needed(self, name: str) -> bool:
+        return name in self.selected or any(d in self.selected for d in _INPUTS.get(name, ()))
+
+    def train(self, df):
+        from crime_analysis.processing.importance import impurity_importances
+        from crime_analysis.processing.ml_models import train_models
+
+        trained = self.step(
+            "train", tuple,
+            lambda: train_models(df, gb_model=self.gb_model, n_jobs=self.n_jobs),
+            rows=lambda _: len(df),
+        )
+        models = trained.pop("models")
+        trained["feature_importances"] = impurity_importances(models, trained["X_test"].columns)["rf"]
+        self.trained = trained
+
+    def metrics(self):
+        from crime_analysis.processing.evaluation import compute_metrics
+
+        trained = self.trained
+        self.step(
+            "metrics", tuple,
+            lambda: compute_metrics(trained["y_test"], {
+                "Random Forest": trained["rf_proba"],
+                "Gradient Boosting": trained["gb_proba"],
+            }),
+            rows=lambda _: len(trained["y_test"]),
+        )
+
+    def db_load(self, df, tmp: Path):
+        from django.db import connections
+        from crime_analysis.database.load import save_to_db
+
+        path = tmp / "db_load.sqlite3"
+        empty = tmp / "empty.sqlite3"
+        with _scratch_database(path) as using:
+            shutil.copyfile(path, empty)
+
+            def setup():
+                # Each run loads into a fresh copy of the empty database, on
+                # a new connection and outside any transaction, as the jobs
+                # do, so the PRAGMA tuning and index rebuild apply
+                connections[using].close()
+                shutil.copyfile(empty, path)
+                return ()
+
+            self.step("db_load", setup, lambda: save_to_db(df, using=using), rows=lambda rows: rows)
+
+    def charts(self, df):
+        from crime_analysis.processing.visualizations import CHARTS, render_chart
+
+        results = self.trained
+        self.step(
+            "charts", tuple,
+            lambda: {name: render_chart(name, df, results) for name in CHARTS},
+            rows=lambda _: len(df),
+        )
+
+
+def run_suite(path, repeat: int = 3, benchmarks=BENCHMARKS, gb_model: str = "gradient_boosting",
+              n_jobs: int = -1) -> dict:
+    """
+    Time the analysis steps on a Chicago-schema CSV/Parquet file.
+
+    Each selected step runs ``repeat`` times on fresh input and reports its
+    best wall time, the CPU time of that run and the highest peak RSS of
+    all runs (see pipeline.measure). Steps that are not selected but feed a
+    selected one run once, untimed. The DB load writes to a throwaway
+    SQLite database, never to the configured ones.
+
+    :param benchmarks: names from BENCHMARKS
+    :return: {"environment": ..., "input": ..., "benchmarks": {name: stats}}
+    """
+    unknown = set(benchmarks) - set(BENCHMARKS)
+    if unknown:
+        raise ValueError(f"Unknown benchmarks: {sorted(unknown)}")
+
+    suite = _Suite(path, repeat, set(benchmarks), gb_model, n_jobs)
+    started = time.time()
+    with tempfile.TemporaryDirectory(prefix="benchmark-") as tmp:
+        suite.run(Path(tmp))
+
+    return {
+        "environment": _environment(),
+        "input": {"path": str(path), "bytes": os.path.getsize(path)},
+        "options": {"repeat": repeat, "gb_model": gb_model, "n_jobs": n_jobs},
+        "started_at": started,
+        "benchmarks": {name: suite.results[name] for name in BENCHMARKS if name in suite.results},
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float = DEFAULT_THRESHOLD) -> list:
+    """
+    Per-benchmark change in wall time and peak memory between two
+    run_suite() results. A benchmark regressed when its wall time grew by
+    more than ``threshold`` (0.2 = 20%).
+
+    :return: list of dicts with name, baseline/current seconds, ratio,
+             baseline/current peak_rss and regressed
+    """
+    rows = []
+    for name, stats in current["benchmarks"].items():
+        before = baseline["benchmarks"].get(name)
+        if before is None:
+            continue
+        ratio = stats["seconds"] / before["seconds"] if before["seconds"] else None
+        rows.append({
+            "name": name,
+            "baseline": before["seconds"],
+            "current": stats["seconds"],
+            "ratio": ratio,
+            "baseline_peak_rss": before["peak_rss"],
+            "current_peak_rss": stats["peak_rss"],
+            "regressed": ratio is not None and ratio > 1 + threshold,
+        })
+    return rows
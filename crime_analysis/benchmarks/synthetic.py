@@ -0,0 +1,227 @@
+"""
+Synthetic crime data in the Chicago export schema, for benchmarks.
+
+Rows are drawn from fixed approximations of the real export: primary type
+shares, per-type IUCR/FBI codes and arrest/domestic rates, and seasonal,
+weekly and daily cycles in the time of day. The same seed and size always
+give the same file, so benchmark runs on different commits see identical
+input.
+"""
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from crime_analysis.api.ingest import CHICAGO_DTYPES
+
+
+# (primary type, share, IUCR, FBI code, description, arrest rate, domestic rate)
+CRIME_TYPES = [
+    ('THEFT', 0.215, '0820', '06', '$500 AND UNDER', 0.10, 0.03),
+    ('BATTERY', 0.180, '0486', '08B', 'DOMESTIC BATTERY SIMPLE', 0.20, 0.50),
+    ('CRIMINAL DAMAGE', 0.110, '1310', '14', 'TO PROPERTY', 0.06, 0.12),
+    ('NARCOTICS', 0.075, '1811', '18', 'POSS: CANNABIS 30GMS OR LESS', 0.99, 0.00),
+    ('ASSAULT', 0.070, '0560', '08A', 'SIMPLE', 0.14, 0.25),
+    ('OTHER OFFENSE', 0.062, '2826', '26', 'HARASSMENT BY ELECTRONIC MEANS', 0.15, 0.30),
+    ('BURGLARY', 0.050, '0610', '05', 'FORCIBLE ENTRY', 0.05, 0.02),
+    ('MOTOR VEHICLE THEFT', 0.048, '0910', '07', 'AUTOMOBILE', 0.07, 0.01),
+    ('DECEPTIVE PRACTICE', 0.048, '1150', '11', 'CREDIT CARD FRAUD', 0.12, 0.01),
+    ('ROBBERY', 0.038, '031A', '03', 'ARMED: HANDGUN', 0.09, 0.01),
+    ('CRIMINAL TRESPASS', 0.025, '1330', '26', 'TO LAND', 0.70, 0.05),
+    ('WEAPONS VIOLATION', 0.015, '143A', '15', 'UNLAWFUL POSS OF HANDGUN', 0.80, 0.00),
+    ('PUBLIC PEACE VIOLATION', 0.008, '2820', '24', 'TELEPHONE THREAT', 0.50, 0.10),
+    ('OFFENSE INVOLVING CHILDREN', 0.008, '1750', '20', 'CHILD ABUSE', 0.15, 0.60),
+    ('PROSTITUTION', 0.006, '1506', '16', 'SOLICIT ON PUBLIC WAY', 0.99, 0.00),
+    ('CRIMINAL SEXUAL ASSAULT', 0.003, '0261', '02', 'AGGRAVATED: HANDGUN', 0.10, 0.20),
+    # Older rows of the export use the previous name of the same offence
+    ('CRIM SEXUAL ASSAULT', 0.002, '0261', '02', 'AGGRAVATED: HANDGUN', 0.10, 0.20),
+    ('SEX OFFENSE', 0.004, '1562', '17', 'AGG CRIMINAL SEXUAL ABUSE', 0.15, 0.20),
+    ('INTERFERENCE WITH PUBLIC OFFICER', 0.003, '3731', '24', 'OBSTRUCTING IDENTIFICATION', 0.98, 0.00),
+    ('HOMICIDE', 0.0015, '0110', '01A', 'FIRST DEGREE MURDER', 0.40, 0.05),
+    ('LIQUOR LAW VIOLATION', 0.0015, '2230', '22', 'ILLEGAL CONSUMPTION BY MINOR', 0.99, 0.00),
+    ('GAMBLING', 0.001, '1661', '19', 'GAME/DICE', 0.99, 0.00),
+    ('STALKING', 0.001, '0583', '08A', 'SIMPLE', 0.10, 0.40),
+    ('ARSON', 0.001, '1020', '09', 'BY FIRE', 0.08, 0.05),
+]
+
+LOCATIONS = [
+    ('STREET', 0.22), ('RESIDENCE', 0.16), ('APARTMENT', 0.13), ('SIDEWALK', 0.09),
+    ('OTHER', 0.04), ('PARKING LOT/GARAGE(NON.RESID.)', 0.03), ('ALLEY', 0.02),
+    ('SMALL RETAIL STORE', 0.02), ('RESTAURANT', 0.02), ('SCHOOL, PUBLIC, BUILDING', 0.02),
+    ('RESIDENCE-GARAGE', 0.02), ('VEHICLE NON-COMMERCIAL', 0.02), ('RESIDENTIAL YARD (FRONT/BACK)', 0.02),
+    ('DEPARTMENT STORE', 0.015), ('GROCERY FOOD STORE', 0.015), ('GAS STATION', 0.01),
+    ('COMMERCIAL / BUSINESS OFFICE', 0.01), ('CTA TRAIN', 0.01), ('PARK PROPERTY', 0.01),
+    ('BAR OR TAVERN', 0.008), ('HOSPITAL BUILDING/GROUNDS', 0.007),
+]
+
+# Relative frequency by hour of day: quiet before dawn, a noon peak, an
+# evening plateau, and the midnight spike of reports with unknown times
+HOUR_WEIGHTS = np.array([
+    5.0, 3.2, 2.8, 2.3, 1.8, 1.5, 1.7, 2.4, 3.4, 3.9, 4.1, 4.2,
+    5.2, 4.6, 4.6, 4.8, 4.8, 4.9, 5.0, 4.9, 4.7, 4.5, 4.2, 3.7,
+])
+
+# Relative frequency by month (summer highs, February low) and by weekday
+# (Monday first)
+MONTH_WEIGHTS = np.array([0.90, 0.80, 0.92, 0.95, 1.05, 1.08, 1.13, 1.12, 1.05, 1.04, 0.97, 0.92])
+DAY_WEIGHTS = np.array([1.00, 0.98, 0.99, 0.99, 1.05, 1.03, 0.96])
+
+# Yearly change in volume
+YEARLY_TREND = -0.03
+
+DEFAULT_START = '2015-01-01'
+DEFAULT_END = '2025-01-01'
+
+# Exact duplicate rows, which preprocessing drops
+DUPLICATE_FRACTION = 0.001
+
+FORMATS = ('csv', 'parquet')
+
+# Rows generated and written at a time
+CHUNK_ROWS = 500_000
+
+_CHICAGO_LAT, _CHICAGO_LON = (41.64, 42.02), (-87.94, -87.52)
+
+
+def _day_weights(days: pd.DatetimeIndex) -> np.ndarray:
+    years = (days.year - days.year[0]).to_numpy()
+    weights = (
+        MONTH_WEIGHTS[days.month - 1]
+        * DAY_WEIGHTS[days.dayofweek]
+        * (1 + YEARLY_TREND) ** years
+    )
+    return weights / weights.sum()
+
+
+def _ascii_digits(chars: np.ndarray, value: np.ndarray, start: int, width: int):
+    for i in range(width - 1, -1, -1):
+        chars[:, start + i] = ord('0') + value % 10
+        value = value // 10
+
+
+def format_export_dates(dates: np.ndarray) -> np.ndarray:
+    """
+    datetime64 values as "MM/DD/YYYY hh:mm:ss AM" strings (the inverse of
+    preprocessing's fixed-width parser), built as raw bytes.
+    """
+    dates = pd.DatetimeIndex(dates)
+    hour = dates.hour.to_numpy()
+    chars = np.empty((len(dates), 22), dtype=np.uint8)
+    for col, sep in ((2, '/'), (5, '/'), (10, ' '), (13, ':'), (16, ':'), (19, ' '), (21, 'M')):
+        chars[:, col] = ord(sep)
+    _ascii_digits(chars, dates.month.to_numpy(), 0, 2)
+    _ascii_digits(chars, dates.day.to_numpy(), 3, 2)
+    _ascii_digits(chars, dates.year.to_numpy(), 6, 4)
+    _ascii_digits(chars, (hour + 11) % 12 + 1, 11, 2)
+    _ascii_digits(chars, dates.minute.to_numpy(), 14, 2)
+    _ascii_digits(chars, dates.second.to_numpy(), 17, 2)
+    chars[:, 20] = np.where(hour >= 12, ord('P'), ord('A'))
+    return chars.view('S22').ravel().astype(str).astype(object)
+
+
+def generate_crimes(n_rows: int, seed: int = 0, start: str = DEFAULT_START,
+                    end: str = DEFAULT_END, first_id: int = 1) -> pd.DataFrame:
+    """
+    ``n_rows`` synthetic crimes between ``start`` and ``end``, with the
+    columns and dtypes of the Chicago export (ingest.CHICAGO_DTYPES), in
+    no particular order.
+    """
+    rng = np.random.default_rng(seed)
+
+    days = pd.date_range(start, end, freq='D', inclusive='left')
+    day = rng.choice(len(days), size=n_rows, p=_day_weights(days))
+    hour = rng.choice(24, size=n_rows, p=HOUR_WEIGHTS / HOUR_WEIGHTS.sum())
+    # A third of the reports are rounded to the hour
+    minute = np.where(rng.random(n_rows) < 1 / 3, 0, rng.integers(0, 60, n_rows))
+    second = np.where(minute == 0, 0, rng.integers(0, 60, n_rows))
+    dates = (
+        days.to_numpy()[day]
+        + (hour * 3600 + minute * 60 + second).astype('timedelta64[s]')
+    )
+
+    names, shares, iucr, fbi, description, arrest_rate, domestic_rate = map(np.array, zip(*CRIME_TYPES))
+    crime = rng.choice(len(names), size=n_rows, p=shares / shares.sum())
+    places, place_shares = map(np.array, zip(*LOCATIONS))
+    place = rng.choice(len(places), size=n_rows, p=place_shares / place_shares.sum())
+
+    district = rng.integers(1, 26, n_rows)
+    beat = district * 100 + rng.integers(11, 36, n_rows)
+    block = (
+        np.char.zfill(rng.integers(0, 130, n_rows).astype(str), 3).astype(object)
+        + 'XX '
+        + rng.choice(np.array(['N', 'S', 'E', 'W'], dtype=object), n_rows)
+        + ' STREET ' + rng.integers(1, 400, n_rows).astype(str).astype(object) + ' ST'
+    )
+    latitude = rng.uniform(*_CHICAGO_LAT, n_rows).round(9)
+    longitude = rng.uniform(*_CHICAGO_LON, n_rows).round(9)
+    ids = np.arange(first_id, first_id + n_rows)
+
+    df = pd.DataFrame({
+        'ID': ids,
+        'Case Number': 'J' + pd.Series(ids + 100_000, dtype=str),
+        'Date': format_export_dates(dates),
+        'Block': block,
+        'IUCR': iucr[crime].astype(object),
+        'Primary Type': names[crime].astype(object),
+        'Description': description[crime].astype(object),
+        'Location Description': places[place].astype(object),
+        'Arrest': rng.random(n_rows) < arrest_rate[crime].astype(float),
+        'Domestic': rng.random(n_rows) < domestic_rate[crime].astype(float),
+        'Beat': beat,
+        'District': district.astype(np.float64),
+        'Ward': rng.integers(1, 51, n_rows).astype(np.float64),
+        'Community Area': rng.integers(1, 78, n_rows).astype(np.float64),
+        'FBI Code': fbi[crime].astype(object),
+        'X Coordinate': (1_100_000 + (longitude - _CHICAGO_LON[0]) * 280_000).round(),
+        'Y Coordinate': (1_813_000 + (latitude - _CHICAGO_LAT[0]) * 365_000).round(),
+        'Year': pd.DatetimeIndex(dates).year.to_numpy().astype(np.int64),
+        'Updated On': '01/01/2025 03:40:29 PM',
+        'Latitude': latitude,
+        'Longitude': longitude,
+        'Location': '(' + pd.Series(latitude).astype(str) + ', ' + pd.Series(longitude).astype(str) + ')',
+    })
+
+    # The export occasionally repeats a row verbatim
+    n_duplicates = int(n_rows * DUPLICATE_FRACTION)
+    if n_duplicates:
+        source = rng.choice(n_rows, size=n_duplicates, replace=False)
+        target = rng.choice(n_rows, size=n_duplicates, replace=False)
+        df.iloc[target] = df.iloc[source].to_numpy()
+    return df
+
+
+def write_crimes(path, n_rows: int, fmt: str = 'csv', seed: int = 0,
+                 chunk_rows: int = CHUNK_ROWS, **options) -> dict:
+    """
+    Write ``n_rows`` synthetic crimes (see generate_crimes) to a CSV or
+    Parquet file, ``chunk_rows`` at a time, so memory use does not grow
+    with the size of the file.
+
+    :param options: start / end passed to generate_crimes
+    :return: dict with ``rows``, ``path`` and ``format``
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"fmt must be one of {FORMATS}")
+
+    # One independent stream per chunk: the file depends on the seed and
+    # chunk size only
+    seeds = np.random.SeedSequence(seed).spawn(-(-n_rows // chunk_rows))
+    schema = pa.schema([
+        (name, pa.from_numpy_dtype(dtype) if dtype is not str else pa.string())
+        for name, dtype in CHICAGO_DTYPES.items()
+    ])
+    writer = pq.ParquetWriter(path, schema) if fmt == 'parquet' else None
+    try:
+        for i, chunk_seed in enumerate(seeds):
+            first = i * chunk_rows
+            chunk = generate_crimes(
+                min(chunk_rows, n_rows - first), seed=chunk_seed, first_id=first + 1, **options
+            )
+            if writer is not None:
+                writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            else:
+                chunk.to_csv(path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+    finally:
+        if writer is not None:
+            writer.close()
+    return {'rows': n_rows, 'path': str(path), 'format': fmt}
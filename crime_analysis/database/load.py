@@ -1,43 +1,541 @@
 # load_duckdb.py
+import datetime
 import os
 from typing import Optional
+import numpy as np
 import pandas as pd
-import duckdb
+import pyarrow as pa
+
+from .queries import connect
+
+
+# Processed frame column -> CrimeRecord field. 'date' comes from the index.
+COLUMN_MAP = {
+    'Primary Type': 'primary_type',
+    'Arrest': 'arrest',
+    'Domestic': 'domestic',
+    'Month': 'month',
+    'Hour': 'hour',
+    'Minute': 'minute',
+    'DayOfWeek': 'day_of_week',
+    'is_weekend': 'is_weekend',
+    'is_night': 'is_night',
+    'Season': 'season',
+    'is_violent_crime': 'is_violent_crime',
+    'crime_count': 'crime_count',
+    'lag_1h': 'lag_1h',
+    'lag_2h': 'lag_2h',
+    'lag_3h': 'lag_3h',
+    'lag_v_1h': 'lag_v_1h',
+    'lag_v_2h': 'lag_v_2h',
+    'lag_v_3h': 'lag_v_3h',
+    'rolling_3h': 'rolling_3h',
+    'rolling_v_3h': 'rolling_v_3h',
+    'Hour_sin': 'hour_sin',
+    'Hour_cos': 'hour_cos',
+    'Day_sin': 'day_sin',
+    'Day_cos': 'day_cos',
+    'primary_type_code': 'primary_type_code',
+}
+
+DEFAULT_BATCH_SIZE = 50_000
+
+# Loads at least this big, and at least INDEX_REBUILD_RATIO times the rows
+# already in the table, drop secondary indexes first and rebuild them after.
+# The rebuild covers the whole table, which all datasets share, so smaller
+# loads into a large table insert with the indexes in place.
+INDEX_REBUILD_MIN_ROWS = 100_000
+INDEX_REBUILD_RATIO = 1.0
+
+# Conflict clause that adds a row's counts to an existing hourly bucket
+_ROLLUP_UPSERT = {
+    "sqlite": (
+        "ON CONFLICT (dataset_id, hour, primary_type) DO UPDATE SET "
+        "crime_count = {table}.crime_count + excluded.crime_count, "
+        "violent_count = {table}.violent_count + excluded.violent_count"
+    ),
+    "mysql": (
+        "ON DUPLICATE KEY UPDATE "
+        "crime_count = crime_count + VALUES(crime_count), "
+        "violent_count = violent_count + VALUES(violent_count)"
+    ),
+}
+_ROLLUP_UPSERT["postgresql"] = _ROLLUP_UPSERT["sqlite"]
+
+
+def _frame_dates(df: pd.DataFrame) -> pd.DatetimeIndex:
+    if isinstance(df.index, pd.DatetimeIndex):
+        dates = df.index
+    elif "Date" in df.columns:
+        dates = pd.DatetimeIndex(df["Date"])
+    else:
+        raise ValueError("DataFrame must have a DateTime index or 'Date' column")
+    # Naive timestamps are UTC (settings.TIME_ZONE)
+    if dates.tz is None:
+        dates = dates.tz_localize("UTC")
+    return dates
+
+
+def _record_batches(df: pd.DataFrame, fields: list, batch_size: int, sqlite: bool,
+                   dataset_id: int = 0):
+    """
+    Yield lists of row tuples (ordered like ``fields``) with plain Python
+    values and None for missing ones, ``batch_size`` rows at a time.
+    """
+    dates = _frame_dates(df)
+    sources = {field: column for column, field in COLUMN_MAP.items() if column in df.columns}
+
+    for start in range(0, len(df), batch_size):
+        stop = min(start + batch_size, len(df))
+        columns = []
+        for field in fields:
+            if field == "date":
+                batch_dates = dates[start:stop]
+                if sqlite:
+                    # Same text format Django's SQLite backend stores
+                    values = np.char.replace(
+                        np.datetime_as_string(batch_dates.tz_convert(None).values, unit="s"), "T", " "
+                    ).tolist()
+                else:
+                    values = list(batch_dates.to_pydatetime())
+            elif field == "dataset_id":
+                values = [dataset_id] * (stop - start)
+            elif field in sources:
+                series = df[sources[field]].iloc[start:stop]
+                values = series.to_numpy(dtype=object)
+                values[series.isna().to_numpy()] = None
+                values = values.tolist()
+            else:
+                values = [None] * (stop - start)
+            columns.append(values)
+        yield list(zip(*columns))
+
+
+def _secondary_indexes(cursor, vendor: str, table: str) -> list:
+    """
+    (name, CREATE INDEX statement) for the table's non-unique indexes.
+    """
+    if vendor == "sqlite":
+        cursor.execute(
+            "SELECT name, sql FROM sqlite_master "
+            "WHERE type = 'index' AND tbl_name = %s AND sql IS NOT NULL",
+            [table],
+        )
+    elif vendor == "postgresql":
+        cursor.execute(
+            "SELECT indexname, indexdef FROM pg_indexes "
+            "WHERE tablename = %s AND indexdef NOT LIKE 'CREATE UNIQUE%%'",
+            [table],
+        )
+    else:
+        return []
+    return [(name, sql) for name, sql in cursor.fetchall() if "UNIQUE" not in sql.upper()]
+
+
+def _rebuild_indexes(rows: int, using: str) -> bool:
+    from .models import CrimeRecord
+
+    if rows < INDEX_REBUILD_MIN_ROWS:
+        return False
+    return rows >= INDEX_REBUILD_RATIO * CrimeRecord.objects.using(using).count()
+
+
+def save_to_db(
+    df: pd.DataFrame,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    using: Optional[str] = None,
+    summarize: bool = True,
+    dataset_id: int = 0,
+    replace: bool = False,
+) -> int:
+    """
+    Bulk-load a processed DataFrame into the CrimeRecord table.
+
+    Rows are tagged with ``dataset_id``. With ``replace`` the dataset's
+    existing rows (and its rollup and summary rows) are deleted first, in
+    the same transaction, so re-analysing a dataset does not duplicate
+    them; without it the rows are added to the dataset's.
+
+    All rows are inserted in one transaction, ``batch_size`` rows per
+    statement. On SQLite the rows go straight to ``executemany`` on the raw
+    connection with PRAGMAs tuned for bulk writes; other backends use
+    ``bulk_create``. The secondary indexes are dropped first and rebuilt
+    after the insert, in the same transaction, when the load has at least
+    INDEX_REBUILD_MIN_ROWS rows and at least INDEX_REBUILD_RATIO times the
+    rows already in the table (counted after a replace's delete): the
+    rebuild costs as much as the whole table, so it only pays off for an
+    empty or comparatively small table.
+
+    With ``summarize`` the load's counts are added to CrimeHourlyRollup and
+    the CrimeMonthlySummary rows of the months it touched are rebuilt, in
+    the same transaction.
+
+    :param df: processed DataFrame (DatetimeIndex or 'Date' column)
+    :param batch_size: rows per INSERT batch
+    :param using: database alias; defaults to 'default'
+    :param dataset_id: DatasetStore id of the rows; 0 for other loads
+    :param replace: replace the dataset's rows instead of adding to them
+    :return: number of inserted rows
+    """
+    from django.db import DEFAULT_DB_ALIAS, connections, transaction
+    from .models import CrimeHourlyRollup, CrimeMonthlySummary, CrimeRecord
+
+    using = using or DEFAULT_DB_ALIAS
+    connection = connections[using]
+    table = CrimeRecord._meta.db_table
+    fields = [f.column for f in CrimeRecord._meta.concrete_fields if not f.primary_key]
+    sqlite = connection.vendor == "sqlite"
+
+    if len(df) == 0 and not replace:
+        return 0
+
+    connection.ensure_connection()
+    # SQLite refuses to change the safety level inside a transaction, so
+    # the PRAGMAs only apply when the caller has not opened one
+    tune = sqlite and not connection.in_atomic_block
+    if tune:
+        raw = connection.connection
+        synchronous = raw.execute("PRAGMA synchronous").fetchone()[0]
+        temp_store = raw.execute("PRAGMA temp_store").fetchone()[0]
+        cache_size = raw.execute("PRAGMA cache_size").fetchone()[0]
+        raw.execute("PRAGMA synchronous = OFF")
+        raw.execute("PRAGMA temp_store = MEMORY")
+        raw.execute("PRAGMA cache_size = -262144")  # 256 MB page cache
+
+    try:
+        with transaction.atomic(using=using):
+            if replace:
+                # Before the indexes are dropped: the delete uses the dataset's
+                CrimeRecord.objects.using(using).filter(dataset_id=dataset_id).delete()
+
+            with connection.cursor() as cursor:
+                indexes = []
+                if _rebuild_indexes(len(df), using):
+                    indexes = _secondary_indexes(cursor, connection.vendor, table)
+                    for name, _ in indexes:
+                        cursor.execute(f"DROP INDEX {connection.ops.quote_name(name)}")
+
+                if sqlite:
+                    sql = "INSERT INTO {} ({}) VALUES ({})".format(
+                        connection.ops.quote_name(table),
+                        ", ".join(connection.ops.quote_name(f) for f in fields),
+                        ", ".join(["?"] * len(fields)),
+                    )
+                    raw_cursor = connection.connection.cursor()
+                    for rows in _record_batches(df, fields, batch_size, sqlite=True, dataset_id=dataset_id):
+                        raw_cursor.executemany(sql, rows)
+                    raw_cursor.close()
+                else:
+                    attnames = [CrimeRecord._meta.get_field(f).attname for f in fields]
+                    for rows in _record_batches(df, fields, batch_size, sqlite=False, dataset_id=dataset_id):
+                        CrimeRecord.objects.using(using).bulk_create(
+                            [CrimeRecord(**dict(zip(attnames, row))) for row in rows],
+                            batch_size=batch_size,
+                        )
+
+                for _, sql in indexes:
+                    cursor.execute(sql)
+
+            if summarize:
+                if replace:
+                    CrimeHourlyRollup.objects.using(using).filter(dataset_id=dataset_id).delete()
+                    CrimeMonthlySummary.objects.using(using).filter(dataset_id=dataset_id).delete()
+                if len(df):
+                    upsert_hourly_rollup(df, using=using, dataset_id=dataset_id)
+                    dates = _frame_dates(df)
+                    refresh_monthly_summary(dates.min(), dates.max(), using=using, dataset_id=dataset_id)
+    finally:
+        if tune:
+            raw.execute(f"PRAGMA synchronous = {int(synchronous)}")
+            raw.execute(f"PRAGMA temp_store = {int(temp_store)}")
+            # Shrinking the cache frees its pages; the connection outlives the load
+            raw.execute(f"PRAGMA cache_size = {int(cache_size)}")
+
+    return len(df)
+
+
+def delete_dataset_rows(dataset_id: int, using: Optional[str] = None) -> int:
+    """
+    Delete a dataset's CrimeRecord, CrimeHourlyRollup and
+    CrimeMonthlySummary rows in one transaction.
+
+    :return: number of deleted records
+    """
+    from django.db import DEFAULT_DB_ALIAS, transaction
+    from .models import CrimeHourlyRollup, CrimeMonthlySummary, CrimeRecord
+
+    using = using or DEFAULT_DB_ALIAS
+    with transaction.atomic(using=using):
+        deleted, _ = CrimeRecord.objects.using(using).filter(dataset_id=dataset_id).delete()
+        CrimeHourlyRollup.objects.using(using).filter(dataset_id=dataset_id).delete()
+        CrimeMonthlySummary.objects.using(using).filter(dataset_id=dataset_id).delete()
+    return deleted
+
+
+def _hourly_rollup(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    (hour, primary_type, crime_count, violent_count) of a processed frame,
+    one row per hour bucket and primary type.
+    """
+    rows = pd.DataFrame({
+        "hour": _frame_dates(df).tz_convert("UTC").floor("h"),
+        "primary_type": df["Primary Type"].to_numpy(dtype=object),
+        "violent": df["is_violent_crime"].to_numpy(dtype=np.int64),
+    })
+    return (
+        rows.groupby(["hour", "primary_type"], sort=False)["violent"]
+        .agg(crime_count="size", violent_count="sum")
+        .reset_index()
+    )
+
+
+def upsert_hourly_rollup(df: pd.DataFrame, using: Optional[str] = None,
+                         batch_size: int = DEFAULT_BATCH_SIZE, dataset_id: int = 0) -> int:
+    """
+    Add a processed frame's counts to a dataset's CrimeHourlyRollup rows.
+
+    The frame is aggregated in pandas first; each (hour, type) bucket is
+    then one INSERT that increments the stored counts when the bucket
+    already exists, so the cost follows the size of the load, not of the
+    table. Backends without an upsert in _ROLLUP_UPSERT merge the buckets
+    through the ORM instead (see _merge_hourly_rollup).
+
+    :return: number of buckets written
+    """
+    from django.db import DEFAULT_DB_ALIAS, connections
+    from .models import CrimeHourlyRollup
+
+    using = using or DEFAULT_DB_ALIAS
+    connection = connections[using]
+    rollup = _hourly_rollup(df)
+    if connection.vendor not in _ROLLUP_UPSERT:
+        return _merge_hourly_rollup(rollup, using, batch_size, dataset_id)
+
+    table = connection.ops.quote_name(CrimeHourlyRollup._meta.db_table)
+    sql = (
+        f"INSERT INTO {table} (dataset_id, hour, primary_type, crime_count, violent_count) "
+        f"VALUES (%s, %s, %s, %s, %s) " + _ROLLUP_UPSERT[connection.vendor].format(table=table)
+    )
+    hours = [
+        connection.ops.adapt_datetimefield_value(hour)
+        for hour in pd.DatetimeIndex(rollup["hour"]).to_pydatetime()
+    ]
+    rows = list(zip(
+        [dataset_id] * len(hours),
+        hours,
+        rollup["primary_type"].tolist(),
+        rollup["crime_count"].tolist(),
+        rollup["violent_count"].tolist(),
+    ))
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            cursor.executemany(sql, rows[start:start + batch_size])
+    return len(rows)
+
+
+def _merge_hourly_rollup(rollup: pd.DataFrame, using: str, batch_size: int, dataset_id: int) -> int:
+    """
+    ORM version of the rollup upsert: read the stored buckets in the
+    load's hour range (locked until the transaction ends), increment those
+    that exist and create the rest.
+    """
+    from django.db import transaction
+    from .models import CrimeHourlyRollup
+
+    if rollup.empty:
+        return 0
+    hours = pd.DatetimeIndex(rollup["hour"]).to_pydatetime()
+    with transaction.atomic(using=using):
+        stored = {
+            (bucket.hour, bucket.primary_type): bucket
+            for bucket in CrimeHourlyRollup.objects.using(using).select_for_update().filter(
+                dataset_id=dataset_id, hour__gte=hours.min(), hour__lte=hours.max(),
+            )
+        }
+        updated, created = [], []
+        for hour, primary_type, crime_count, violent_count in zip(
+            hours,
+            rollup["primary_type"].tolist(),
+            rollup["crime_count"].tolist(),
+            rollup["violent_count"].tolist(),
+        ):
+            bucket = stored.get((hour, primary_type))
+            if bucket is None:
+                created.append(CrimeHourlyRollup(
+                    dataset_id=dataset_id, hour=hour, primary_type=primary_type,
+                    crime_count=crime_count, violent_count=violent_count,
+                ))
+            else:
+                bucket.crime_count += crime_count
+                bucket.violent_count += violent_count
+                updated.append(bucket)
+        CrimeHourlyRollup.objects.using(using).bulk_update(
+            updated, ["crime_count", "violent_count"], batch_size=batch_size
+        )
+        CrimeHourlyRollup.objects.using(using).bulk_create(created, batch_size=batch_size)
+    return len(rollup)
+
+
+def _utc(value) -> pd.Timestamp:
+    ts = pd.Timestamp(value)
+    return ts.tz_convert("UTC") if ts.tz is not None else ts.tz_localize("UTC")
+
+
+def _month_start(ts: pd.Timestamp) -> datetime.date:
+    return datetime.date(ts.year, ts.month, 1)
+
+
+def _month_start_utc(month: datetime.date) -> datetime.datetime:
+    return datetime.datetime(month.year, month.month, 1, tzinfo=datetime.timezone.utc)
+
+
+def refresh_monthly_summary(start, end, using: Optional[str] = None, dataset_id: int = 0) -> int:
+    """
+    Rebuild a dataset's CrimeMonthlySummary for every month from ``start``
+    to ``end`` (inclusive, UTC) with one GROUP BY over those months' records.
+
+    :return: number of summary rows written
+    """
+    from django.db import DEFAULT_DB_ALIAS, transaction
+    from django.db.models import Count, DateField, Q
+    from django.db.models.functions import TruncMonth
+    from .models import CrimeMonthlySummary, CrimeRecord
+
+    using = using or DEFAULT_DB_ALIAS
+    first = _month_start(_utc(start))
+    stop = _month_start(_utc(end) + pd.offsets.MonthBegin(1))
+
+    groups = (
+        CrimeRecord.objects.using(using)
+        .filter(dataset_id=dataset_id, date__gte=_month_start_utc(first), date__lt=_month_start_utc(stop))
+        .annotate(period=TruncMonth("date", output_field=DateField()))
+        .values("period", "primary_type", "is_violent_crime")
+        .annotate(crime_count=Count("id"), arrest_count=Count("id", filter=Q(arrest=True)))
+        .order_by()
+    )
+    with transaction.atomic(using=using):
+        CrimeMonthlySummary.objects.using(using).filter(
+            dataset_id=dataset_id, month__gte=first, month__lt=stop
+        ).delete()
+        summaries = CrimeMonthlySummary.objects.using(using).bulk_create(
+            [CrimeMonthlySummary(dataset_id=dataset_id, month=row.pop("period"), **row) for row in groups]
+        )
+    return len(summaries)
+
+
+def _duckdb_quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _duckdb_table_exists(con, table_name: str) -> bool:
+    return bool(con.execute(
+        "SELECT count(*) FROM information_schema.tables WHERE table_name = ?",
+        [table_name],
+    ).fetchone()[0])
+
+
+def _arrow_columns(df: pd.DataFrame) -> pa.Table:
+    """
+    The frame as an Arrow table with its dates in a 'date' column.
+
+    Numeric columns share the frame's buffers; booleans, strings and
+    categoricals are converted. Categoricals are
+    decoded to plain values, since DuckDB would make them ENUMs fixed to
+    this batch's categories.
+    """
+    if isinstance(df.index, pd.DatetimeIndex):
+        dates, columns = df.index, df.columns
+    elif "Date" in df.columns:
+        dates, columns = df["Date"], df.columns.drop("Date")
+    else:
+        raise ValueError("DataFrame must have a DateTime index or 'Date' column")
+
+    arrays = {"date": pa.Array.from_pandas(dates)}
+    for col in columns:
+        array = pa.Array.from_pandas(df[col])
+        if pa.types.is_dictionary(array.type):
+            array = array.dictionary_decode()
+        arrays[col] = array
+    return pa.table(arrays)
 
 
 def save_to_duckdb(
     df: pd.DataFrame,
     db_path: Optional[str] = None,
     table_name: str = "crime_records",
-    if_exists: str = "append"
+    if_exists: str = "append",
+    rollup_table: Optional[str] = "crime_hourly",
 ) -> int:
     """
     Save preprocessed DataFrame into DuckDB.
 
+    The frame's columns are wrapped in an Arrow table (see _arrow_columns)
+    that DuckDB scans in place, and inserted with a single
+    ``INSERT ... SELECT``, so the load runs inside DuckDB's vectorized
+    engine instead of row by row and the frame is never copied.
+
+    ``rollup_table`` holds crime and violent counts per hour and primary
+    type. Appends add the new rows' counts to it with one upsert; it is
+    rebuilt from the full table when it is replaced or does not exist yet.
+
+    The load is one transaction. Opening the file waits for other
+    processes' connections to it to close (see queries.connect).
+
     :param df: preprocessed DataFrame (index should be datetime or include 'Date' column)
     :param db_path: path to DuckDB file; defaults to in-memory if None
     :param table_name: target table name in DuckDB
     :param if_exists: 'replace', 'append', or 'fail'
+    :param rollup_table: hourly rollup table name; None to skip it
     :return: number of inserted rows
     """
+    if if_exists not in ("replace", "append", "fail"):
+        raise ValueError("if_exists must be 'replace', 'append' or 'fail'")
+
     db_path = db_path or ":memory:"  # in-memory if not specified
+    incoming = _arrow_columns(df)
 
-    # Connect to DuckDB
-    con = duckdb.connect(database=db_path)
+    # Connect to DuckDB; one transaction, so a failed load leaves the file
+    # as it was (closing the connection rolls it back)
+    con = connect(db_path)
+    try:
+        con.register("incoming", incoming)
+        con.begin()
+        exists = _duckdb_table_exists(con, table_name)
+        quoted = _duckdb_quote(table_name)
 
-    # Reset index if it's a datetime index and ensure column name is 'date'
-    if isinstance(df.index, pd.DatetimeIndex):
-        df = df.reset_index().rename(columns={"index": "date"})
-    elif "Date" in df.columns:
-        df = df.rename(columns={"Date": "date"})
-    else:
-        raise ValueError("DataFrame must have a DateTime index or 'Date' column")
+        if exists and if_exists == "fail":
+            raise ValueError(f"Table {table_name} already exists")
+        created = not exists or if_exists == "replace"
+        if created:
+            con.execute(f"CREATE OR REPLACE TABLE {quoted} AS SELECT * FROM incoming")
+        else:
+            con.execute(f"INSERT INTO {quoted} BY NAME SELECT * FROM incoming")
 
-    # DuckDB can infer types automatically, so we can just use to_sql
-    df.to_sql(table_name, con, if_exists=if_exists, index=False)
+        if rollup_table:
+            rollup = _duckdb_quote(rollup_table)
+            source = "incoming"
+            if created or not _duckdb_table_exists(con, rollup_table):
+                con.execute(
+                    f"CREATE OR REPLACE TABLE {rollup} ("
+                    f'hour TIMESTAMP, "Primary Type" VARCHAR, '
+                    f'crime_count BIGINT, violent_count BIGINT, UNIQUE (hour, "Primary Type"))'
+                )
+                source = quoted
+            con.execute(
+                f"INSERT INTO {rollup} "
+                f"SELECT date_trunc('hour', date) AS hour, \"Primary Type\", "
+                f"count(*), sum(is_violent_crime::INTEGER) "
+                f"FROM {source} GROUP BY ALL "
+                f'ON CONFLICT (hour, "Primary Type") DO UPDATE SET '
+                f"crime_count = crime_count + excluded.crime_count, "
+                f"violent_count = violent_count + excluded.violent_count"
+            )
+        con.commit()
+        con.unregister("incoming")
+    finally:
+        con.close()
 
-    inserted_rows = len(df)
-    con.close()
+    inserted_rows = incoming.num_rows
     return inserted_rows
 
 
@@ -47,4 +545,3 @@ if __name__ == "__main__":
     # preprocess df as before...
     n = save_to_duckdb(df, db_path="chicago_crimes.duckdb")
     print(f"Inserted {n} rows into DuckDB")
-
@@ -0,0 +1,123 @@
+import time
+
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, models, transaction
+from django.db.models import Count, DateField
+from django.db.models.functions import TruncMonth
+
+from crime_analysis.database.load import COLUMN_MAP, save_to_db
+from crime_analysis.database.models import CrimeMonthlySummary, CrimeRecord
+from crime_analysis.database.records import filter_records
+
+
+# Single-column indexes of the layout before migration 0002 (each was
+# declared twice, through db_index and Meta.indexes)
+LEGACY_INDEXES = [
+    models.Index(fields=[field], name=f"legacy_{field}_{copy}_idx")
+    for field in ("date", "primary_type", "is_violent_crime")
+    for copy in (1, 2)
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the common CrimeRecord queries and a bulk insert against the "
+        "current indexes and, with --legacy, the single-column layout they "
+        "replaced. Everything runs in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=5, help="Runs per query; the best is reported")
+        parser.add_argument("--insert-rows", type=int, default=10_000, help="Rows in the insert benchmark")
+        parser.add_argument("--legacy", action="store_true", help="Also benchmark the legacy indexes")
+        parser.add_argument("--explain", action="store_true", help="Print the query plans")
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        using = options["database"]
+        records = CrimeRecord.objects.using(using)
+        if not records.exists():
+            raise CommandError("CrimeRecord is empty; load a dataset first")
+
+        # "Violent crimes of type X between dates" for the most common type
+        # over the middle half of the history
+        primary_type = (
+            records.values("primary_type").annotate(n=Count("id")).order_by("-n")[0]["primary_type"]
+        )
+        first = records.order_by("date").values_list("date", flat=True)[0]
+        last = records.order_by("-date").values_list("date", flat=True)[0]
+        span = last - first
+        start, end = first + span / 4, last - span / 4
+
+        queries = {
+            "violent type between dates": lambda: filter_records(
+                start, end, types=[primary_type], violent=True, using=using
+            ),
+            "violent between dates": lambda: filter_records(start, end, violent=True, using=using),
+            "monthly counts (records)": lambda: (
+                records.annotate(period=TruncMonth("date", output_field=DateField()))
+                .values("period", "primary_type", "is_violent_crime")
+                .annotate(n=Count("id"))
+                .order_by()
+            ),
+            "monthly counts (summary)": lambda: (
+                CrimeMonthlySummary.objects.using(using)
+                .values("month", "primary_type", "is_violent_crime", "crime_count")
+            ),
+        }
+        insert_frame = self._insert_frame(records, options["insert_rows"])
+
+        layouts = ["current"] + (["legacy"] if options["legacy"] else [])
+        timings = {}
+        with transaction.atomic(using=using):
+            for layout in layouts:
+                if layout == "legacy":
+                    self._use_legacy_indexes(connections[using])
+                timings[layout] = self._run(queries, insert_frame, using, options)
+            transaction.set_rollback(True, using=using)
+
+        self.stdout.write(f"\n{records.count():,} records; type={primary_type!r}, {start:%Y-%m-%d} to {end:%Y-%m-%d}")
+        header = f"{'benchmark':32}" + "".join(f"{layout:>12}" for layout in layouts)
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+        for name in timings["current"]:
+            self.stdout.write(
+                f"{name:32}" + "".join(f"{timings[layout][name] * 1000:>10.1f}ms" for layout in layouts)
+            )
+
+    def _insert_frame(self, records, n_rows: int) -> pd.DataFrame:
+        # Existing rows in the processed-frame shape save_to_db() takes
+        fields = ["date", *COLUMN_MAP.values()]
+        rows = list(records.order_by("date", "id").values(*fields)[:n_rows])
+        frame = pd.DataFrame.from_records(rows, columns=fields).set_index("date")
+        return frame.rename(columns={field: column for column, field in COLUMN_MAP.items()})
+
+    def _use_legacy_indexes(self, connection):
+        editor = connection.schema_editor()
+        with connection.cursor() as cursor:
+            for index in CrimeRecord._meta.indexes:
+                cursor.execute(f"DROP INDEX {connection.ops.quote_name(index.name)}")
+            for index in LEGACY_INDEXES:
+                cursor.execute(str(index.create_sql(CrimeRecord, editor)))
+
+    def _run(self, queries: dict, insert_frame: pd.DataFrame, using: str, options) -> dict:
+        timings = {}
+        for name, query in queries.items():
+            if options["explain"]:
+                self.stdout.write(f"\n{name}:\n{query().explain()}")
+            best = float("inf")
+            for _ in range(options["repeat"]):
+                started = time.perf_counter()
+                for _ in query().iterator(chunk_size=5000):
+                    pass
+                best = min(best, time.perf_counter() - started)
+            timings[name] = best
+
+        # One insert per layout: repeating it would time a growing table
+        sid = transaction.savepoint(using=using)
+        started = time.perf_counter()
+        save_to_db(insert_frame, using=using)
+        timings[f"insert {len(insert_frame):,} rows"] = time.perf_counter() - started
+        transaction.savepoint_rollback(sid, using=using)
+        return timings
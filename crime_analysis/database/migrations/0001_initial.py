@@ -0,0 +1,49 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CrimeRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateTimeField(db_index=True)),
+                ('primary_type', models.CharField(db_index=True, max_length=100)),
+                ('arrest', models.BooleanField(null=True)),
+                ('domestic', models.BooleanField(null=True)),
+                ('month', models.IntegerField(null=True)),
+                ('hour', models.IntegerField(null=True)),
+                ('minute', models.IntegerField(null=True)),
+                ('day_of_week', models.IntegerField(null=True)),
+                ('is_weekend', models.BooleanField(null=True)),
+                ('is_night', models.BooleanField(null=True)),
+                ('season', models.IntegerField(null=True)),
+                ('is_violent_crime', models.BooleanField(db_index=True)),
+                ('crime_count', models.IntegerField(null=True)),
+                ('lag_1h', models.FloatField(null=True)),
+                ('lag_2h', models.FloatField(null=True)),
+                ('lag_3h', models.FloatField(null=True)),
+                ('lag_v_1h', models.FloatField(null=True)),
+                ('lag_v_2h', models.FloatField(null=True)),
+                ('lag_v_3h', models.FloatField(null=True)),
+                ('rolling_3h', models.FloatField(null=True)),
+                ('rolling_v_3h', models.FloatField(null=True)),
+                ('hour_sin', models.FloatField(null=True)),
+                ('hour_cos', models.FloatField(null=True)),
+                ('day_sin', models.FloatField(null=True)),
+                ('day_cos', models.FloatField(null=True)),
+                ('primary_type_code', models.IntegerField(db_index=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date'], name='database_cr_date_ea9967_idx'), models.Index(fields=['primary_type'], name='database_cr_primary_866e4a_idx'), models.Index(fields=['is_violent_crime'], name='database_cr_is_viol_cb7ad5_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,97 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CrimeMonthlySummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('primary_type', models.CharField(max_length=100)),
+                ('is_violent_crime', models.BooleanField()),
+                ('crime_count', models.PositiveIntegerField()),
+                ('arrest_count', models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='crimerecord',
+            name='database_cr_date_ea9967_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='crimerecord',
+            name='database_cr_primary_866e4a_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='crimerecord',
+            name='database_cr_is_viol_cb7ad5_idx',
+        ),
+        migrations.AlterField(
+            model_name='crimerecord',
+            name='date',
+            field=models.DateTimeField(),
+        ),
+        migrations.AlterField(
+            model_name='crimerecord',
+            name='day_of_week',
+            field=models.SmallIntegerField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='crimerecord',
+            name='hour',
+            field=models.SmallIntegerField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='crimerecord',
+            name='is_violent_crime',
+            field=models.BooleanField(),
+        ),
+        migrations.AlterField(
+            model_name='crimerecord',
+            name='minute',
+            field=models.SmallIntegerField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='crimerecord',
+            name='month',
+            field=models.SmallIntegerField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='crimerecord',
+            name='primary_type',
+            field=models.CharField(max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='crimerecord',
+            name='primary_type_code',
+            field=models.SmallIntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='crimerecord',
+            name='season',
+            field=models.SmallIntegerField(null=True),
+        ),
+        migrations.AddIndex(
+            model_name='crimerecord',
+            index=models.Index(fields=['date', 'id'], name='crime_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='crimerecord',
+            index=models.Index(fields=['primary_type', 'is_violent_crime', 'date'], name='crime_type_violent_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='crimerecord',
+            index=models.Index(fields=['is_violent_crime', 'date'], name='crime_violent_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='crimemonthlysummary',
+            constraint=models.UniqueConstraint(fields=('month', 'primary_type', 'is_violent_crime'), name='crime_monthly_summary_key'),
+        ),
+    ]
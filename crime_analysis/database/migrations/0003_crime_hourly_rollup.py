@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database', '0002_crime_record_layout'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CrimeHourlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('primary_type', models.CharField(max_length=100)),
+                ('crime_count', models.PositiveIntegerField()),
+                ('violent_count', models.PositiveIntegerField()),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('hour', 'primary_type'), name='crime_hourly_rollup_key')],
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.8 on 2026-10-18 18:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database', '0003_crime_hourly_rollup'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='crimehourlyrollup',
+            name='crime_hourly_rollup_key',
+        ),
+        migrations.RemoveConstraint(
+            model_name='crimemonthlysummary',
+            name='crime_monthly_summary_key',
+        ),
+        migrations.AddField(
+            model_name='crimehourlyrollup',
+            name='dataset_id',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='crimemonthlysummary',
+            name='dataset_id',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='crimerecord',
+            name='dataset_id',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='crimerecord',
+            index=models.Index(fields=['dataset_id', 'date', 'id'], name='crime_dataset_date_id_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='crimehourlyrollup',
+            constraint=models.UniqueConstraint(fields=('dataset_id', 'hour', 'primary_type'), name='crime_hourly_rollup_key'),
+        ),
+        migrations.AddConstraint(
+            model_name='crimemonthlysummary',
+            constraint=models.UniqueConstraint(fields=('dataset_id', 'month', 'primary_type', 'is_violent_crime'), name='crime_monthly_summary_key'),
+        ),
+    ]
@@ -5,24 +5,28 @@ class CrimeRecord(models.Model):
     Store preprocessed and feature-engineered crime records.
     Raw CSV/Parquet files are NOT stored in the DB.
     """
+    # DatasetStore id the rows were loaded from; 0 for loads not tied to a
+    # stored dataset
+    dataset_id = models.PositiveIntegerField(default=0)
+
     # Original raw fields (after preprocessing)
-    date = models.DateTimeField(db_index=True)
-    primary_type = models.CharField(max_length=100, db_index=True)
+    date = models.DateTimeField()
+    primary_type = models.CharField(max_length=100)
     arrest = models.BooleanField(null=True)
     domestic = models.BooleanField(null=True)
 
     # Metadata / engineered features
-    month = models.IntegerField(null=True)
-    hour = models.IntegerField(null=True)
-    minute = models.IntegerField(null=True)
-    day_of_week = models.IntegerField(null=True)
+    month = models.SmallIntegerField(null=True)
+    hour = models.SmallIntegerField(null=True)
+    minute = models.SmallIntegerField(null=True)
+    day_of_week = models.SmallIntegerField(null=True)
 
     is_weekend = models.BooleanField(null=True)
     is_night = models.BooleanField(null=True)
-    season = models.IntegerField(null=True)  # encoded 0..3
+    season = models.SmallIntegerField(null=True)  # encoded 0..3
 
     # Target variable
-    is_violent_crime = models.BooleanField(db_index=True)
+    is_violent_crime = models.BooleanField()
 
     # Time-series features
     crime_count = models.IntegerField(null=True)
@@ -44,15 +48,71 @@ class CrimeRecord(models.Model):
     day_cos = models.FloatField(null=True)
 
     # Encoded primary type
-    primary_type_code = models.IntegerField(db_index=True)
+    primary_type_code = models.SmallIntegerField()
 
     class Meta:
+        # Matched to the query patterns; each index also serves its
+        # leading columns, so there are no separate single-column ones.
         indexes = [
-            models.Index(fields=['date']),
-            models.Index(fields=['primary_type']),
-            models.Index(fields=['is_violent_crime']),
+            # Date ranges, and keyset pagination on (date, id)
+            models.Index(fields=['date', 'id'], name='crime_date_id_idx'),
+            # "Violent crimes of type X between dates"
+            models.Index(fields=['primary_type', 'is_violent_crime', 'date'], name='crime_type_violent_date_idx'),
+            # Violent crimes of any type between dates
+            models.Index(fields=['is_violent_crime', 'date'], name='crime_violent_date_idx'),
+            # One dataset's rows: replaced on re-analysis, and its date ranges
+            models.Index(fields=['dataset_id', 'date', 'id'], name='crime_dataset_date_id_idx'),
         ]
 
     def __str__(self):
         return f"{self.date} - {self.primary_type}"
 
+
+class CrimeMonthlySummary(models.Model):
+    """
+    Crime counts per dataset, month, primary type and violent flag, kept in
+    step with CrimeRecord by save_to_db(). Month-level questions read a few
+    hundred rows here instead of scanning the records.
+    """
+    dataset_id = models.PositiveIntegerField(default=0)
+    month = models.DateField()  # first day of the month (UTC)
+    primary_type = models.CharField(max_length=100)
+    is_violent_crime = models.BooleanField()
+    crime_count = models.PositiveIntegerField()
+    arrest_count = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dataset_id', 'month', 'primary_type', 'is_violent_crime'],
+                name='crime_monthly_summary_key',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.month:%Y-%m} - {self.primary_type}: {self.crime_count}"
+
+
+
+class CrimeHourlyRollup(models.Model):
+    """
+    Crime and violent-crime counts per dataset, hour and primary type,
+    incremented by save_to_db() on every load. Hourly and daily series read
+    this instead of re-aggregating the records.
+    """
+    dataset_id = models.PositiveIntegerField(default=0)
+    hour = models.DateTimeField()  # start of the hour bucket
+    primary_type = models.CharField(max_length=100)
+    crime_count = models.PositiveIntegerField()
+    violent_count = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dataset_id', 'hour', 'primary_type'],
+                name='crime_hourly_rollup_key',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.hour:%Y-%m-%d %H:00} - {self.primary_type}: {self.crime_count}"
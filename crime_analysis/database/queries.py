@@ -0,0 +1,312 @@
+"""
+Dashboard aggregates over the per-dataset DuckDB file written by
+save_to_duckdb().
+
+All filters (date range, primary types) are applied in the WHERE clause, so
+DuckDB prunes row groups by their min/max date instead of scanning the whole
+table, and only the aggregated rows come back to Python.
+
+Every aggregate here is a sum of hourly counts, so when the date range falls
+on hour boundaries it is read from the hourly rollup table, which is orders
+of magnitude smaller than the records. Files written before the rollup
+existed fall back to the records.
+"""
+import datetime
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Optional, Sequence
+
+import duckdb
+import pandas as pd
+
+
+TABLE_NAME = "crime_records"
+HOURLY_TABLE = "crime_hourly"
+
+# Open read-only connections kept per process
+MAX_CONNECTIONS = 16
+
+# Pooled connections unused for this long are closed. Each holds a shared
+# lock on its file, and a job appending to the file in place needs it
+# released.
+IDLE_SECONDS = 1.0
+
+# How long to wait for a lock held by another process's connection
+LOCK_TIMEOUT = 30.0
+
+FREQUENCIES = ("day", "hour")
+
+
+def connect(db_path, read_only: bool = False, timeout: float = LOCK_TIMEOUT) -> duckdb.DuckDBPyConnection:
+    """
+    Open a DuckDB file, waiting up to ``timeout`` seconds while another
+    process holds a conflicting lock on it (DuckDB allows one writing
+    process or any number of reading ones).
+    """
+    deadline = time.monotonic() + timeout
+    delay = 0.01
+    while True:
+        try:
+            return duckdb.connect(os.fspath(db_path), read_only=read_only)
+        except duckdb.IOException as exc:
+            if "lock" not in str(exc) or time.monotonic() + delay > deadline:
+                raise
+        time.sleep(delay)
+        delay = min(delay * 2, 0.25)
+
+
+class _Connection:
+
+    def __init__(self, identity, con):
+        self.identity = identity
+        self.con = con
+        self.users = 0
+        self.last_used = time.monotonic()
+        self.retired = False
+
+
+class _ConnectionPool:
+    """
+    Read-only DuckDB connections, one per file, shared by all threads.
+
+    Each query runs on its own cursor. A file that has been replaced on disk
+    (new inode or mtime) is reopened, and the least recently used
+    connections are closed beyond ``max_connections``. Connections idle for
+    ``idle_seconds`` are closed by a background thread, so that processes
+    that stopped querying a file do not keep writers out of it.
+    """
+
+    def __init__(self, max_connections: int = MAX_CONNECTIONS, idle_seconds: float = IDLE_SECONDS):
+        self.max_connections = max_connections
+        self.idle_seconds = idle_seconds
+        self._connections = OrderedDict()
+        self._lock = threading.Lock()
+        self._sweeper = None
+
+    @contextmanager
+    def cursor(self, db_path):
+        db_path = os.fspath(db_path)
+        stat = os.stat(db_path)
+        identity = (stat.st_ino, stat.st_mtime_ns)
+
+        with self._lock:
+            entry = self._checkout(db_path, identity)
+        if entry is None:
+            # Outside the lock: it may wait for a writer
+            con = connect(db_path, read_only=True)
+            with self._lock:
+                entry = self._checkout(db_path, identity)
+                if entry is None:
+                    entry = self._connections[db_path] = _Connection(identity, con)
+                    entry.users += 1
+                    con = None
+                while len(self._connections) > self.max_connections:
+                    self._retire(next(iter(self._connections)))
+                self._start_sweeper()
+            if con is not None:
+                con.close()
+
+        cur = entry.con.cursor()
+        try:
+            yield cur
+        finally:
+            cur.close()
+            with self._lock:
+                entry.users -= 1
+                entry.last_used = time.monotonic()
+                if entry.retired and not entry.users:
+                    entry.con.close()
+
+    def close(self, db_path):
+        """
+        Close this process's connection to a file (once its queries end).
+        """
+        db_path = os.fspath(db_path)
+        with self._lock:
+            if db_path in self._connections:
+                self._retire(db_path)
+
+    def close_all(self):
+        with self._lock:
+            for db_path in list(self._connections):
+                self._retire(db_path)
+
+    def _checkout(self, db_path: str, identity):
+        # Called with the lock held
+        entry = self._connections.get(db_path)
+        if entry is not None and entry.identity != identity:
+            self._retire(db_path)
+            entry = None
+        if entry is not None:
+            entry.users += 1
+            self._connections.move_to_end(db_path)
+        return entry
+
+    def _retire(self, db_path: str):
+        # Called with the lock held; connections in use close when released
+        entry = self._connections.pop(db_path)
+        entry.retired = True
+        if not entry.users:
+            entry.con.close()
+
+    def _start_sweeper(self):
+        if self._sweeper is None:
+            self._sweeper = threading.Thread(target=self._sweep, name="duckdb-pool-sweeper", daemon=True)
+            self._sweeper.start()
+
+    def _sweep(self):
+        while True:
+            time.sleep(self.idle_seconds)
+            with self._lock:
+                now = time.monotonic()
+                for db_path, entry in list(self._connections.items()):
+                    if not entry.users and now - entry.last_used >= self.idle_seconds:
+                        self._retire(db_path)
+                if not self._connections:
+                    self._sweeper = None
+                    return
+
+
+POOL = _ConnectionPool()
+
+
+def _naive_utc(value):
+    # Stored dates are naive UTC timestamps
+    if isinstance(value, datetime.datetime) and value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _on_hour(value) -> bool:
+    value = _naive_utc(value)
+    if not isinstance(value, datetime.datetime):
+        return True  # None, or a date (midnight)
+    return value.minute == value.second == value.microsecond == 0
+
+
+def _where(start=None, end=None, types: Optional[Sequence[str]] = None, column: str = "date"):
+    """
+    WHERE clause and parameters for the common filters. ``end`` is exclusive.
+    """
+    clauses, params = [], []
+    if start is not None:
+        clauses.append(f"{column} >= ?")
+        params.append(_naive_utc(start))
+    if end is not None:
+        clauses.append(f"{column} < ?")
+        params.append(_naive_utc(end))
+    if types:
+        clauses.append('"Primary Type" IN ({})'.format(", ".join(["?"] * len(types))))
+        params.extend(types)
+    sql = " WHERE " + " AND ".join(clauses) if clauses else ""
+    return sql, params
+
+
+def _fetch(db_path, sql: str, params: list) -> list:
+    with POOL.cursor(db_path) as cur:
+        return cur.execute(sql, params).fetchall()
+
+
+# (table, time column, crime count, violent count) of each source
+_RECORDS = (TABLE_NAME, "date", "count(*)", "sum(is_violent_crime::INTEGER)")
+_ROLLUP = (HOURLY_TABLE, "hour", "sum(crime_count)", "sum(violent_count)")
+
+
+def _aggregate(db_path, sql: str, start=None, end=None, types=None, **fields) -> list:
+    """
+    Run an aggregate on the hourly rollup when the range allows it, else
+    on the records.
+
+    ``sql`` is formatted with {table}, {time}, {count}, {violent} and
+    {where} for the chosen source, plus ``fields``.
+    """
+    sources = [_ROLLUP, _RECORDS] if _on_hour(start) and _on_hour(end) else [_RECORDS]
+    for table, time, count, violent in sources:
+        where, params = _where(start, end, types, column=time)
+        query = sql.format(table=table, time=time, count=count, violent=violent, where=where, **fields)
+        try:
+            return _fetch(db_path, query, params)
+        except duckdb.CatalogException:
+            if table == TABLE_NAME:
+                raise
+
+
+def crime_counts(db_path, freq: str = "day", start=None, end=None, types=None) -> list:
+    """
+    Crimes and violent crimes per day or hour.
+
+    :return: [{"bucket", "count", "violent"}], oldest first
+    """
+    if freq not in FREQUENCIES:
+        raise ValueError(f"freq must be one of {FREQUENCIES}")
+    rows = _aggregate(
+        db_path,
+        "SELECT date_trunc('{freq}', {time}) AS bucket, {count}, {violent} "
+        "FROM {table}{where} GROUP BY bucket ORDER BY bucket",
+        start, end, types, freq=freq,
+    )
+    return [
+        {"bucket": bucket.isoformat(), "count": count, "violent": int(violent)}
+        for bucket, count, violent in rows
+    ]
+
+
+def violent_share_by_type(db_path, start=None, end=None, types=None) -> list:
+    """
+    Share of violent crimes within each primary type.
+
+    :return: [{"primary_type", "count", "violent", "share"}], most frequent first
+    """
+    rows = _aggregate(
+        db_path,
+        'SELECT "Primary Type", {count} AS n, {violent} '
+        'FROM {table}{where} GROUP BY "Primary Type" ORDER BY n DESC, "Primary Type"',
+        start, end, types,
+    )
+    return [
+        {
+            "primary_type": primary_type,
+            "count": count,
+            "violent": int(violent),
+            "share": violent / count,
+        }
+        for primary_type, count, violent in rows
+    ]
+
+
+def hour_of_week(db_path, start=None, end=None, types=None) -> list:
+    """
+    7 x 24 matrix of crime counts; rows are days (Monday first), columns
+    hours of the day.
+    """
+    rows = _aggregate(
+        db_path,
+        "SELECT isodow({time}) - 1 AS dow, hour({time}) AS hr, {count} "
+        "FROM {table}{where} GROUP BY dow, hr",
+        start, end, types,
+    )
+    matrix = [[0] * 24 for _ in range(7)]
+    for dow, hr, count in rows:
+        matrix[dow][hr] = count
+    return matrix
+
+
+def hourly_rollup(db_path, start=None, end=None, types=None) -> pd.DataFrame:
+    """
+    Crimes and violent crimes per hour, as a frame with a DatetimeIndex
+    and crime_count / violent_count columns. Hours without crimes are
+    absent.
+    """
+    # Not aliased "hour": the records table has an "Hour" column, which
+    # GROUP BY would pick instead
+    rows = _aggregate(
+        db_path,
+        "SELECT date_trunc('hour', {time}) AS bucket, {count}, {violent} "
+        "FROM {table}{where} GROUP BY bucket ORDER BY bucket",
+        start, end, types,
+    )
+    frame = pd.DataFrame(rows, columns=["hour", "crime_count", "violent_count"])
+    return frame.set_index(pd.DatetimeIndex(frame.pop("hour")))
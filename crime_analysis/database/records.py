@@ -0,0 +1,99 @@
+import base64
+import binascii
+import datetime
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from .models import CrimeRecord
+
+
+# Columns returned by the records API
+RECORD_FIELDS = (
+    "id", "dataset_id", "date", "primary_type", "arrest", "domestic",
+    "month", "hour", "minute", "day_of_week", "is_weekend", "is_night", "season",
+    "is_violent_crime", "primary_type_code",
+)
+
+# Rows fetched per query when streaming a whole result set
+STREAM_BATCH_SIZE = 5000
+
+
+def encode_cursor(row: dict) -> str:
+    """
+    Opaque cursor pointing just after ``row`` in (date, id) order.
+    """
+    raw = f"{row['date'].isoformat()}|{row['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    """
+    :return: (date, id)
+    :raises ValueError: malformed cursor
+    """
+    try:
+        date, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        date = parse_datetime(date)
+        if date is None:
+            raise ValueError
+        return date, int(pk)
+    except (ValueError, UnicodeDecodeError, binascii.Error):
+        raise ValueError("Invalid cursor")
+
+
+def filter_records(start=None, end=None, types=None, violent=None, using=None, dataset_id=None):
+    """
+    Records in [start, end) of the given dataset, primary types and violent
+    flag, projected to RECORD_FIELDS as dicts (no model instances), in
+    (date, id) order.
+    """
+    qs = CrimeRecord.objects.using(using) if using else CrimeRecord.objects.all()
+    if dataset_id is not None:
+        qs = qs.filter(dataset_id=dataset_id)
+    if start is not None:
+        qs = qs.filter(date__gte=start)
+    if end is not None:
+        qs = qs.filter(date__lt=end)
+    if types:
+        qs = qs.filter(primary_type__in=types)
+    if violent is not None:
+        # "= 1" rather than Django's bare-column boolean test, which SQLite
+        # cannot match against the (..., is_violent_crime, date) indexes
+        qs = qs.filter(is_violent_crime__in=[violent])
+    return qs.order_by("date", "id").values(*RECORD_FIELDS)
+
+
+def after_cursor(qs, date: datetime.datetime, pk: int):
+    """
+    Keyset condition: rows strictly after (date, pk). Served by the date
+    index, so page N costs the same as page 1.
+    """
+    return qs.filter(Q(date__gt=date) | Q(date=date, id__gt=pk))
+
+
+def keyset_page(qs, cursor: str = None, limit: int = 1000):
+    """
+    :return: (rows, next cursor or None when this is the last page)
+    """
+    if cursor:
+        qs = after_cursor(qs, *decode_cursor(cursor))
+    rows = list(qs[:limit + 1])
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1])
+
+
+def iter_records(qs, batch_size: int = STREAM_BATCH_SIZE):
+    """
+    Every row of ``qs``, fetched in keyset batches so memory and per-query
+    cost stay flat however many rows are streamed.
+    """
+    batch = list(qs[:batch_size])
+    while batch:
+        yield from batch
+        if len(batch) < batch_size:
+            return
+        last = batch[-1]
+        batch = list(after_cursor(qs, last["date"], last["id"])[:batch_size])
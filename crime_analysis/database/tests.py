@@ -1,3 +1,319 @@
-from django.test import TestCase
+import datetime
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import duckdb
+import numpy as np
+import pandas as pd
+from django.test import SimpleTestCase, TestCase
+
+from crime_analysis.benchmarks.synthetic import generate_crimes
+from crime_analysis.processing.dtypes import compact_dtypes
+from crime_analysis.processing.incremental import build_features
+from . import load, queries
+from .load import save_to_db, save_to_duckdb
+from .records import decode_cursor, encode_cursor, filter_records, iter_records, keyset_page
+from .models import CrimeHourlyRollup, CrimeMonthlySummary, CrimeRecord
+
+
+def processed_frame(rows=500, seed=1):
+    df, _ = build_features(generate_crimes(rows, seed=seed, start="2023-01-01", end="2023-02-15"))
+    return df
+
+
+class SaveToDbTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.df = processed_frame()
+
+    def test_rows_are_tagged_with_their_dataset(self):
+        self.assertEqual(save_to_db(self.df, dataset_id=3), len(self.df))
+        self.assertEqual(CrimeRecord.objects.filter(dataset_id=3).count(), len(self.df))
+        record = CrimeRecord.objects.filter(dataset_id=3).order_by("date", "id").first()
+        first = self.df.iloc[0]
+        self.assertEqual(record.primary_type, first["Primary Type"])
+        self.assertEqual(record.date.replace(tzinfo=None), self.df.index[0].to_pydatetime())
+
+    def test_rollup_and_summary_match_the_records(self):
+        save_to_db(self.df.iloc[:200], dataset_id=1)
+        save_to_db(self.df.iloc[200:], dataset_id=1)
+        rollup = CrimeHourlyRollup.objects.filter(dataset_id=1)
+        self.assertEqual(sum(r.crime_count for r in rollup), len(self.df))
+        self.assertEqual(sum(r.violent_count for r in rollup), int(self.df["is_violent_crime"].sum()))
+        # Buckets spanning both loads were incremented, not duplicated
+        self.assertEqual(rollup.count(), len(load._hourly_rollup(self.df)))
+        summary = CrimeMonthlySummary.objects.filter(dataset_id=1)
+        self.assertEqual(sum(s.crime_count for s in summary), len(self.df))
+
+    def test_replace_only_touches_its_dataset(self):
+        save_to_db(self.df, dataset_id=1)
+        save_to_db(self.df, dataset_id=2)
+        save_to_db(self.df, dataset_id=1, replace=True)
+        for dataset_id in (1, 2):
+            self.assertEqual(CrimeRecord.objects.filter(dataset_id=dataset_id).count(), len(self.df))
+            self.assertEqual(
+                sum(r.crime_count for r in CrimeHourlyRollup.objects.filter(dataset_id=dataset_id)),
+                len(self.df),
+            )
+
+    def test_replace_with_an_empty_frame_clears_the_dataset(self):
+        save_to_db(self.df, dataset_id=1)
+        self.assertEqual(save_to_db(self.df.iloc[:0], dataset_id=1, replace=True), 0)
+        self.assertFalse(CrimeRecord.objects.filter(dataset_id=1).exists())
+        self.assertFalse(CrimeHourlyRollup.objects.filter(dataset_id=1).exists())
+        self.assertFalse(CrimeMonthlySummary.objects.filter(dataset_id=1).exists())
+
+    def test_orm_rollup_merge_matches_the_upsert(self):
+        half = len(self.df) // 2
+        load.upsert_hourly_rollup(self.df.iloc[:half], dataset_id=1)
+        load.upsert_hourly_rollup(self.df.iloc[half:], dataset_id=1)
+        rollup = load._hourly_rollup(self.df.iloc[:half])
+        load._merge_hourly_rollup(rollup, "default", 100, dataset_id=2)
+        load._merge_hourly_rollup(load._hourly_rollup(self.df.iloc[half:]), "default", 100, dataset_id=2)
+
+        def buckets(dataset_id):
+            return sorted(CrimeHourlyRollup.objects.filter(dataset_id=dataset_id).values_list(
+                "hour", "primary_type", "crime_count", "violent_count"
+            ))
+
+        self.assertEqual(buckets(1), buckets(2))
+
+
+@mock.patch.object(load, "INDEX_REBUILD_MIN_ROWS", 100)
+class IndexRebuildTests(TestCase):
+
+    def save(self, df, **kwargs):
+        with mock.patch.object(load, "_secondary_indexes", wraps=load._secondary_indexes) as indexes:
+            save_to_db(df, summarize=False, **kwargs)
+        return indexes.called
+
+    def test_large_load_into_an_empty_table_rebuilds(self):
+        self.assertTrue(self.save(processed_frame(300)))
+
+    def test_small_load_into_a_large_table_keeps_the_indexes(self):
+        save_to_db(processed_frame(600), dataset_id=1, summarize=False)
+        self.assertFalse(self.save(processed_frame(300, seed=2), dataset_id=2))
+
+    def test_replace_counts_rows_after_the_delete(self):
+        df = processed_frame(300)
+        save_to_db(df, dataset_id=1, summarize=False)
+        self.assertTrue(self.save(df, dataset_id=1, replace=True))
+        self.assertEqual(CrimeRecord.objects.count(), len(df))
+
+
+class RecordsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        df = processed_frame(200)
+        # Three rows per timestamp, so pages split runs of equal dates
+        save_to_db(pd.concat([df] * 3).sort_index(), dataset_id=1)
+        save_to_db(df, dataset_id=2)
+        cls.expected = list(filter_records(dataset_id=1))
+
+    def test_pages_cover_every_row_once(self):
+        rows, cursor, pages = [], None, 0
+        while True:
+            page, cursor = keyset_page(filter_records(dataset_id=1), cursor, limit=7)
+            rows += page
+            pages += 1
+            if cursor is None:
+                break
+        self.assertEqual(rows, self.expected)
+        self.assertEqual(pages, -(-len(self.expected) // 7))
+        self.assertEqual([(r["date"], r["id"]) for r in rows], sorted((r["date"], r["id"]) for r in rows))
+
+    def test_exact_last_page_has_no_cursor(self):
+        rows, cursor = keyset_page(filter_records(dataset_id=1), limit=len(self.expected))
+        self.assertEqual((len(rows), cursor), (len(self.expected), None))
+
+    def test_cursor_round_trip(self):
+        row = self.expected[10]
+        self.assertEqual(decode_cursor(encode_cursor(row)), (row["date"], row["id"]))
+        # Empty, not base64, no id, not a date
+        for bad in ("", "not base64!", "MjAyMy0wMS0wMVQwMDowMDowMA==", "bm90IGEgZGF0ZXwx"):
+            with self.assertRaises(ValueError):
+                decode_cursor(bad)
+
+    def test_iter_records_batches(self):
+        self.assertEqual(list(iter_records(filter_records(dataset_id=1), batch_size=5)), self.expected)
+        self.assertEqual(list(iter_records(filter_records(dataset_id=1), batch_size=len(self.expected))), self.expected)
+
+    def test_filters(self):
+        start, end = self.expected[30]["date"], self.expected[90]["date"]
+        rows = list(filter_records(start=start, end=end, types=["THEFT"], violent=False, dataset_id=1))
+        self.assertTrue(rows)
+        for row in rows:
+            self.assertTrue(start <= row["date"] < end)
+            self.assertEqual((row["primary_type"], row["is_violent_crime"], row["dataset_id"]), ("THEFT", False, 1))
+        self.assertEqual(filter_records().count(), len(self.expected) + len(self.expected) // 3)
+
+
+class SaveToDuckDBTests(SimpleTestCase):
+
+    def setUp(self):
+        tmp = Path(tempfile.mkdtemp(prefix="duckdb-tests-"))
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        self.path = str(tmp / "analytics.duckdb")
+        self.df = compact_dtypes(processed_frame())
+
+    def query(self, sql):
+        with duckdb.connect(self.path, read_only=True) as con:
+            return con.execute(sql).fetchall()
+
+    def test_numeric_columns_are_not_copied(self):
+        table = load._arrow_columns(self.df)
+        self.assertEqual(table.column_names, ["date", *self.df.columns])
+        self.assertTrue(np.shares_memory(table["Hour_sin"].chunk(0).to_numpy(), self.df["Hour_sin"].to_numpy()))
+
+    def test_append_adds_to_the_rows_and_the_rollup(self):
+        half = len(self.df) // 2
+        self.assertEqual(save_to_duckdb(self.df.iloc[:half], self.path, if_exists="replace"), half)
+        save_to_duckdb(self.df.iloc[half:].reset_index(), self.path, if_exists="append")
+
+        self.assertEqual(self.query("SELECT count(*) FROM crime_records"), [(len(self.df),)])
+        rollup = load._hourly_rollup(self.df)
+        self.assertEqual(
+            self.query("SELECT count(*), sum(crime_count), sum(violent_count) FROM crime_hourly"),
+            [(len(rollup), len(self.df), int(self.df["is_violent_crime"].sum()))],
+        )
+        # Categories were stored as plain strings, not ENUMs
+        self.assertEqual(
+            self.query("SELECT data_type FROM information_schema.columns "
+                       "WHERE table_name = 'crime_records' AND column_name = 'Primary Type'"),
+            [("VARCHAR",)],
+        )
+
+    def test_existing_table_with_fail(self):
+        save_to_duckdb(self.df, self.path)
+        with self.assertRaises(ValueError):
+            save_to_duckdb(self.df, self.path, if_exists="fail")
+        self.assertEqual(self.query("SELECT count(*) FROM crime_records"), [(len(self.df),)])
+
+
+class QueriesTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tmp = Path(tempfile.mkdtemp(prefix="queries-tests-"))
+        cls.df = compact_dtypes(processed_frame(2000))
+        cls.path = cls.tmp / "analytics.duckdb"
+        cls.records_only = cls.tmp / "records-only.duckdb"
+        save_to_duckdb(cls.df, str(cls.path))
+        # As written before the rollup existed
+        save_to_duckdb(cls.df, str(cls.records_only), rollup_table=None)
+
+    @classmethod
+    def tearDownClass(cls):
+        queries.POOL.close_all()
+        shutil.rmtree(cls.tmp, ignore_errors=True)
+        super().tearDownClass()
+
+    def expected_counts(self, freq, df=None):
+        df = self.df if df is None else df
+        grouped = df.groupby(df.index.floor("D" if freq == "day" else "h"))["is_violent_crime"]
+        return [
+            {"bucket": bucket.isoformat(), "count": int(count), "violent": int(violent)}
+            for bucket, count, violent in zip(grouped.size().index, grouped.size(), grouped.sum())
+        ]
+
+    def test_counts_match_pandas(self):
+        for freq in queries.FREQUENCIES:
+            for path in (self.path, self.records_only):
+                self.assertEqual(queries.crime_counts(path, freq=freq), self.expected_counts(freq))
+
+    def test_filters_on_and_off_the_hour(self):
+        types = ["THEFT", "BATTERY"]
+        for start in (datetime.datetime(2023, 1, 10), datetime.datetime(2023, 1, 10, 7, 30)):
+            end = datetime.datetime(2023, 1, 20, tzinfo=datetime.timezone.utc)
+            df = self.df[
+                (self.df.index >= start) & (self.df.index < end.replace(tzinfo=None))
+                & self.df["Primary Type"].isin(types)
+            ]
+            self.assertEqual(
+                queries.crime_counts(self.path, freq="hour", start=start, end=end, types=types),
+                self.expected_counts("hour", df),
+            )
+
+    def test_violent_share_and_hour_of_week(self):
+        shares = queries.violent_share_by_type(self.path)
+        by_type = self.df.groupby("Primary Type", observed=True)["is_violent_crime"]
+        self.assertEqual(
+            {row["primary_type"]: (row["count"], row["violent"]) for row in shares},
+            {t: (int(n), int(v)) for (t, n), v in zip(by_type.size().items(), by_type.sum())},
+        )
+        counts = [row["count"] for row in shares]
+        self.assertEqual(counts, sorted(counts, reverse=True))
+
+        matrix = queries.hour_of_week(self.path)
+        self.assertEqual(sum(map(sum, matrix)), len(self.df))
+        monday_9 = ((self.df.index.dayofweek == 0) & (self.df.index.hour == 9)).sum()
+        self.assertEqual(matrix[0][9], monday_9)
+
+    def test_hourly_rollup_frame(self):
+        hourly = queries.hourly_rollup(self.path)
+        self.assertEqual(int(hourly["crime_count"].sum()), len(self.df))
+        self.assertTrue(hourly.index.is_monotonic_increasing)
+        pd.testing.assert_frame_equal(hourly, queries.hourly_rollup(self.records_only), check_dtype=False)
+
+
+class ConnectionPoolTests(SimpleTestCase):
+
+    def setUp(self):
+        tmp = Path(tempfile.mkdtemp(prefix="pool-tests-"))
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        self.paths = [tmp / "a.duckdb", tmp / "b.duckdb"]
+        for i, path in enumerate(self.paths):
+            self.write(path, i)
+        self.pool = queries._ConnectionPool(max_connections=1, idle_seconds=0.05)
+        self.addCleanup(self.pool.close_all)
+
+    @staticmethod
+    def write(path, value):
+        tmp_path = path.with_suffix(".part")
+        with queries.connect(tmp_path) as con:
+            con.execute("CREATE TABLE t AS SELECT ? AS v", [value])
+        os.replace(tmp_path, path)
+
+    def value(self, path):
+        with self.pool.cursor(path) as cur:
+            return cur.execute("SELECT v FROM t").fetchone()[0]
+
+    def test_connections_are_reused(self):
+        self.value(self.paths[0])
+        con = self.pool._connections[os.fspath(self.paths[0])].con
+        self.value(self.paths[0])
+        self.assertIs(self.pool._connections[os.fspath(self.paths[0])].con, con)
+
+    def test_replaced_files_are_reopened(self):
+        self.assertEqual(self.value(self.paths[0]), 0)
+        self.write(self.paths[0], 5)
+        self.assertEqual(self.value(self.paths[0]), 5)
+
+    def test_least_recently_used_are_closed(self):
+        self.value(self.paths[0])
+        self.value(self.paths[1])
+        self.assertEqual(list(self.pool._connections), [os.fspath(self.paths[1])])
+
+    def test_connections_in_use_survive_retirement(self):
+        with self.pool.cursor(self.paths[0]) as cur:
+            self.pool.close(self.paths[0])
+            self.assertEqual(cur.execute("SELECT v FROM t").fetchone()[0], 0)
+        self.assertEqual(self.pool._connections, {})
+
+    def test_idle_connections_release_the_file(self):
+        self.value(self.paths[0])
+        deadline = time.monotonic() + 5
+        while self.pool._connections and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(self.pool._connections, {})
+        # A writer can open it again
+        with queries.connect(self.paths[0], timeout=1) as con:
+            con.execute("INSERT INTO t VALUES (1)")
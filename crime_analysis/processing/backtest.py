@@ -0,0 +1,125 @@
+import os
+import tempfile
+
+import joblib
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.dummy import DummyClassifier
+
+from .evaluation import confusion_counts, metrics_from_counts, roc_auc, threshold_sweep
+from .ml_models import _predict, feature_matrix, make_models
+
+
+MODES = ("expanding", "sliding")
+
+MODEL_NAMES = {"rf": "Random Forest", "gb": "Gradient Boosting"}
+
+
+def walk_forward_splits(n_rows: int, n_folds: int = 5, mode: str = "expanding",
+                        min_train_fraction: float = 0.5) -> list:
+    """
+    Rolling-origin (train, test) row ranges over time-ordered data.
+
+    The first ``min_train_fraction`` of the rows is the initial training
+    window; the rest is cut into ``n_folds`` consecutive test windows. Each
+    fold trains on everything before its test window ('expanding') or on
+    the same number of rows just before it ('sliding').
+
+    :return: list of ((train_start, train_stop), (test_start, test_stop))
+    """
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {MODES}")
+    if n_folds < 1:
+        raise ValueError("n_folds must be at least 1")
+
+    initial = int(n_rows * min_train_fraction)
+    test_size = (n_rows - initial) // n_folds
+    if initial < 1 or test_size < 1:
+        raise ValueError(f"Not enough rows ({n_rows}) for {n_folds} folds")
+
+    splits = []
+    for fold in range(n_folds):
+        test_start = initial + fold * test_size
+        test_stop = n_rows if fold == n_folds - 1 else test_start + test_size
+        train_start = 0 if mode == "expanding" else test_start - initial
+        splits.append(((train_start, test_start), (test_start, test_stop)))
+    return splits
+
+
+def _run_fold(fold, X, y, split, gb_model):
+    """
+    Fit both models on one fold. ``X`` and ``y`` arrive as read-only
+    memory maps; the fold's slices are views into them.
+
+    A training window with a single class (rare targets, short sliding
+    windows) cannot fit gradient boosting; both models then predict that
+    class with certainty.
+    """
+    (train_start, train_stop), (test_start, test_stop) = split
+    X_train, y_train = X[train_start:train_stop], y[train_start:train_stop]
+    X_test, y_test = X[test_start:test_stop], y[test_start:test_stop]
+
+    models = make_models(gb_model, n_jobs=1)
+    if len(np.unique(y_train)) < 2:
+        models = {name: DummyClassifier(strategy="prior") for name in models}
+
+    rows = []
+    # Folds already run in parallel; one core per model
+    for name, model in models.items():
+        model.fit(X_train, y_train)
+        _, proba = _predict(model, X_train, y_train, X_test)
+        counts = confusion_counts(y_test, proba)
+        rows.append({
+            "fold": fold,
+            "model": MODEL_NAMES[name],
+            **{k: float(v) for k, v in metrics_from_counts(**counts).items()},
+            "roc_auc": roc_auc(threshold_sweep(y_test, proba)),
+        })
+    return rows
+
+
+def walk_forward_backtest(df: pd.DataFrame, n_folds: int = 5, mode: str = "expanding",
+                          min_train_fraction: float = 0.5, gb_model: str = "gradient_boosting",
+                          n_jobs: int = -1) -> pd.DataFrame:
+    """
+    Train and evaluate both models on every walk-forward fold (see
+    walk_forward_splits), folds running in parallel on a process pool.
+
+    The feature matrix is written once to a memory-mapped file that every
+    worker maps instead of receiving its own copy.
+
+    :return: one row per fold and model with the fold's date ranges, sizes
+             and metrics
+    """
+    X, y, _ = feature_matrix(df)
+    y = y.to_numpy(dtype=np.int8)
+    splits = walk_forward_splits(len(X), n_folds, mode, min_train_fraction)
+
+    with tempfile.TemporaryDirectory(prefix="backtest-") as tmp:
+        joblib.dump((X, y), os.path.join(tmp, "features.joblib"))
+        del X, y
+        X, y = joblib.load(os.path.join(tmp, "features.joblib"), mmap_mode="r")
+
+        fold_rows = Parallel(n_jobs=min(joblib.effective_n_jobs(n_jobs), len(splits)))(
+            delayed(_run_fold)(fold, X, y, split, gb_model)
+            for fold, split in enumerate(splits)
+        )
+        del X, y
+
+    index = df.index
+    rows = []
+    for (train, test), fold in zip(splits, fold_rows):
+        for row in fold:
+            rows.append({
+                **row,
+                "train_start": index[train[0]],
+                "train_end": index[train[1] - 1],
+                "test_start": index[test[0]],
+                "test_end": index[test[1] - 1],
+                "n_train": train[1] - train[0],
+                "n_test": test[1] - test[0],
+            })
+    columns = ["fold", "model", "train_start", "train_end", "test_start", "test_end",
+               "n_train", "n_test", "f1_score", "precision", "recall", "accuracy", "roc_auc"]
+    return pd.DataFrame(rows, columns=columns)
@@ -0,0 +1,40 @@
+import numpy as np
+
+
+def minmax_indices(values, n_buckets: int) -> np.ndarray:
+    """
+    Indices of the points to draw when plotting ``values`` with about
+    ``2 * n_buckets`` points.
+
+    The series is cut into ``n_buckets`` equal runs and the minimum and
+    maximum of each run are kept, so peaks and dips survive however long
+    the series is. The first and last points are always kept; NaNs are
+    never picked unless a whole run is NaN. Runs in O(n).
+
+    :return: sorted positions into ``values``
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    if n_buckets < 1 or n <= 2 * n_buckets:
+        return np.arange(n)
+
+    size = -(-n // n_buckets)
+    padded = np.full(n_buckets * size, np.nan)
+    padded[:n] = values
+    buckets = padded.reshape(n_buckets, size)
+    missing = np.isnan(buckets)
+
+    offsets = np.arange(n_buckets) * size
+    lows = np.where(missing, np.inf, buckets).argmin(axis=1) + offsets
+    highs = np.where(missing, -np.inf, buckets).argmax(axis=1) + offsets
+
+    indices = np.unique(np.concatenate([[0, n - 1], lows, highs]))
+    return indices[indices < n]
+
+
+def buckets_for_width(width_inches: float, dpi: int) -> int:
+    """
+    Bucket count for a plot ``width_inches`` wide: one min/max pair per
+    pixel column, more is not visible.
+    """
+    return max(1, int(width_inches * dpi))
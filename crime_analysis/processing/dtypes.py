@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+
+# Integer columns with a known small range
+BOUNDED_COLUMNS = {
+    'Month': np.int8,
+    'Hour': np.int8,
+    'Minute': np.int8,
+    'DayOfWeek': np.int8,
+    'Season': np.int8,
+    'crime_count': np.int8,
+    # Target: stays numeric so model labels remain 0/1
+    'is_violent_crime': np.int8,
+    'Year': np.int16,
+    'Beat': np.int16,
+}
+
+# Bounded columns with values outside their dtype's range (bad input) get
+# this one instead
+FALLBACK_INT = np.int32
+
+FLAG_COLUMNS = ('is_weekend', 'is_night', 'Arrest', 'Domestic')
+
+# Repetitive text columns; near-unique ones ('Case Number') stay strings
+CATEGORY_COLUMNS = ('Primary Type', 'Block', 'Description', 'Location Description', 'FBI Code', 'IUCR')
+
+
+def _fits(values: pd.Series, dtype) -> bool:
+    info = np.iinfo(dtype)
+    return values.empty or (values.min() >= info.min and values.max() <= info.max)
+
+
+def compact_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Downcast a processed frame column by column: small ints for bounded
+    fields, bool for flags, float32 for floats (the models train in
+    float32 anyway) and categoricals for repetitive strings.
+
+    The target dtype depends only on the column, never on the values in
+    this batch, so frames compacted separately (appended parts) share one
+    schema. A bounded column whose values are out of range is widened to
+    FALLBACK_INT; other columns that would not convert losslessly are left
+    alone.
+
+    :raises ValueError: a bounded column does not fit FALLBACK_INT either
+    """
+    for col in df.columns:
+        values = df[col]
+        if col in BOUNDED_COLUMNS:
+            if pd.api.types.is_integer_dtype(values):
+                dtype = BOUNDED_COLUMNS[col]
+                if not _fits(values, dtype):
+                    dtype = FALLBACK_INT
+                    if not _fits(values, dtype):
+                        raise ValueError(
+                            f"Column {col!r} has values from {values.min()} to {values.max()}, "
+                            f"outside the {np.dtype(dtype).name} range"
+                        )
+                df[col] = values.astype(dtype)
+        elif col in FLAG_COLUMNS:
+            if pd.api.types.is_bool_dtype(values) or (
+                pd.api.types.is_integer_dtype(values) and values.isin((0, 1)).all()
+            ):
+                df[col] = values.astype(bool)
+        elif col in CATEGORY_COLUMNS:
+            if values.dtype == object:
+                df[col] = values.astype('category')
+        elif values.dtype == np.float64:
+            df[col] = values.astype(np.float32)
+    return df
+
+
+def concat_compact(frames: list) -> pd.DataFrame:
+    """
+    pd.concat of compacted frames that keeps categorical columns
+    categorical when the frames' categories differ (plain concat falls
+    back to object strings).
+    """
+    df = pd.concat(frames)
+    for col in frames[0].columns:
+        parts = [frame[col] for frame in frames]
+        if df[col].dtype == object and all(isinstance(p.dtype, pd.CategoricalDtype) for p in parts):
+            df[col] = pd.Categorical(union_categoricals(parts, ignore_order=True))
+    return df
+
+
+def memory_report(df: pd.DataFrame) -> dict:
+    """
+    In-memory size of a frame, in total and per column (strings counted
+    in full).
+    """
+    usage = df.memory_usage(index=True, deep=True)
+    dtypes = {'Index': df.index.dtype, **df.dtypes.to_dict()}
+    return {
+        'rows': len(df),
+        'bytes': int(usage.sum()),
+        'columns': [
+            {'name': str(name), 'dtype': str(dtypes[name]), 'bytes': int(size)}
+            for name, size in usage.items()
+        ],
+    }
@@ -1,20 +1,133 @@
+import numpy as np
 import pandas as pd
-from sklearn.metrics import (
-    accuracy_score, precision_score, recall_score, f1_score, roc_auc_score
-)
 
-def compute_metrics(y_true, y_preds: dict) -> pd.DataFrame:
+
+def _safe_divide(num, den):
+    num = np.asarray(num, dtype=np.float64)
+    den = np.asarray(den, dtype=np.float64)
+    return np.divide(num, den, out=np.zeros(np.broadcast(num, den).shape), where=den != 0)
+
+
+def confusion_counts(y_true, y_score, threshold: float = 0.5) -> dict:
     """
-    y_preds: dict of model_name -> predictions
+    tp, fp, tn, fn of ``y_score >= threshold`` in one bincount pass.
+    Hard 0/1 predictions are valid scores.
+    """
+    truth = np.asarray(y_true).astype(bool).ravel()
+    pred = np.asarray(y_score).ravel() >= threshold
+    tn, fp, fn, tp = np.bincount(truth * 2 + pred, minlength=4)
+    return {"tp": int(tp), "fp": int(fp), "tn": int(tn), "fn": int(fn)}
+
+
+def metrics_from_counts(tp, fp, tn, fn) -> dict:
+    """
+    Threshold metrics from confusion counts (scalars or arrays). Undefined
+    ratios are 0, like sklearn's zero_division default.
+    """
+    return {
+        "f1_score": _safe_divide(2 * tp, 2 * tp + fp + fn),
+        "precision": _safe_divide(tp, tp + fp),
+        "recall": _safe_divide(tp, tp + fn),
+        "accuracy": _safe_divide(tp + tn, tp + fp + tn + fn),
+    }
+
+
+def threshold_sweep(y_true, y_score) -> dict:
+    """
+    Confusion counts at every distinct score, from one sort (O(n log n)).
+
+    Entry i counts ``y_score >= thresholds[i]`` as positive; thresholds
+    are in decreasing order. Empty input gives empty arrays.
+    """
+    truth = np.asarray(y_true).astype(bool).ravel()
+    score = np.asarray(y_score, dtype=np.float64).ravel()
+    if not len(score):
+        empty = np.zeros(0, dtype=np.int64)
+        return {
+            "thresholds": np.zeros(0), "tp": empty, "fp": empty, "fn": empty, "tn": empty,
+            "positives": 0, "negatives": 0,
+        }
+
+    order = np.argsort(score, kind="mergesort")[::-1]
+    score, truth = score[order], truth[order]
+    # Last position of each run of equal scores
+    ends = np.r_[np.flatnonzero(np.diff(score)), len(score) - 1]
+
+    tp = np.cumsum(truth)[ends]
+    fp = ends + 1 - tp
+    positives = int(truth.sum())
+    negatives = len(truth) - positives
+    return {
+        "thresholds": score[ends],
+        "tp": tp,
+        "fp": fp,
+        "fn": positives - tp,
+        "tn": negatives - fp,
+        "positives": positives,
+        "negatives": negatives,
+    }
+
+
+def roc_curve_points(sweep: dict) -> dict:
+    """
+    ROC curve (fpr, tpr) from threshold_sweep(), starting at (0, 0).
+    """
+    return {
+        "fpr": np.r_[0.0, _safe_divide(sweep["fp"], sweep["negatives"])],
+        "tpr": np.r_[0.0, _safe_divide(sweep["tp"], sweep["positives"])],
+        "thresholds": np.r_[np.inf, sweep["thresholds"]],
+    }
+
+
+def pr_curve_points(sweep: dict) -> dict:
+    """
+    Precision-recall curve from threshold_sweep(), by decreasing threshold.
+    """
+    return {
+        "precision": _safe_divide(sweep["tp"], sweep["tp"] + sweep["fp"]),
+        "recall": _safe_divide(sweep["tp"], sweep["positives"]),
+        "thresholds": sweep["thresholds"],
+    }
+
+
+def roc_auc(sweep: dict) -> float:
+    if not sweep["positives"] or not sweep["negatives"]:
+        return float("nan")
+    roc = roc_curve_points(sweep)
+    return float(np.trapezoid(roc["tpr"], roc["fpr"]))
+
+
+def average_precision(sweep: dict) -> float:
+    """
+    Step-wise area under the PR curve (sklearn's average_precision_score).
+    """
+    if not sweep["positives"]:
+        return float("nan")
+    pr = pr_curve_points(sweep)
+    return float(np.sum(np.diff(np.r_[0.0, pr["recall"]]) * pr["precision"]))
+
+
+def compute_metrics(y_true, y_preds: dict, threshold: float = 0.5) -> pd.DataFrame:
+    """
+    y_preds: dict of model_name -> predicted probabilities of the positive
+    class (hard 0/1 predictions also work, but then roc_auc and
+    average_precision only see one threshold).
+
+    Each model takes one sort for the ranking metrics and one bincount for
+    the metrics at ``threshold``. With no rows (an empty test split) every
+    metric is NaN.
     """
     rows = []
-    for model_name, y_pred in y_preds.items():
+    for model_name, y_score in y_preds.items():
+        counts = confusion_counts(y_true, y_score, threshold)
+        sweep = threshold_sweep(y_true, y_score)
+        metrics = metrics_from_counts(**counts)
+        if not len(sweep["thresholds"]):
+            metrics = dict.fromkeys(metrics, np.nan)
         rows.append({
             "Model": model_name,
-            "f1_score": f1_score(y_true, y_pred),
-            "precision": precision_score(y_true, y_pred),
-            "recall": recall_score(y_true, y_pred),
-            "roc_auc": roc_auc_score(y_true, y_pred),
-            "accuracy": accuracy_score(y_true, y_pred)
+            **{k: float(v) for k, v in metrics.items()},
+            "roc_auc": roc_auc(sweep),
+            "average_precision": average_precision(sweep),
         })
-    return pd.DataFrame(rows)
\ No newline at end of file
+    return pd.DataFrame(rows)
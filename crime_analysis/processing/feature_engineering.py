@@ -1,23 +1,129 @@
 import pandas as pd
 import numpy as np
 
-def add_lag_features(df: pd.DataFrame) -> pd.DataFrame:
-    # Lags
-    df['lag_1h'] = df['crime_count'].shift(1)
-    df['lag_2h'] = df['crime_count'].shift(2)
-    df['lag_3h'] = df['crime_count'].shift(3)
-
-    df['lag_v_1h'] = df['is_violent_crime'].shift(1)
-    df['lag_v_2h'] = df['is_violent_crime'].shift(2)
-    df['lag_v_3h'] = df['is_violent_crime'].shift(3)
-
-    # Rolling windows
-    df['rolling_3h'] = df['crime_count'].rolling(3).mean()
-    df['rolling_v_3h'] = df['is_violent_crime'].rolling(3).mean()
-
-    # Drop rows with NaNs from lagging
-    df = df.dropna()
-    return df
+from .preprocessing import SEASONS
+
+
+DEFAULT_LAGS = (1, 2, 3)
+DEFAULT_WINDOWS = (3,)
+
+
+def hour_buckets(index: pd.DatetimeIndex) -> np.ndarray:
+    """
+    Hours since the epoch for every timestamp.
+    """
+    return index.values.astype('datetime64[h]').astype(np.int64)
+
+
+def feature_names(lags=DEFAULT_LAGS, windows=DEFAULT_WINDOWS) -> list:
+    """
+    Column names in the order lag_rolling_cube() stacks them.
+    """
+    names = [f'lag_{k}h' for k in lags] + [f'lag_v_{k}h' for k in lags]
+    names += [f'rolling_{w}h' for w in windows] + [f'rolling_v_{w}h' for w in windows]
+    return names
+
+
+def hourly_counts(hours: np.ndarray, violent: np.ndarray, groups: np.ndarray,
+                  n_groups: int, start: int, n_hours: int) -> np.ndarray:
+    """
+    Incident and violent-incident counts per (group, hour) bucket.
+
+    :return: float64 array of shape (2, n_groups, n_hours)
+    """
+    flat = groups * n_hours + (hours - start)
+    size = n_groups * n_hours
+    counts = np.empty((2, size), dtype=np.float64)
+    counts[0] = np.bincount(flat, minlength=size)
+    counts[1] = np.bincount(flat, weights=violent, minlength=size)
+    return counts.reshape(2, n_groups, n_hours)
+
+
+def lag_rolling_cube(counts: np.ndarray, lags=DEFAULT_LAGS, windows=DEFAULT_WINDOWS) -> np.ndarray:
+    """
+    Lags and trailing rolling means of hourly counts in one pass.
+
+    Rolling windows cover the ``w`` hours before the bucket, so no feature
+    looks at the bucket itself. Buckets without enough history are NaN.
+
+    :param counts: array of shape (2, n_groups, n_hours) from hourly_counts()
+    :return: array of shape (n_features, n_groups, n_hours), features in
+             the order of feature_names()
+    """
+    _, n_groups, n_hours = counts.shape
+    n_features = 2 * (len(lags) + len(windows))
+    cube = np.full((n_features, n_groups, n_hours), np.nan)
+
+    for series in (0, 1):
+        for j, k in enumerate(lags):
+            if k >= n_hours:
+                continue
+            cube[series * len(lags) + j, :, k:] = counts[series, :, :n_hours - k]
+    i = 2 * len(lags)
+
+    cumsum = np.zeros((2, n_groups, n_hours + 1))
+    np.cumsum(counts, axis=2, out=cumsum[:, :, 1:])
+    for series in (0, 1):
+        for j, w in enumerate(windows):
+            if w >= n_hours:
+                continue
+            cube[i + series * len(windows) + j, :, w:] = (
+                cumsum[series, :, w:n_hours] - cumsum[series, :, :n_hours - w]
+            ) / w
+
+    return cube
+
+
+def add_lag_features(df: pd.DataFrame, lags=DEFAULT_LAGS, windows=DEFAULT_WINDOWS,
+                     group_by: str = None) -> pd.DataFrame:
+    """
+    Add hourly lag and rolling features to an incident-level frame.
+
+    Incidents are counted into real hourly buckets (optionally per
+    ``group_by`` column, e.g. 'Primary Type' or 'District'), and every
+    incident gets the features of its bucket: ``lag_1h`` is the number of
+    incidents in the previous hour, ``rolling_3h`` the mean hourly count over
+    the three hours before, and the ``_v_`` variants do the same for violent
+    crimes. Rows in the first hours, which lack full history, are dropped.
+
+    :param df: preprocessed frame with a sorted DatetimeIndex
+    :param lags: lags in hours
+    :param windows: rolling window sizes in hours
+    :param group_by: optional column to compute features per group
+    """
+    hours = hour_buckets(df.index)
+    if len(hours) == 0:
+        for name in feature_names(lags, windows):
+            df[name] = np.float64(np.nan)
+        return df
+
+    if group_by is None:
+        groups, n_groups = np.zeros(len(df), dtype=np.int64), 1
+    else:
+        codes, uniques = pd.factorize(df[group_by], use_na_sentinel=True)
+        n_groups = len(uniques) + 1
+        groups = np.where(codes < 0, n_groups - 1, codes).astype(np.int64)
+
+    start = hours.min()
+    n_hours = int(hours.max() - start) + 1
+    counts = hourly_counts(hours, df['is_violent_crime'].to_numpy(np.float64),
+                           groups, n_groups, start, n_hours)
+    cube = lag_rolling_cube(counts, lags, windows)
+
+    # Gather each incident's bucket from the cube in one fancy-index pass
+    flat = groups * n_hours + (hours - start)
+    features = cube.reshape(len(cube), -1)[:, flat]
+
+    for name, values in zip(feature_names(lags, windows), features):
+        df[name] = values
+
+    # Drop rows without full history. In a time-sorted frame they are the
+    # first rows, and the rest is kept as a view rather than copied.
+    complete = ~np.isnan(features).any(axis=0)
+    first = int(complete.argmax()) if complete.any() else len(df)
+    if complete[first:].all():
+        return pd.DataFrame(df.iloc[first:], copy=False)
+    return df[complete]
 
 def add_cyclic_features(df: pd.DataFrame) -> pd.DataFrame:
     df['Hour_sin'] = np.sin(2 * np.pi * df['Hour'] / 24)
@@ -26,8 +132,8 @@ def add_cyclic_features(df: pd.DataFrame) -> pd.DataFrame:
     df['Day_sin'] = np.sin(2 * np.pi * df['DayOfWeek'] / 7)
     df['Day_cos'] = np.cos(2 * np.pi * df['DayOfWeek'] / 7)
 
-    # Encode season
-    df['Season'] = df['Season'].astype('category').cat.codes
+    # Encode season (fixed code per season, whichever seasons are present)
+    df['Season'] = pd.Categorical(df['Season'], categories=SEASONS).codes
 
     # Encode Primary Type
     df['Primary Type'] = df['Primary Type'].astype('category')
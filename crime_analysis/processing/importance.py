@@ -0,0 +1,66 @@
+import copy
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.inspection import permutation_importance
+
+
+def impurity_importances(models: dict, feature_cols) -> pd.DataFrame:
+    """
+    Impurity-based importances of fitted tree models, one column per model.
+    Models without ``feature_importances_`` (HistGradientBoosting) are
+    left out.
+    """
+    columns = {
+        name: model.feature_importances_
+        for name, model in models.items()
+        if hasattr(model, "feature_importances_")
+    }
+    return pd.DataFrame(columns, index=pd.Index(feature_cols, name="feature"))
+
+
+def permutation_importances(model, X: pd.DataFrame, y, max_samples: int = 5000,
+                            time_budget: float = 30.0, max_repeats: int = 10,
+                            n_jobs: int = -1, random_state: int = 42) -> pd.DataFrame:
+    """
+    Permutation importance on a random sample of at most ``max_samples``
+    test rows, with features shuffled in parallel over ``n_jobs`` cores.
+
+    Repeats run one at a time until ``max_repeats`` or ``time_budget``
+    seconds is reached (at least one always runs), so the cost is bounded
+    whatever the dataset size. The model itself predicts on one core
+    meanwhile, so that the ``n_jobs`` workers do not each start a thread
+    per core.
+
+    :return: DataFrame indexed by feature with mean, std and repeats
+    """
+    features = X.columns
+    if model.get_params().get("n_jobs") not in (None, 1):
+        # Shallow copy: shares the fitted trees, leaves the caller's model as is
+        model = copy.copy(model).set_params(n_jobs=1)
+    # Models are fitted on plain arrays (see train_models)
+    X, y = X.to_numpy(), np.asarray(y)
+    rng = np.random.default_rng(random_state)
+    if len(X) > max_samples:
+        rows = np.sort(rng.choice(len(X), size=max_samples, replace=False))
+        X, y = X[rows], y[rows]
+
+    deadline = time.monotonic() + time_budget
+    scores = []
+    while len(scores) < max_repeats:
+        started = time.monotonic()
+        result = permutation_importance(
+            model, X, y, n_repeats=1, n_jobs=n_jobs,
+            random_state=int(rng.integers(2**31 - 1)),
+        )
+        scores.append(result.importances[:, 0])
+        # Stop unless another repeat fits in the budget
+        if time.monotonic() + (time.monotonic() - started) > deadline:
+            break
+
+    scores = np.column_stack(scores)
+    return pd.DataFrame(
+        {"mean": scores.mean(axis=1), "std": scores.std(axis=1), "repeats": scores.shape[1]},
+        index=pd.Index(features, name="feature"),
+    )
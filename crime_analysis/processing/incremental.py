@@ -0,0 +1,215 @@
+import numpy as np
+import pandas as pd
+
+from .feature_engineering import (
+    DEFAULT_LAGS, DEFAULT_WINDOWS,
+    add_cyclic_features, add_lag_features, feature_names,
+    hour_buckets, hourly_counts, lag_rolling_cube,
+)
+from .preprocessing import preprocess_raw
+
+
+class RebuildRequired(ValueError):
+    """
+    Appended rows cannot be processed incrementally; rebuild the features
+    from all raw data instead.
+    """
+
+
+class FeatureState:
+    """
+    Everything needed to extend a processed dataset without reprocessing
+    its history:
+
+    - hourly counts for the last ``history + 1`` hours (per group),
+    - the Primary Type categories used for ``primary_type_code``,
+    - the preprocessed rows at the latest timestamp, to drop duplicates
+      that straddle two extracts,
+    - the column layout of the preprocessed frame.
+    """
+
+    def __init__(self, lags, windows, group_by, columns, types,
+                 group_labels, first_hour, last_hour, tail, last_rows):
+        self.lags = tuple(lags)
+        self.windows = tuple(windows)
+        self.group_by = group_by
+        self.columns = list(columns)
+        self.types = list(types)
+        self.group_labels = list(group_labels)
+        self.first_hour = int(first_hour)
+        self.last_hour = int(last_hour)
+        self.tail = tail
+        self.last_rows = last_rows
+
+    @property
+    def history(self) -> int:
+        """
+        Hours of history the furthest-reaching lag or window needs.
+        """
+        return max(self.lags + self.windows)
+
+    @property
+    def last_timestamp(self) -> pd.Timestamp:
+        return self.last_rows.index.max()
+
+
+def _group_codes(df: pd.DataFrame, group_by, labels: list) -> np.ndarray:
+    """
+    Map each row's group to its position in ``labels``, appending unseen
+    groups to ``labels`` in place. Missing values share one group.
+    """
+    if group_by is None:
+        if not labels:
+            labels.append(None)
+        return np.zeros(len(df), dtype=np.int64)
+
+    codes, uniques = pd.factorize(df[group_by], use_na_sentinel=True)
+    lookup = {label: i for i, label in enumerate(labels)}
+    positions = []
+    for value in list(uniques) + [None]:
+        if value not in lookup:
+            lookup[value] = len(labels)
+            labels.append(value)
+        positions.append(lookup[value])
+    # code -1 (missing) picks the trailing None entry
+    return np.asarray(positions, dtype=np.int64)[codes]
+
+
+def feature_state(df: pd.DataFrame, lags=DEFAULT_LAGS, windows=DEFAULT_WINDOWS,
+                  group_by: str = None) -> FeatureState:
+    """
+    Capture the tail state of a preprocessed frame (output of
+    preprocess_raw, before lag features).
+    """
+    history = max(tuple(lags) + tuple(windows))
+    hours = hour_buckets(df.index)
+    last_hour = int(hours.max())
+    start = last_hour - history
+
+    labels = []
+    groups = _group_codes(df, group_by, labels)
+    recent = hours >= start
+    tail = hourly_counts(
+        hours[recent], df['is_violent_crime'].to_numpy(np.float64)[recent],
+        groups[recent], len(labels), start, history + 1,
+    )
+
+    return FeatureState(
+        lags, windows, group_by,
+        columns=df.columns,
+        types=df['Primary Type'].cat.categories,
+        group_labels=labels,
+        first_hour=hours.min(),
+        last_hour=last_hour,
+        tail=tail,
+        last_rows=df[df.index == df.index.max()].copy(),
+    )
+
+
+def build_features(raw_df: pd.DataFrame, lags=DEFAULT_LAGS, windows=DEFAULT_WINDOWS,
+                   group_by: str = None):
+    """
+    Full rebuild: preprocess, add lag and cyclic features, and capture the
+    state needed for later appends.
+
+    :return: (processed frame, FeatureState)
+    """
+    df = preprocess_raw(raw_df)
+    state = feature_state(df, lags, windows, group_by)
+    df = add_lag_features(df, lags, windows, group_by)
+    df = add_cyclic_features(df)
+    return df, state
+
+
+def recode_primary_types(df: pd.DataFrame, types: list) -> pd.DataFrame:
+    """
+    Re-encode ``Primary Type`` / ``primary_type_code`` against a wider set
+    of categories, as a full rebuild over all data would.
+    """
+    df['Primary Type'] = df['Primary Type'].cat.set_categories(types)
+    df['primary_type_code'] = df['Primary Type'].cat.codes
+    return df
+
+
+def append_features(raw_delta: pd.DataFrame, state: FeatureState):
+    """
+    Process only newly appended raw rows.
+
+    The result equals the new rows of a full rebuild over history + delta,
+    provided the delta starts at or after the last stored timestamp. Rows at
+    exactly that timestamp that were already stored are dropped, so extracts
+    may overlap by it. Work is proportional to the delta (plus ``history``
+    hours of tail state).
+
+    :return: (processed delta, new FeatureState, types_changed). When
+             ``types_changed`` is True, stored rows must be passed through
+             recode_primary_types() with ``new_state.types``.
+    :raises RebuildRequired: the delta has new columns or backdated rows
+                             (earlier than the last stored timestamp); do
+                             a full rebuild over all raw data
+    """
+    delta = preprocess_raw(raw_delta)
+
+    extra = [c for c in delta.columns if c not in state.columns]
+    if extra:
+        raise RebuildRequired(f"New columns in appended data: {extra}")
+    delta = delta.reindex(columns=state.columns)
+
+    if len(delta) and delta.index.min() < state.last_timestamp:
+        raise RebuildRequired("Appended data starts before the end of the stored history")
+
+    # Drop rows already present at the boundary timestamp
+    boundary = delta.index == state.last_timestamp
+    if boundary.any():
+        combined = pd.concat([state.last_rows, delta[boundary]]).reset_index()
+        duplicated = combined.astype(object).duplicated().to_numpy()[len(state.last_rows):]
+        keep = np.ones(len(delta), dtype=bool)
+        keep[np.flatnonzero(boundary)[duplicated]] = False
+        delta = delta[keep].copy()
+
+    # Primary Type categories: union with everything seen so far
+    types = sorted(set(state.types) | set(delta['Primary Type'].dropna().unique()))
+    types_changed = types != state.types
+    delta['Primary Type'] = pd.Categorical(delta['Primary Type'], categories=types)
+
+    # Hourly counts from the tail state followed by the delta
+    labels = list(state.group_labels)
+    groups = _group_codes(delta, state.group_by, labels)
+    hours = hour_buckets(delta.index)
+    start = state.last_hour - state.history
+    end = max(state.last_hour, int(hours.max()) if len(hours) else state.last_hour)
+    n_hours = end - start + 1
+
+    counts = hourly_counts(
+        hours, delta['is_violent_crime'].to_numpy(np.float64),
+        groups, len(labels), start, n_hours,
+    )
+    counts[:, :state.tail.shape[1], :state.tail.shape[2]] += state.tail
+    cube = lag_rolling_cube(counts, state.lags, state.windows)
+
+    features = cube.reshape(len(cube), -1)[:, groups * n_hours + (hours - start)]
+    for name, values in zip(feature_names(state.lags, state.windows), features):
+        delta[name] = values
+
+    last_rows = state.last_rows
+    if len(delta):
+        last_ts = delta.index.max()
+        last_rows = delta.loc[delta.index == last_ts, state.columns].copy()
+        if last_ts == state.last_timestamp:
+            last_rows = pd.concat([state.last_rows, last_rows])
+
+    # Same rows a full rebuild drops: not enough history since the first hour
+    delta = delta[hours - state.first_hour >= state.history]
+    delta = add_cyclic_features(delta)
+
+    new_state = FeatureState(
+        state.lags, state.windows, state.group_by,
+        columns=state.columns,
+        types=types,
+        group_labels=labels,
+        first_hour=state.first_hour,
+        last_hour=end,
+        tail=counts[:, :, -(state.history + 1):].copy(),
+        last_rows=last_rows,
+    )
+    return delta, new_state, types_changed
@@ -1,37 +1,147 @@
+import numpy as np
 import pandas as pd
-from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
+from joblib import Parallel, delayed
+from sklearn.ensemble import (
+    RandomForestClassifier,
+    GradientBoostingClassifier,
+    HistGradientBoostingClassifier,
+)
 
-def train_models(df: pd.DataFrame):
-    # Fill numeric NaNs
-    num_cols = df.select_dtypes(include=[float, int]).columns
-    df[num_cols] = df[num_cols].fillna(df[num_cols].median())
+from .model_registry import data_digest, model_key
 
-    # Drop string columns
-    text_cols = df.select_dtypes(include=['object']).columns.tolist()
-    df = df.drop(columns=text_cols)
 
-    # Drop target-leakage features
-    target_leak_cols = [c for c in df.columns if 'lag_v' in c or 'rolling_v' in c]
-    df = df.drop(columns=target_leak_cols, errors='ignore')
+def _gradient_boosting():
+    return GradientBoostingClassifier(n_estimators=100, max_depth=3, random_state=42)
+
+
+def _hist_gradient_boosting():
+    # Histogram-based: bins features once, much faster on large datasets
+    return HistGradientBoostingClassifier(
+        max_iter=100, max_depth=3, early_stopping=False, random_state=42
+    )
+
+
+GB_MODELS = {
+    "gradient_boosting": _gradient_boosting,
+    "hist": _hist_gradient_boosting,
+}
+
+
+def make_models(gb_model: str = "gradient_boosting", n_jobs: int = -1) -> dict:
+    """
+    Unfitted 'rf' and 'gb' estimators.
+    """
+    if gb_model not in GB_MODELS:
+        raise ValueError(f"gb_model must be one of {sorted(GB_MODELS)}")
+    return {
+        "rf": RandomForestClassifier(n_estimators=100, max_depth=8, random_state=42, n_jobs=n_jobs),
+        "gb": GB_MODELS[gb_model](),
+    }
+
+
+def _predict(model, X_train, y_train, X_test):
+    """
+    Labels and positive-class probabilities from a single predict_proba
+    pass (predict() would compute the probabilities again). A model fitted
+    on negatives only gives the positive class probability 0.
+    """
+    proba = model.predict_proba(X_test)
+    labels = model.classes_.take(proba.argmax(axis=1))
+    positive = np.flatnonzero(model.classes_ == 1)
+    if not len(positive):
+        return labels, np.zeros(len(proba))
+    return labels, proba[:, positive[0]]
+
+
+def _fit_predict(model, X_train, y_train, X_test):
+    model.fit(X_train, y_train)
+    return _predict(model, X_train, y_train, X_test)
+
+
+def feature_matrix(df: pd.DataFrame):
+    """
+    Model inputs from a processed frame.
+
+    X is filled column by column straight from the frame, without an
+    intermediate frame copy; NaNs in numeric columns become the column
+    median.
+
+    :return: (X, y, feature_cols) with X a contiguous float32 array and y
+             the is_violent_crime Series
+    """
+    # Features: everything but string columns, the target and the
+    # target-leakage features. Tree models work in float32 internally, so
+    # converting once here saves a copy per model.
+    feature_cols = [
+        c for c in df.columns
+        if not (pd.api.types.is_object_dtype(df[c]) or isinstance(df[c].dtype, pd.CategoricalDtype))
+        and 'lag_v' not in c and 'rolling_v' not in c
+        and c != 'is_violent_crime'
+    ]
+    X = np.empty((len(df), len(feature_cols)), dtype=np.float32)
+    for j, col in enumerate(feature_cols):
+        values = df[col]
+        if pd.api.types.is_float_dtype(values) and values.hasnans:
+            values = values.fillna(values.median())
+        X[:, j] = values.to_numpy()
 
-    # Features & target
-    feature_cols = [c for c in df.columns if c != 'is_violent_crime']
-    X = df[feature_cols]
     y = df['is_violent_crime']
+    return X, y, feature_cols
+
+
+def train_models(df: pd.DataFrame, gb_model: str = "gradient_boosting", n_jobs: int = -1,
+                 registry=None, dataset_id: int = None):
+    """
+    Fit Random Forest and Gradient Boosting at the same time, on one
+    contiguous float32 feature matrix shared by both (threads, no copies).
+
+    With a ``registry`` (see model_registry.ModelRegistry) fitted models are
+    stored per ``dataset_id``, and a model already fitted with the same
+    parameters on the same features and training rows is reused instead of
+    retrained.
+
+    :param gb_model: 'gradient_boosting' or 'hist' (HistGradientBoostingClassifier)
+    :param n_jobs: cores for the random forest; -1 uses all of them
+    :return: dict with X_test, y_test, the test-set labels rf_pred/gb_pred,
+             positive-class probabilities rf_proba/gb_proba, and models
+             ('rf' and 'gb' fitted estimators)
+    """
+    X, y, feature_cols = feature_matrix(df)
 
-    # Time-based split
+    # Time-based split (row slices are views of X)
     train_size = int(0.8 * len(df))
-    X_train, X_test = X.iloc[:train_size], X.iloc[train_size:]
-    y_train, y_test = y.iloc[:train_size], y.iloc[train_size:]
+    X_train, X_test = X[:train_size], X[train_size:]
+    y_train, y_test = y.to_numpy()[:train_size], y.iloc[train_size:]
 
     # Train models
-    rf = RandomForestClassifier(n_estimators=100, max_depth=8, random_state=42)
-    rf.fit(X_train, y_train)
-    rf_pred = rf.predict(X_test)
+    models = make_models(gb_model, n_jobs)
+    tasks = {name: _fit_predict for name in models}
+    keys = {}
+    if registry is not None:
+        digest = data_digest(X_train, y_train)
+        for name, model in models.items():
+            keys[name] = model_key(name, model, feature_cols, digest)
+            fitted = registry.get(dataset_id, name, keys[name])
+            if fitted is not None:
+                models[name], tasks[name] = fitted, _predict
 
-    gb = GradientBoostingClassifier(n_estimators=100, max_depth=3, random_state=42)
-    gb.fit(X_train, y_train)
-    gb_pred = gb.predict(X_test)
+    (rf_pred, rf_proba), (gb_pred, gb_proba) = Parallel(n_jobs=2, prefer="threads")(
+        delayed(tasks[name])(model, X_train, y_train, X_test) for name, model in models.items()
+    )
 
-    return X_test, y_test, rf_pred, gb_pred
+    for name, key in keys.items():
+        if tasks[name] is _fit_predict:
+            registry.put(dataset_id, name, key, models[name])
+        else:
+            registry.mark_latest(dataset_id, name, key)
 
+    X_test = pd.DataFrame(X_test, index=y_test.index, columns=feature_cols, copy=False)
+    return {
+        "X_test": X_test,
+        "y_test": y_test,
+        "rf_pred": rf_pred,
+        "gb_pred": gb_pred,
+        "rf_proba": rf_proba,
+        "gb_proba": gb_proba,
+        "models": models,
+    }
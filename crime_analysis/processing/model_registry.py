@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+import joblib
+import numpy as np
+from django.conf import settings
+
+
+# Parameters that change how fast a model fits, not what it learns
+_RUNTIME_PARAMS = {"n_jobs", "verbose", "warm_start"}
+
+LATEST_FILE = "latest.json"
+
+
+def data_digest(X: np.ndarray, y: np.ndarray) -> str:
+    """
+    Content hash of a training set.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    for arr in (X, y):
+        arr = np.ascontiguousarray(arr)
+        h.update(str((arr.dtype.str, arr.shape)).encode())
+        h.update(memoryview(arr).cast("B"))
+    return h.hexdigest()
+
+
+def model_key(name: str, estimator, feature_cols, digest: str) -> str:
+    """
+    Registry key for ``estimator`` (unfitted) trained on the features
+    ``feature_cols`` of the training set with hash ``digest``.
+    """
+    params = {
+        k: v for k, v in estimator.get_params().items() if k not in _RUNTIME_PARAMS
+    }
+    payload = json.dumps(
+        {
+            "name": name,
+            "estimator": type(estimator).__name__,
+            "params": params,
+            "features": list(feature_cols),
+            "data": digest,
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+class ModelRegistry:
+    """
+    Fitted estimators on local disk, one joblib file per model::
+
+        <MODEL_ROOT>/<dataset id>/<name>-<key>.joblib
+        <MODEL_ROOT>/<dataset id>/latest.json      name -> key of the last fit
+
+    Models are loaded memory-mapped. Nothing is kept in memory between
+    calls: jobs run in worker processes that handle one job each, and a job
+    loads each model at most once.
+    """
+
+    def __init__(self, root=None):
+        self._root = Path(root) if root is not None else None
+
+    @property
+    def root(self) -> Path:
+        if self._root is None:
+            self._root = Path(settings.MODEL_ROOT)
+        return self._root
+
+    def path(self, dataset_id: int, name: str, key: str) -> Path:
+        return self.root / str(int(dataset_id)) / f"{name}-{key}.joblib"
+
+    def get(self, dataset_id: int, name: str, key: str):
+        """
+        Return the fitted model stored under ``key``, or None.
+        """
+        path = self.path(dataset_id, name, key)
+        if not path.exists():
+            return None
+        return joblib.load(path, mmap_mode="r")
+
+    def put(self, dataset_id: int, name: str, key: str, model):
+        path = self.path(dataset_id, name, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".joblib.part")
+        joblib.dump(model, tmp_path)
+        os.replace(tmp_path, path)
+        self._set_latest(dataset_id, name, key)
+
+    def latest(self, dataset_id: int, name: str):
+        """
+        The most recently trained (or reused) model called ``name``, or None.
+        """
+        key = self._read_latest(dataset_id).get(name)
+        if key is None:
+            return None
+        return self.get(dataset_id, name, key)
+
+    def mark_latest(self, dataset_id: int, name: str, key: str):
+        self._set_latest(dataset_id, name, key)
+
+    def delete_dataset(self, dataset_id: int):
+        shutil.rmtree(self.root / str(int(dataset_id)), ignore_errors=True)
+
+    def _read_latest(self, dataset_id: int) -> dict:
+        try:
+            with open(self.root / str(int(dataset_id)) / LATEST_FILE) as fh:
+                return json.load(fh)
+        except FileNotFoundError:
+            return {}
+
+    def _set_latest(self, dataset_id: int, name: str, key: str):
+        latest = self._read_latest(dataset_id)
+        if latest.get(name) == key:
+            return
+        latest[name] = key
+        path = self.root / str(int(dataset_id)) / LATEST_FILE
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".json.part")
+        with open(tmp_path, "w") as fh:
+            json.dump(latest, fh)
+        os.replace(tmp_path, path)
+
+
+MODELS = ModelRegistry()
@@ -0,0 +1,158 @@
+"""
+Composable frame pipeline with per-stage profiling.
+
+A pipeline is a list of ``(name, fn)`` stages; each ``fn`` takes the
+current frame and returns the next one (the first stage gets None, so it
+can load the data). run_pipeline() holds the only reference to the frame
+between stages, so a frame that a stage replaces is freed as soon as the
+stage returns, and the stages themselves work in place where they can.
+
+measure() records wall time, CPU time and peak memory of any block, and
+can dump a cProfile of it; background jobs wrap every stage in it.
+"""
+import cProfile
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from functools import partial
+
+
+_STATUS = "/proc/self/status"
+_CLEAR_REFS = "/proc/self/clear_refs"
+
+
+def _status_bytes(field: str):
+    try:
+        with open(_STATUS) as status:
+            for line in status:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def current_rss() -> int:
+    """
+    Resident memory of this process in bytes (0 where unknown).
+    """
+    return _status_bytes("VmRSS") or 0
+
+
+def reset_peak_rss() -> bool:
+    """
+    Restart peak RSS tracking from the current RSS (Linux only).
+
+    :return: False if the peak cannot be reset; peak_rss() then reports
+             the peak since the process started
+    """
+    try:
+        with open(_CLEAR_REFS, "w") as clear_refs:
+            clear_refs.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss() -> int:
+    """
+    Peak resident memory in bytes since the last reset_peak_rss().
+    """
+    peak = _status_bytes("VmHWM")
+    if peak is not None:
+        return peak
+    # ru_maxrss is in bytes on macOS, kilobytes elsewhere
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+@contextmanager
+def track_memory(entry: dict):
+    """
+    Record the enclosed block's peak resident memory (``peak_rss``), the
+    resident memory after it (``rss``) and whether the peak covers only
+    this block (``peak_rss_reset``) in ``entry``, in bytes.
+    """
+    entry["peak_rss_reset"] = reset_peak_rss()
+    try:
+        yield entry
+    finally:
+        entry["peak_rss"] = peak_rss()
+        entry["rss"] = current_rss()
+
+
+@contextmanager
+def measure(entry: dict, profile_path=None):
+    """
+    Record the enclosed block's wall time (``seconds``), CPU time of all
+    threads of this process (``cpu_seconds``) and memory (see
+    track_memory) in ``entry``, also when the block raises.
+
+    With ``profile_path`` the block runs under cProfile (calling thread
+    only) and the stats are written there for pstats / snakeviz.
+    """
+    profiler = cProfile.Profile() if profile_path else None
+    started, cpu_started = time.perf_counter(), time.process_time()
+    try:
+        with track_memory(entry):
+            if profiler is None:
+                yield entry
+            else:
+                profiler.enable()
+                try:
+                    yield entry
+                finally:
+                    profiler.disable()
+    finally:
+        entry["seconds"] = round(time.perf_counter() - started, 3)
+        entry["cpu_seconds"] = round(time.process_time() - cpu_started, 3)
+        if profiler is not None:
+            os.makedirs(os.path.dirname(profile_path), exist_ok=True)
+            profiler.dump_stats(profile_path)
+            entry["profile"] = os.path.basename(profile_path)
+
+
+def summarize(entries) -> dict:
+    """
+    Run totals of stage stats dicts: summed wall and CPU time, the highest
+    peak memory and the rows of the last stage that reported any.
+    """
+    entries = [e for e in entries if e.get("seconds") is not None]
+    rows = [e["rows"] for e in entries if e.get("rows") is not None]
+    return {
+        "seconds": round(sum(e["seconds"] for e in entries), 3),
+        "cpu_seconds": round(sum(e.get("cpu_seconds", 0) for e in entries), 3),
+        "peak_rss": max((e.get("peak_rss", 0) for e in entries), default=0),
+        "rows": rows[-1] if rows else None,
+    }
+
+
+@contextmanager
+def _report_stage(report: dict, name: str):
+    entry = report.setdefault(name, {"name": name})
+    with measure(entry):
+        yield entry
+
+
+def run_pipeline(stages, df=None, stage=None):
+    """
+    Run ``stages`` in order, passing each the previous stage's frame.
+
+    :param stages: list of (name, fn) with fn(df) returning the next frame
+    :param df: input of the first stage
+    :param stage: context manager factory taking a stage name and yielding
+                  that stage's stats dict (e.g. StageTracker.stage). By
+                  default each stage is measured with measure().
+    :return: (final frame, {name: stats dict})
+    """
+    report = {}
+    stage = stage or partial(_report_stage, report)
+    for name, fn in stages:
+        with stage(name) as entry:
+            df = fn(df)
+            if df is not None:
+                entry["rows"] = len(df)
+        report[name] = entry
+    return df, report
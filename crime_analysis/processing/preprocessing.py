@@ -1,42 +1,160 @@
 import pandas as pd
 import numpy as np
 
+
+# Date format of the Chicago crime export, e.g. "01/31/2020 11:45:00 PM"
+DATE_FORMAT = "%m/%d/%Y %I:%M:%S %p"
+
+# Season names in code order (alphabetical, as pandas would sort them)
+SEASONS = ["Fall", "Spring", "Summer", "Winter"]
+
+# Month number -> season name (index 0 unused)
+SEASON_BY_MONTH = np.array([
+    None,
+    "Winter", "Winter",
+    "Spring", "Spring", "Spring",
+    "Summer", "Summer", "Summer",
+    "Fall", "Fall", "Fall",
+    "Winter",
+], dtype=object)
+
+
 def get_season(month: int) -> str:
     if month in [12, 1, 2]: return "Winter"
     if month in [3, 4, 5]: return "Spring"
     if month in [6, 7, 8]: return "Summer"
     return "Fall"
 
+
+def _digits(chars: np.ndarray, start: int, stop: int) -> np.ndarray:
+    value = np.zeros(len(chars), dtype=np.int64)
+    for i in range(start, stop):
+        value = value * 10 + (chars[:, i].astype(np.int64) - ord('0'))
+    return value
+
+
+def _parse_export_dates(values: np.ndarray) -> np.ndarray:
+    """
+    Vectorized parser for DATE_FORMAT. Works on the raw bytes of the
+    fixed-width strings; anything that does not match exactly is NaT.
+    """
+    width = 22
+    chars = values.astype(f'S{width + 1}').view(np.uint8).reshape(len(values), width + 1)
+
+    digit_cols = [0, 1, 3, 4, 6, 7, 8, 9, 11, 12, 14, 15, 17, 18]
+    valid = (chars[:, digit_cols] >= ord('0')).all(axis=1)
+    valid &= (chars[:, digit_cols] <= ord('9')).all(axis=1)
+    for col, sep in ((2, '/'), (5, '/'), (10, ' '), (13, ':'), (16, ':'), (19, ' '), (21, 'M')):
+        valid &= chars[:, col] == ord(sep)
+    pm = chars[:, 20] == ord('P')
+    valid &= pm | (chars[:, 20] == ord('A'))
+    valid &= chars[:, width] == 0
+
+    month = _digits(chars, 0, 2)
+    day = _digits(chars, 3, 5)
+    year = _digits(chars, 6, 10)
+    hour = _digits(chars, 11, 13)
+    minute = _digits(chars, 14, 16)
+    second = _digits(chars, 17, 19)
+    valid &= (month >= 1) & (month <= 12) & (hour >= 1) & (hour <= 12)
+    valid &= (minute < 60) & (second < 60) & (day >= 1)
+
+    months = np.where(valid, (year - 1970) * 12 + month - 1, 0).astype('datetime64[M]')
+    month_start = months.astype('datetime64[D]')
+    days_in_month = ((months + 1).astype('datetime64[D]') - month_start).astype(np.int64)
+    valid &= day <= days_in_month
+
+    seconds = ((hour % 12 + 12 * pm) * 60 + minute) * 60 + second
+    parsed = month_start.astype('datetime64[ns]') + (day - 1).astype('timedelta64[D]')
+    parsed = parsed + seconds.astype('timedelta64[s]')
+    parsed[~valid] = np.datetime64('NaT')
+    return parsed
+
+
+def parse_dates(dates: pd.Series) -> pd.Series:
+    """
+    Parse dates in the export's fixed format at NumPy speed, with the same
+    result as ``pd.to_datetime(dates, format=DATE_FORMAT, errors='coerce')``:
+    values the fast path rejects go through strptime, and those that still
+    do not parse are NaT. A column with no value in that format is parsed
+    by pandas' format inference instead.
+    """
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        return dates
+
+    try:
+        parsed = pd.Series(
+            _parse_export_dates(dates.to_numpy(dtype=object)),
+            index=dates.index, name=dates.name,
+        )
+    except UnicodeEncodeError:
+        parsed = pd.Series(pd.NaT, index=dates.index, name=dates.name, dtype='datetime64[ns]')
+
+    missed = parsed.isna() & dates.notna()
+    if missed.any():
+        parsed[missed] = pd.to_datetime(dates[missed], format=DATE_FORMAT, errors='coerce')
+        # Inferring a format for the leftovers alone could read bad rows
+        # (e.g. a month of 13) in another format; only a whole column in a
+        # different format is inferred
+        if parsed.isna().all():
+            parsed = pd.to_datetime(dates, errors='coerce')
+    return parsed
+
+
+def _drop_columns(df: pd.DataFrame, columns) -> None:
+    # del removes a column without rebuilding the rest of the frame
+    for col in columns:
+        if col in df.columns:
+            del df[col]
+
+
 def preprocess_raw(df: pd.DataFrame) -> pd.DataFrame:
     """
     Clean raw crime data and add basic metadata.
+
+    ``df`` is modified in place and must not be reused. Columns are added
+    and removed one at a time, and the rows are copied at most once: a
+    single take drops unparsable dates and duplicates and sorts by date.
+    Input that is already clean and sorted is not copied at all.
     """
     # Drop geo columns
-    columns_to_drop = [
+    _drop_columns(df, [
         'X Coordinate', 'Y Coordinate', 'Latitude', 'Longitude',
         'Location', 'Community Area', 'Ward'
-    ]
-    df = df.drop(columns=columns_to_drop, errors='ignore')
+    ])
 
     # Fix inconsistent crime names
     df['Primary Type'] = df['Primary Type'].replace(
         {'CRIM SEXUAL ASSAULT': 'CRIMINAL SEXUAL ASSAULT'}
-    )
+    ).astype('category')
 
     # Date parsing
-    df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
-    df = df.dropna(subset=['Date'])
-    df['Month'] = df['Date'].dt.month
-    df['Hour'] = df['Date'].dt.hour
-    df['Minute'] = df['Date'].dt.minute
-    df['DayOfWeek'] = df['Date'].dt.dayofweek
-    df['is_weekend'] = df['DayOfWeek'].apply(lambda x: 1 if x >= 5 else 0)
-    df['is_night'] = df['Hour'].apply(lambda h: 1 if (h >= 22 or h < 6) else 0)
-    df['Season'] = df['Month'].apply(get_season)
-
-    # Remove duplicates and empty columns
-    df = df.drop_duplicates()
-    df = df.dropna(axis=1, how='all')
+    df['Date'] = parse_dates(df['Date'])
+
+    # Rows to keep (valid date, first of any duplicates), in date order.
+    # Metadata columns are derived from the date, so duplicates are the
+    # same with or without them.
+    keep = df['Date'].notna().to_numpy() & ~df.duplicated().to_numpy()
+    dates = df['Date'].to_numpy()
+    if not keep.all() or not df['Date'].is_monotonic_increasing:
+        rows = np.flatnonzero(keep)
+        df = df.take(rows[np.argsort(dates[rows], kind='stable')])
+    df.set_index('Date', inplace=True)
+
+    # Remove empty columns
+    _drop_columns(df, [col for col in df.columns if df[col].isna().all()])
+
+    index = df.index
+    month = index.month.to_numpy()
+    hour = index.hour.to_numpy()
+    day_of_week = index.dayofweek.to_numpy()
+    df['Month'] = month
+    df['Hour'] = hour
+    df['Minute'] = index.minute.to_numpy()
+    df['DayOfWeek'] = day_of_week
+    df['is_weekend'] = (day_of_week >= 5).astype(np.int64)
+    df['is_night'] = ((hour >= 22) | (hour < 6)).astype(np.int64)
+    df['Season'] = SEASON_BY_MONTH[month]
 
     # Target variable: violent crimes
     violent_types = [
@@ -45,12 +163,7 @@ def preprocess_raw(df: pd.DataFrame) -> pd.DataFrame:
     ]
     df['is_violent_crime'] = df['Primary Type'].isin(violent_types).astype(int)
 
-    # Set time index
-    df = df.sort_values('Date')
-    df = df.set_index('Date')
-
     # Initialize crime_count
     df['crime_count'] = 1
 
     return df
-
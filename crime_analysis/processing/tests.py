@@ -1,3 +1,300 @@
-from django.test import TestCase
+import os
+import pstats
+import tempfile
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from django.test import SimpleTestCase
+from sklearn.ensemble import RandomForestClassifier
+
+from crime_analysis.benchmarks.synthetic import generate_crimes
+from .backtest import _run_fold
+from .downsampling import buckets_for_width, minmax_indices
+from .dtypes import FALLBACK_INT, compact_dtypes, concat_compact
+from .evaluation import compute_metrics, threshold_sweep
+from .feature_engineering import add_lag_features
+from .incremental import RebuildRequired, append_features, build_features, recode_primary_types
+from .ml_models import _fit_predict
+from .pipeline import measure, run_pipeline, summarize
+from .preprocessing import DATE_FORMAT, parse_dates
+
+
+def reference_lag_features(df, group=None):
+    """
+    add_lag_features' columns the slow way: a reindexed hourly series per
+    group, shifted and rolled by pandas.
+    """
+    hour = df.index.floor("h")
+    keys = [hour] if group is None else [df[group].to_numpy(), hour]
+    counts = df.groupby(keys)["is_violent_crime"].agg(["size", "sum"])
+    full = pd.date_range(hour.min(), hour.max(), freq="h")
+    features = {}
+    for key, frame in (counts.groupby(level=0) if group else [(None, counts)]):
+        frame = frame.droplevel(0) if group else frame
+        frame = frame.reindex(full, fill_value=0).astype(float)
+        for column, prefix in (("size", ""), ("sum", "v_")):
+            series = frame[column]
+            table = pd.DataFrame({f"lag_{prefix}{k}h": series.shift(k) for k in (1, 2, 3)})
+            table[f"rolling_{prefix}3h"] = series.rolling(3).mean().shift(1)
+            features.setdefault(key, []).append(table)
+    rows = []
+    for i in range(len(df)):
+        key = None if group is None else df[group].iloc[i]
+        tables = features[key]
+        rows.append({col: t.at[hour[i], col] for t in tables for col in t.columns})
+    return pd.DataFrame(rows, index=df.index)
+
+
+class LagFeaturesTests(SimpleTestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        # Sparse enough that many hours are empty
+        dates = pd.Timestamp("2023-01-01") + pd.to_timedelta(np.sort(rng.integers(0, 48 * 3600, 120)), unit="s")
+        self.df = pd.DataFrame({
+            "is_violent_crime": rng.random(120) < 0.3,
+            "District": rng.choice([1.0, 2.0, np.nan], 120),
+        }, index=pd.DatetimeIndex(dates, name="Date"))
+
+    def assert_matches_reference(self, group=None):
+        expected = reference_lag_features(self.df, group)
+        expected = expected[expected.notna().all(axis=1)]
+        result = add_lag_features(self.df.copy(), group_by=group)
+        pd.testing.assert_frame_equal(result[expected.columns], expected, check_names=False)
+
+    def test_matches_shifted_hourly_series(self):
+        self.assert_matches_reference()
+
+    def test_per_group(self):
+        # Missing districts form their own group
+        self.df["District"] = self.df["District"].fillna(-1.0)
+        self.assert_matches_reference("District")
+        with_nan = self.df.assign(District=self.df["District"].replace(-1.0, np.nan))
+        pd.testing.assert_frame_equal(
+            add_lag_features(with_nan.copy(), group_by="District").drop(columns="District"),
+            add_lag_features(self.df.copy(), group_by="District").drop(columns="District"),
+        )
+
+    def test_empty_frame(self):
+        result = add_lag_features(self.df.iloc[:0].copy())
+        self.assertIn("rolling_v_3h", result.columns)
+        self.assertEqual(len(result), 0)
+
+
+class AppendFeaturesTests(SimpleTestCase):
+
+    def setUp(self):
+        raw = generate_crimes(3000, seed=1, start="2023-01-01", end="2023-03-01")
+        dates = pd.to_datetime(raw["Date"], format=DATE_FORMAT)
+        cutoff = pd.Timestamp("2023-02-10")
+        self.history = raw[dates < cutoff].reset_index(drop=True)
+        self.delta = raw[dates >= cutoff].reset_index(drop=True)
+
+    def assert_append_matches_rebuild(self, history, delta):
+        full, _ = build_features(pd.concat([history, delta], ignore_index=True))
+        stored, state = build_features(history.copy())
+        appended, state, types_changed = append_features(delta.copy(), state)
+
+        # As the append job combines them
+        combined = concat_compact([compact_dtypes(stored), compact_dtypes(appended)])
+        if types_changed:
+            combined = recode_primary_types(combined, state.types)
+        full = compact_dtypes(full)
+
+        # Categories of the other columns are unions in a different order
+        pd.testing.assert_frame_equal(combined, full, check_categorical=False)
+        pd.testing.assert_index_equal(
+            combined["Primary Type"].cat.categories, full["Primary Type"].cat.categories
+        )
+        return types_changed
+
+    def test_append_matches_full_rebuild(self):
+        self.assertFalse(self.assert_append_matches_rebuild(self.history, self.delta))
+
+    def test_new_primary_types_are_recoded(self):
+        delta = self.delta.copy()
+        # Sorts between existing types, so stored codes shift
+        delta.loc[::50, "Primary Type"] = "BURGLARY OF A DRONE"
+        self.assertTrue(self.assert_append_matches_rebuild(self.history, delta))
+
+    def test_rows_at_the_last_stored_timestamp_are_not_duplicated(self):
+        dates = pd.to_datetime(self.history["Date"], format=DATE_FORMAT)
+        overlap = self.history[dates == dates.max()]
+        delta = pd.concat([overlap, self.delta], ignore_index=True)
+        _, state = build_features(self.history.copy())
+        appended, _, _ = append_features(delta, state)
+        expected, _, _ = append_features(self.delta.copy(), state)
+        pd.testing.assert_frame_equal(appended, expected)
+
+    def test_backdated_rows_require_a_rebuild(self):
+        _, state = build_features(self.history.copy())
+        delta = pd.concat([self.history.iloc[:10], self.delta], ignore_index=True)
+        with self.assertRaises(RebuildRequired):
+            append_features(delta, state)
+
+
+class ParseDatesTests(SimpleTestCase):
+    """
+    The vectorized parser must agree with pd.to_datetime(format=DATE_FORMAT).
+    """
+
+    def assert_matches_to_datetime(self, values):
+        dates = pd.Series(values, dtype=object)
+        expected = pd.to_datetime(dates, format=DATE_FORMAT, errors="coerce")
+        pd.testing.assert_series_equal(parse_dates(dates), expected, check_dtype=False)
+
+    def test_noon_and_midnight(self):
+        self.assert_matches_to_datetime([
+            "01/31/2020 12:00:00 AM", "01/31/2020 12:59:59 AM",
+            "01/31/2020 12:00:00 PM", "01/31/2020 12:59:59 PM",
+            "01/31/2020 01:00:00 AM", "01/31/2020 11:59:59 PM",
+        ])
+
+    def test_calendar(self):
+        self.assert_matches_to_datetime([
+            "02/29/2020 10:00:00 AM", "02/29/2021 10:00:00 AM", "04/31/2020 10:00:00 AM",
+            "12/31/1999 11:59:59 PM", "01/01/2000 12:00:00 AM",
+        ])
+
+    def test_unpadded_and_lowercase(self):
+        self.assert_matches_to_datetime([
+            "1/5/2020 1:02:03 AM", "01/05/2020 1:02:03 PM", "01/05/2020 01:02:03 pm",
+        ])
+
+    def test_bad_rows_and_missing_values(self):
+        self.assert_matches_to_datetime([
+            "01/31/2020 10:00:00 AM", "13/01/2020 01:00:00 AM", "01/00/2020 01:00:00 AM",
+            "01/31/2020 00:30:00 AM", "01/31/2020 13:00:00 PM", "01/31/2020 10:60:00 AM",
+            "01/31/2020 10:00:00 XM", "01/31/2020 10:00:00 AMX", "not a date", "", None, np.nan,
+        ])
+
+    def test_other_formats_are_inferred(self):
+        dates = pd.Series(["2020-01-05 13:00:00", "2020-01-06 01:30:00", None], dtype=object)
+        pd.testing.assert_series_equal(parse_dates(dates), pd.to_datetime(dates, errors="coerce"))
+
+    def test_random_dates(self):
+        rng = np.random.default_rng(0)
+        seconds = rng.integers(0, 40 * 365 * 86400, size=2000)
+        dates = pd.Timestamp("1990-01-01") + pd.to_timedelta(seconds, unit="s")
+        self.assert_matches_to_datetime(dates.strftime(DATE_FORMAT).tolist())
+
+
+class CompactDtypesTests(SimpleTestCase):
+
+    def test_out_of_range_bounded_column_is_widened(self):
+        df = compact_dtypes(pd.DataFrame({"Hour": [0, 23], "Year": [2020, 40000]}))
+        self.assertEqual(df["Hour"].dtype, np.int8)
+        self.assertEqual(df["Year"].dtype, FALLBACK_INT)
+        self.assertEqual(df["Year"].tolist(), [2020, 40000])
+
+    def test_bounded_column_beyond_the_fallback_raises(self):
+        with self.assertRaises(ValueError):
+            compact_dtypes(pd.DataFrame({"Beat": [1, 2**40]}))
+
+
+class MetricsTests(SimpleTestCase):
+
+    def test_sweep_matches_thresholding(self):
+        rng = np.random.default_rng(0)
+        y_true = rng.random(200) < 0.3
+        y_score = rng.integers(0, 20, size=200) / 20
+        sweep = threshold_sweep(y_true, y_score)
+        for i, threshold in enumerate(sweep["thresholds"]):
+            pred = y_score >= threshold
+            self.assertEqual(sweep["tp"][i], np.sum(pred & y_true))
+            self.assertEqual(sweep["fp"][i], np.sum(pred & ~y_true))
+
+    def test_empty_test_split(self):
+        sweep = threshold_sweep([], [])
+        self.assertEqual(len(sweep["thresholds"]), 0)
+        self.assertEqual((sweep["positives"], sweep["negatives"]), (0, 0))
+        metrics = compute_metrics(np.zeros(0), {"Random Forest": np.zeros(0)})
+        self.assertEqual(metrics["Model"].tolist(), ["Random Forest"])
+        self.assertTrue(metrics.drop(columns="Model").isna().all(axis=None))
+
+
+class PredictTests(SimpleTestCase):
+
+    def test_single_class_training_data(self):
+        X = np.random.default_rng(0).random((40, 3))
+        for y, expected in ((np.zeros(40, dtype=bool), 0.0), (np.ones(40, dtype=bool), 1.0)):
+            labels, proba = _fit_predict(RandomForestClassifier(n_estimators=5), X, y, X[:5])
+            np.testing.assert_array_equal(labels, y[:5])
+            np.testing.assert_array_equal(proba, np.full(5, expected))
+
+
+class BacktestFoldTests(SimpleTestCase):
+
+    def test_training_window_without_positives(self):
+        X = np.random.default_rng(0).random((60, 3)).astype(np.float32)
+        y = np.zeros(60, dtype=np.int8)
+        y[45:] = 1
+        for gb_model in ("gradient_boosting", "hist"):
+            rows = _run_fold(0, X, y, ((0, 40), (40, 60)), gb_model)
+            self.assertEqual([row["model"] for row in rows], ["Random Forest", "Gradient Boosting"])
+            for row in rows:
+                self.assertEqual(row["recall"], 0.0)
+                self.assertEqual(row["accuracy"], 0.25)
+                self.assertEqual(row["roc_auc"], 0.5)
+
+
+class DownsamplingTests(SimpleTestCase):
+
+    def test_short_series_are_kept_whole(self):
+        np.testing.assert_array_equal(minmax_indices(np.arange(10.0), 5), np.arange(10))
+        np.testing.assert_array_equal(minmax_indices(np.arange(10.0), 0), np.arange(10))
+
+    def test_each_bucket_keeps_its_extremes(self):
+        values = np.random.default_rng(0).normal(size=10_007)
+        keep = minmax_indices(values, 100)
+        self.assertLessEqual(len(keep), 2 * 100 + 2)
+        self.assertEqual((keep[0], keep[-1]), (0, len(values) - 1))
+        self.assertTrue(np.all(np.diff(keep) > 0))
+        size = -(-len(values) // 100)
+        for start in range(0, len(values), size):
+            run = values[start:start + size]
+            self.assertIn(start + run.argmin(), keep)
+            self.assertIn(start + run.argmax(), keep)
+
+    def test_nans_are_skipped(self):
+        values = np.arange(100.0)
+        values[10:20] = np.nan
+        values[15] = 1000.0
+        keep = minmax_indices(values, 10)
+        self.assertIn(15, keep)
+        self.assertFalse(np.isnan(values[keep[1:-1]]).any())
+
+    def test_buckets_for_width(self):
+        self.assertEqual(buckets_for_width(14, 100), 1400)
+        self.assertEqual(buckets_for_width(0.001, 100), 1)
+
+
+class PipelineTests(SimpleTestCase):
+
+    def test_stages_are_chained_and_measured(self):
+        df, report = run_pipeline([
+            ("load", lambda _: pd.DataFrame({"x": range(10)})),
+            ("filter", lambda df: df[df["x"] % 2 == 0]),
+            ("nothing", lambda df: None),
+        ])
+        self.assertIsNone(df)
+        self.assertEqual(list(report), ["load", "filter", "nothing"])
+        self.assertEqual([report[name].get("rows") for name in report], [10, 5, None])
+        for entry in report.values():
+            self.assertGreaterEqual(entry["seconds"], 0)
+            self.assertGreater(entry["peak_rss"], 0)
+        totals = summarize(report.values())
+        self.assertEqual(totals["rows"], 5)
+        self.assertEqual(totals["peak_rss"], max(e["peak_rss"] for e in report.values()))
+
+    def test_failed_blocks_are_measured_and_profiled(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "stage", "01-load.pstats")
+            entry = {}
+            with self.assertRaises(ZeroDivisionError):
+                with measure(entry, path):
+                    sorted(range(1000))
+                    1 / 0
+            self.assertIn("seconds", entry)
+            self.assertEqual(entry["profile"], "01-load.pstats")
+            self.assertTrue(pstats.Stats(path).total_calls)
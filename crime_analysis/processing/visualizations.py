@@ -1,59 +1,178 @@
-import matplotlib.pyplot as plt
+import base64
+import io
+
+import numpy as np
 import seaborn as sns
 import pandas as pd
+from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
+from matplotlib.figure import Figure
 
+from .downsampling import buckets_for_width, minmax_indices
 
-def generate_charts(df, rf_pred=None, gb_pred=None, feature_importances=None):
-    import io
-    import base64
-    from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
 
-    charts = {}
+DEFAULT_DPI = 100
+
+CHARTS = ('crime_timeseries', 'feature_importances', 'predictions_vs_actual')
+
+
+def _plot_downsampled(ax, index, values, n_buckets, **kwargs):
+    """
+    Plot a line through at most ~2 * n_buckets points (min/max per bucket),
+    so drawing time does not grow with the length of the history.
+    """
+    values = np.asarray(values)
+    keep = minmax_indices(values, n_buckets)
+    ax.plot(index[keep], values[keep], **kwargs)
+
+
+def _png(fig: Figure, dpi: int) -> bytes:
+    """
+    Rasterize a figure to PNG bytes.
+
+    Figures are created with matplotlib.figure.Figure rather than pyplot, so
+    they are never registered globally and are freed as soon as this returns.
+    """
+    FigureCanvas(fig)
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', dpi=dpi)
+    fig.clear()
+    return buf.getvalue()
+
+
+# Chart data
+
+def crime_timeseries_data(df) -> pd.Series:
+    # df: processed rows or hourly rollup; both have crime_count on a DatetimeIndex
+    return df['crime_count'].astype(np.int64).resample('D').sum()
+
+
+def feature_importances_data(feature_importances) -> pd.Series:
+    return feature_importances.sort_values(ascending=False).head(10)
+
+
+def predictions_data(df, rf_pred, gb_pred) -> pd.DataFrame:
+    # Predictions cover the test split, i.e. the last rows of the frame
+    agg = df[['is_violent_crime']].iloc[len(df) - len(rf_pred):].copy()
+    agg['rf_pred'] = rf_pred
+    agg['gb_pred'] = gb_pred
+    # Compact frames hold int8 labels; sum in int64
+    return agg.astype(np.int64).resample('h').sum()
+
 
-    # Crime time series
-    fig1, ax1 = plt.subplots(figsize=(14, 5))
-    df['crime_count'].resample('D').sum().plot(ax=ax1)
+# Rendered charts
+
+def crime_timeseries_chart(df, dpi=DEFAULT_DPI):
+    fig = Figure(figsize=(14, 5))
+    ax1 = fig.subplots()
+    data = crime_timeseries_data(df)
+    _plot_downsampled(ax1, data.index, data.to_numpy(), buckets_for_width(14, dpi))
     ax1.set_title("Crime Count Time Series (Daily)")
     ax1.set_xlabel("Date")
     ax1.set_ylabel("Count")
     ax1.grid(True)
-    canvas = FigureCanvas(fig1)
-    img1 = io.BytesIO()
-    canvas.print_png(img1)
-    charts['crime_timeseries'] = base64.b64encode(img1.getvalue()).decode()
-
-    # Feature importances
-    if feature_importances is not None:
-        fig2, ax2 = plt.subplots(figsize=(12, 6))
-        top = feature_importances.sort_values(ascending=False).head(10)
-        sns.barplot(x=top.values, y=top.index, ax=ax2, palette="viridis")
-        ax2.set_title("Top Features")
-        ax2.set_xlabel("Importance")
-        ax2.set_ylabel("Feature")
-        ax2.grid(True, axis='x')
-        canvas = FigureCanvas(fig2)
-        img2 = io.BytesIO()
-        canvas.print_png(img2)
-        charts['feature_importances'] = base64.b64encode(img2.getvalue()).decode()
-
-    # Predictions vs actual
-    if rf_pred is not None and gb_pred is not None:
-        fig3, ax3 = plt.subplots(figsize=(15, 6))
-        agg = df[['is_violent_crime']].copy()
-        agg['rf_pred'] = rf_pred
-        agg['gb_pred'] = gb_pred
-        agg = agg.resample('h').sum()
-        ax3.plot(agg.index, agg['is_violent_crime'], label='Actual', color='blue')
-        ax3.plot(agg.index, agg['rf_pred'], label='RF Prediction', color='green', alpha=0.7)
-        ax3.plot(agg.index, agg['gb_pred'], label='GB Prediction', color='red', alpha=0.7)
-        ax3.set_title("Predictions vs Actual (Violent Crimes)")
-        ax3.set_xlabel("Date")
-        ax3.set_ylabel("Count")
-        ax3.legend()
-        ax3.grid(True)
-        canvas = FigureCanvas(fig3)
-        img3 = io.BytesIO()
-        canvas.print_png(img3)
-        charts['predictions_vs_actual'] = base64.b64encode(img3.getvalue()).decode()
+    return _png(fig, dpi)
+
+
+def feature_importances_chart(feature_importances, dpi=DEFAULT_DPI):
+    fig = Figure(figsize=(12, 6))
+    ax2 = fig.subplots()
+    top = feature_importances_data(feature_importances)
+    sns.barplot(x=top.values, y=top.index, ax=ax2, palette="viridis")
+    ax2.set_title("Top Features")
+    ax2.set_xlabel("Importance")
+    ax2.set_ylabel("Feature")
+    ax2.grid(True, axis='x')
+    return _png(fig, dpi)
+
+
+def predictions_chart(df, rf_pred, gb_pred, dpi=DEFAULT_DPI):
+    fig = Figure(figsize=(15, 6))
+    ax3 = fig.subplots()
+    agg = predictions_data(df, rf_pred, gb_pred)
+    n_buckets = buckets_for_width(15, dpi)
+    _plot_downsampled(ax3, agg.index, agg['is_violent_crime'], n_buckets, label='Actual', color='blue')
+    _plot_downsampled(ax3, agg.index, agg['rf_pred'], n_buckets, label='RF Prediction', color='green', alpha=0.7)
+    _plot_downsampled(ax3, agg.index, agg['gb_pred'], n_buckets, label='GB Prediction', color='red', alpha=0.7)
+    ax3.set_title("Predictions vs Actual (Violent Crimes)")
+    ax3.set_xlabel("Date")
+    ax3.set_ylabel("Count")
+    ax3.legend()
+    ax3.grid(True)
+    return _png(fig, dpi)
+
+
+def chart_available(name, results=None) -> bool:
+    """
+    Whether the inputs of chart ``name`` exist in the analysis results.
+    """
+    results = results or {}
+    if name == 'crime_timeseries':
+        return True
+    if name == 'feature_importances':
+        return results.get('feature_importances') is not None
+    if name == 'predictions_vs_actual':
+        return results.get('rf_pred') is not None and results.get('gb_pred') is not None
+    raise ValueError(f"Unknown chart: {name}")
+
+
+def render_chart(name, df, results=None, **options):
+    """
+    PNG bytes of one chart, or None if its inputs are not available.
 
+    :param name: one of CHARTS
+    :param results: analysis results (rf_pred, gb_pred, feature_importances)
+    :param options: rendering options (dpi)
+    """
+    if not chart_available(name, results):
+        return None
+    if name == 'crime_timeseries':
+        return crime_timeseries_chart(df, **options)
+    if name == 'feature_importances':
+        return feature_importances_chart(results['feature_importances'], **options)
+    return predictions_chart(df, results['rf_pred'], results['gb_pred'], **options)
+
+
+def _regular_series(index: pd.DatetimeIndex, freq: str, **columns) -> dict:
+    # Evenly spaced points: send the start and step instead of every timestamp
+    return {
+        'start': index[0].isoformat() if len(index) else None,
+        'freq': freq,
+        'length': len(index),
+        **{name: [round(float(v), 6) for v in values] for name, values in columns.items()},
+    }
+
+
+def chart_series(name, df, results=None):
+    """
+    The data behind one chart as a compact JSON-serializable dict, for
+    client-side rendering. None if its inputs are not available.
+    """
+    if not chart_available(name, results):
+        return None
+    if name == 'crime_timeseries':
+        data = crime_timeseries_data(df)
+        return _regular_series(data.index, 'D', values=data.to_numpy())
+    if name == 'feature_importances':
+        data = feature_importances_data(results['feature_importances'])
+        return {'labels': [str(label) for label in data.index], 'values': data.tolist()}
+    data = predictions_data(df, results['rf_pred'], results['gb_pred'])
+    return _regular_series(
+        data.index, 'h',
+        actual=data['is_violent_crime'].to_numpy(),
+        rf_pred=data['rf_pred'].to_numpy(),
+        gb_pred=data['gb_pred'].to_numpy(),
+    )
+
+
+def generate_charts(df, rf_pred=None, gb_pred=None, feature_importances=None):
+    results = {
+        'rf_pred': rf_pred,
+        'gb_pred': gb_pred,
+        'feature_importances': feature_importances,
+    }
+    charts = {}
+    for name in CHARTS:
+        png = render_chart(name, df, results)
+        if png is not None:
+            charts[name] = base64.b64encode(png).decode()
     return charts
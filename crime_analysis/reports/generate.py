@@ -0,0 +1,147 @@
+"""
+PDF reports of analysed datasets, cached on disk by processed-data version.
+
+A report covers one or more datasets: the model metrics, the walk-forward
+backtest when it matches the current data, and the dataset's charts taken
+from the chart cache (rendered only if they are not cached yet). The file
+is named after the versions of its datasets and the save times of their
+backtests, so reprocessing or backtesting any of them makes the next
+request build a new report and repeat downloads of an unchanged one are
+served straight from disk.
+"""
+import shutil
+from contextlib import nullcontext
+from pathlib import Path
+
+from django.conf import settings
+
+from crime_analysis.api.charts import cached_chart
+from crime_analysis.api.storage import DATASETS
+from crime_analysis.processing.evaluation import compute_metrics
+from crime_analysis.processing.visualizations import CHARTS
+from .pdf import write_pdf
+
+
+CHART_TITLES = {
+    "crime_timeseries": "Daily crime count",
+    "feature_importances": "Top feature importances",
+    "predictions_vs_actual": "Predicted vs actual violent crimes",
+}
+
+
+def model_metrics(results: dict):
+    """
+    Metrics table of both models from stored analysis results.
+    """
+    # Probabilities give meaningful ROC AUC; results stored before they
+    # were recorded only have labels
+    model_preds = {
+        "Random Forest": results.get("rf_proba", results["rf_pred"]),
+        "Gradient Boosting": results.get("gb_proba", results["gb_pred"]),
+    }
+    return compute_metrics(results["y_test"], model_preds)
+
+
+def dataset_versions(dataset_ids) -> list:
+    """
+    [(dataset_id, processed-data version, backtest save time)] of the
+    datasets in a report (see DatasetStore.backtest_modified).
+
+    :raises ValueError: a dataset is missing or has not been analysed
+    """
+    versions = []
+    for dataset_id in dataset_ids:
+        if dataset_id not in DATASETS:
+            raise ValueError(f"Dataset {dataset_id} not found")
+        version = DATASETS.version(dataset_id)
+        if not version:
+            raise ValueError(f"Dataset {dataset_id} has not been analysed")
+        versions.append((dataset_id, version, DATASETS.backtest_modified(dataset_id)))
+    return versions
+
+
+def report_path(versions) -> Path:
+    """
+    Cache file of a report on the given dataset_versions().
+    """
+    ids = "_".join(str(int(dataset_id)) for dataset_id, _, _ in versions)
+    return Path(settings.REPORT_ROOT) / f"datasets-{ids}" / (
+        "_".join(f"v{int(version)}-b{int(backtest)}" for _, version, backtest in versions) + ".pdf"
+    )
+
+
+def delete_reports(dataset_id: int):
+    """
+    Delete every cached report that covers ``dataset_id``.
+    """
+    root = Path(settings.REPORT_ROOT)
+    if not root.is_dir():
+        return
+    for path in root.glob("datasets-*"):
+        if str(int(dataset_id)) in path.name[len("datasets-"):].split("_"):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def cached_report(versions):
+    """
+    Path of the report on exactly these versions, or None if it has not
+    been built.
+    """
+    path = report_path(versions)
+    return path if path.exists() else None
+
+
+def _tables(dataset_id: int, version: int) -> list:
+    results = DATASETS.load_results(dataset_id)
+    if not results:
+        raise ValueError(f"Dataset {dataset_id} has no analysis results")
+    tables = [("Model metrics", model_metrics(results))]
+    backtest = DATASETS.load_backtest(dataset_id)
+    if backtest is not None and backtest["version"] == version:
+        tables.append(("Walk-forward backtest", backtest["folds"]))
+    return tables
+
+
+def _charts(dataset_id: int) -> list:
+    charts = []
+    for name in CHARTS:
+        png = cached_chart(dataset_id, name)
+        if png is not None:
+            charts.append((CHART_TITLES.get(name, name), png))
+    return charts
+
+
+def build_report(dataset_ids, stage=None) -> Path:
+    """
+    Build (or reuse) the report of ``dataset_ids`` and return its path.
+
+    :param stage: context manager factory taking a stage name ('load',
+                  'charts', 'render'), e.g. StageTracker.stage
+    :raises ValueError: a dataset is missing or has not been analysed
+    """
+    stage = stage or (lambda name: nullcontext({}))
+    versions = dataset_versions(dataset_ids)
+    path = cached_report(versions)
+    if path is not None:
+        return path
+
+    with stage("load"):
+        tables = [_tables(dataset_id, version) for dataset_id, version, _ in versions]
+
+    with stage("charts"):
+        charts = [_charts(dataset_id) for dataset_id, _, _ in versions]
+
+    sections = [
+        {"heading": f"Dataset {dataset_id} (version {version})", "tables": t, "charts": c}
+        for (dataset_id, version, _), t, c in zip(versions, tables, charts)
+    ]
+    with stage("render"):
+        path = report_path(versions)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        write_pdf(path, "Crime Analysis Report", sections)
+        # Reports on older versions or backtests of the same datasets are
+        # never served again
+        for old in path.parent.glob("*.pdf"):
+            if old != path:
+                old.unlink(missing_ok=True)
+    return path
@@ -1,39 +1,119 @@
 # reports/pdf.py
 
+import datetime
+import os
+import shutil
+import tempfile
 from io import BytesIO
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from django.http import HttpResponse
 
-def export_metrics_pdf(metrics_table, filename="metrics_report.pdf"):
+from django.http import FileResponse
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import landscape, letter
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.lib.utils import ImageReader
+from reportlab.platypus import Image, PageBreak, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+
+# Landscape: the charts are wide, and so is the per-fold backtest table
+PAGE_SIZE = landscape(letter)
+MARGIN = 0.5 * inch
+
+_TABLE_STYLE = TableStyle([
+    ("FONT", (0, 0), (-1, 0), "Helvetica-Bold", 8),
+    ("FONT", (0, 1), (-1, -1), "Helvetica", 8),
+    ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#dde4ee")),
+    ("ROWBACKGROUNDS", (0, 1), (-1, -1), [colors.white, colors.HexColor("#f4f6f9")]),
+    ("GRID", (0, 0), (-1, -1), 0.25, colors.HexColor("#b0b8c4")),
+    ("ALIGN", (1, 1), (-1, -1), "RIGHT"),
+    ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+])
+
+
+def _cell(value, float_format: str) -> str:
+    if isinstance(value, float):
+        return float_format.format(value)
+    if isinstance(value, datetime.datetime):
+        return f"{value:%Y-%m-%d %H:%M}"
+    return str(value)
+
+
+def table_flowable(df, float_format: str = "{:.4f}") -> Table:
+    """
+    A DataFrame as a platypus Table. The header row is repeated on every
+    page a long table spills onto.
     """
-    Generates a PDF from a Pandas DataFrame of metrics and returns it as HttpResponse.
+    rows = [[str(col) for col in df.columns]]
+    rows.extend(
+        [_cell(value, float_format) for value in row]
+        for row in df.itertuples(index=False, name=None)
+    )
+    table = Table(rows, repeatRows=1, hAlign="LEFT")
+    table.setStyle(_TABLE_STYLE)
+    return table
+
+
+def chart_flowable(png: bytes, max_width: float, max_height: float) -> Image:
+    """
+    PNG bytes as an Image scaled to fit ``max_width`` x ``max_height``,
+    keeping its aspect ratio. The PNG is embedded as is, without rendering
+    anything again.
     """
-    buffer = BytesIO()
-    p = canvas.Canvas(buffer, pagesize=letter)
-    width, height = letter
+    width, height = ImageReader(BytesIO(png)).getSize()
+    scale = min(1.0, max_width / width, max_height / height)
+    return Image(BytesIO(png), width=width * scale, height=height * scale)
 
-    p.setFont("Helvetica-Bold", 14)
-    p.drawString(50, height - 50, "Metrics Report")
 
-    # Draw table
-    y = height - 80
-    p.setFont("Helvetica", 12)
-    for idx, row in metrics_table.iterrows():
-        text = ", ".join([str(item) for item in row])
-        p.drawString(50, y, text)
-        y -= 20
+def write_pdf(path, title: str, sections: list):
+    """
+    Lay out a report and write it to ``path`` atomically.
 
-        if y < 50:
-            p.showPage()
-            y = height - 50
+    :param sections: list of dicts with ``heading`` and optional ``tables``
+                     ([(caption, DataFrame)]) and ``charts`` ([(caption,
+                     PNG bytes)]); each section starts on a new page
+    """
+    styles = getSampleStyleSheet()
+    path = os.fspath(path)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+    os.close(fd)
+    doc = SimpleDocTemplate(
+        tmp_path, pagesize=PAGE_SIZE, title=title,
+        leftMargin=MARGIN, rightMargin=MARGIN, topMargin=MARGIN, bottomMargin=MARGIN,
+    )
 
-    p.save()
-    pdf = buffer.getvalue()
-    buffer.close()
+    story = [Paragraph(title, styles["Title"])]
+    for i, section in enumerate(sections):
+        if i:
+            story.append(PageBreak())
+        story.append(Paragraph(section["heading"], styles["Heading1"]))
+        for caption, df in section.get("tables", ()):
+            if caption:
+                story.append(Paragraph(caption, styles["Heading3"]))
+            story += [table_flowable(df), Spacer(1, 12)]
+        for caption, png in section.get("charts", ()):
+            if caption:
+                story.append(Paragraph(caption, styles["Heading3"]))
+            story += [chart_flowable(png, doc.width, doc.height * 0.8), Spacer(1, 12)]
 
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    response.write(pdf)
-    return response
+    try:
+        doc.build(story)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
 
+
+def export_metrics_pdf(metrics_table, filename="metrics_report.pdf"):
+    """
+    A one-table PDF of a metrics DataFrame as a streamed download.
+    """
+    tmp = tempfile.mkdtemp(prefix="report-")
+    try:
+        path = os.path.join(tmp, "report.pdf")
+        write_pdf(path, "Metrics Report", [{"heading": "Metrics", "tables": [("", metrics_table)]}])
+        file = open(path, "rb")
+    finally:
+        # The open file outlives its directory entry until the response
+        # has been sent and closes it
+        shutil.rmtree(tmp)
+    return FileResponse(file, as_attachment=True, filename=filename, content_type="application/pdf")
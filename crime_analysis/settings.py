@@ -43,9 +43,11 @@ INSTALLED_APPS = [
     'crime_analysis.webapp.apps.WebappConfig',
     'crime_analysis.reports.apps.ReportsConfig',
     'crime_analysis.processing.apps.ProcessingConfig',
+    'crime_analysis.benchmarks.apps.BenchmarksConfig',
 ]
 
 MIDDLEWARE = [
+    'crime_analysis.api.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -126,3 +128,72 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Dataset storage
+# Uploaded files are streamed to Parquet under this directory.
+
+DATASET_ROOT = BASE_DIR / 'var' / 'datasets'
+
+UPLOAD_CHUNK_ROWS = 200_000
+
+# Per-process LRU of loaded datasets, evicted by size in bytes.
+DATASET_CACHE_BYTES = 512 * 1024 * 1024
+
+# Rows per chunk (CSV) / row group (Parquet) when exporting processed data
+EXPORT_BATCH_ROWS = 65_536
+
+
+# Background analysis jobs
+# Job state lives in a local SQLite file; jobs run on a process pool.
+
+JOB_DB_PATH = BASE_DIR / 'var' / 'jobs.sqlite3'
+
+ANALYSIS_WORKERS = 2
+
+
+# Model training
+# 'gradient_boosting' or 'hist' (HistGradientBoostingClassifier, much faster
+# on large datasets).
+
+TRAIN_GB_MODEL = 'gradient_boosting'
+
+# Permutation importance of the random forest, run on a sample of the test
+# set within a time budget. 0 seconds disables it.
+PERMUTATION_IMPORTANCE_SECONDS = 30
+PERMUTATION_IMPORTANCE_SAMPLES = 5000
+
+# Processes running walk-forward backtest folds; -1 uses all cores
+BACKTEST_WORKERS = -1
+
+# Fitted models are stored here and reused when nothing changed.
+MODEL_ROOT = BASE_DIR / 'var' / 'models'
+
+# cProfile dumps of jobs started with "profile": true, one directory per job
+PROFILE_ROOT = BASE_DIR / 'var' / 'profiles'
+
+# PDF reports, cached per dataset version. Reports on more datasets than
+# REPORT_SYNC_MAX_DATASETS are built by a background job.
+REPORT_ROOT = BASE_DIR / 'var' / 'reports'
+REPORT_SYNC_MAX_DATASETS = 1
+REPORT_MAX_DATASETS = 20
+
+# Synthetic benchmark inputs and results (manage.py run_benchmarks)
+BENCHMARK_ROOT = BASE_DIR / 'var' / 'benchmarks'
+
+
+# Caches
+# Rendered charts are shared by all worker processes through the file
+# cache; keys include the dataset's processed-data version.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'charts': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'var' / 'cache' / 'charts',
+        'TIMEOUT': 7 * 24 * 3600,
+        'OPTIONS': {'MAX_ENTRIES': 1000},
+    },
+}
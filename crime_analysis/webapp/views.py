@@ -7,22 +7,9 @@ from django.shortcuts import render
 from crime_analysis.api.serializers import UploadDatasetSerializer, StartAnalysisSerializer
 
 
-from crime_analysis.processing.feature_engineering import add_lag_features, add_cyclic_features
-
-from crime_analysis.processing.preprocessing import preprocess_raw
-
-from crime_analysis.processing.ml_models import train_models
-
-
 from crime_analysis.api.storage import DATASETS
 
 
-import pandas as pd
-
-
-from crime_analysis.database.load import save_to_db
-
-
 class DashboardAPIView(APIView):
     """
     Main dashboard: links to Upload, Analysis, Evaluation, Visualization